@@ -0,0 +1,7 @@
+# Benchmarks and load tests. Run them from the a2_group23 folder, e.g.
+#   python -m bench.booking_load --attempts 5000 --processes 4 --threads 8
+#   python -m bench.db_throughput --workers 4 --clients 16 --seconds 10
+#   python -m bench.seed --db sqlite:////tmp/bench.sqlite --events 100000 --bookings 1000000
+#   python -m bench.latency --db sqlite:////tmp/bench.sqlite --mode both --out results.json
+#   python -m bench.latency --db sqlite:////tmp/bench.sqlite --baseline results.json
+#   python -m bench.serving --workers 2 --threads 15 --clients 32
@@ -0,0 +1,134 @@
+# bench/booking_load.py
+# Load test for the booking service: lots of buyers hitting one event at the same time.
+# Each process is its own app (like a gunicorn worker) running several threads.
+# It fails if the event is ever oversold or the seat counter drifts from the bookings.
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from website import create_app, db
+from website.booking import NotEnoughSeats, book_seats
+from website.models import Booking, Event, User, Venue
+
+
+def _make_app(db_uri):
+    return create_app({"SQLALCHEMY_DATABASE_URI": db_uri, "TESTING": True})
+
+
+def _setup(db_uri, capacity):
+    app = _make_app(db_uri)
+    with app.app_context():
+        admin = db.session.scalar(db.select(User).where(User.role == "admin"))
+        venue = Venue(name="Load Test Hall", location="Nowhere", num_of_capacity=capacity)
+        db.session.add(venue)
+        db.session.flush()
+        event = Event(
+            title="Ticket Drop", description="Load test", category="Rock",
+            ticket_price=10, ticket_quantity=capacity,
+            owner_id=admin.id, venue_id=venue.id,
+        )
+        db.session.add(event)
+        db.session.commit()
+        return event.id, admin.id
+
+
+def _worker(db_uri, event_id, user_id, attempts, threads, seed):
+    """Runs in its own process. Returns (confirmed, sold_out, errors, tickets)."""
+    app = _make_app(db_uri)
+    rng = random.Random(seed)
+    quantities = [rng.randint(1, 4) for _ in range(attempts)]
+
+    def one(quantity):
+        with app.app_context():
+            try:
+                book_seats(event_id, user_id, quantity)
+                return "confirmed", quantity
+            except NotEnoughSeats:
+                return "sold_out", 0
+            except Exception as exc:  # counted and reported, the run carries on
+                print(f"error: {exc!r}", file=sys.stderr)
+                return "error", 0
+
+    counts = {"confirmed": 0, "sold_out": 0, "error": 0}
+    tickets = 0
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for outcome, quantity in pool.map(one, quantities):
+            counts[outcome] += 1
+            tickets += quantity
+    return counts["confirmed"], counts["sold_out"], counts["error"], tickets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent booking load test")
+    parser.add_argument("--attempts", type=int, default=2000, help="total booking attempts")
+    parser.add_argument("--capacity", type=int, default=1000, help="seats on the event")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="threads per process")
+    parser.add_argument("--db", help="database URL (default: a scratch SQLite file)")
+    args = parser.parse_args(argv)
+
+    scratch = None
+    db_uri = args.db
+    if not db_uri:
+        scratch = tempfile.mkdtemp(prefix="booking-load-")
+        db_uri = "sqlite:///" + os.path.join(scratch, "load.sqlite")
+
+    event_id, user_id = _setup(db_uri, args.capacity)
+
+    share, extra = divmod(args.attempts, args.processes)
+    jobs = [share + (1 if i < extra else 0) for i in range(args.processes)]
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        futures = [
+            pool.submit(_worker, db_uri, event_id, user_id, n, args.threads, seed)
+            for seed, n in enumerate(jobs)
+        ]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - started
+
+    confirmed = sum(r[0] for r in results)
+    sold_out = sum(r[1] for r in results)
+    errors = sum(r[2] for r in results)
+    tickets = sum(r[3] for r in results)
+
+    app = _make_app(db_uri)
+    with app.app_context():
+        event = db.session.get(Event, event_id)
+        booked = db.session.scalar(
+            db.select(db.func.coalesce(db.func.sum(Booking.no_of_tickets), 0))
+            .where(Booking.event_id == event_id)
+        )
+        rows = db.session.scalar(db.select(db.func.count(Booking.id)).where(Booking.event_id == event_id))
+
+        print(f"attempts      {args.attempts} ({args.processes} processes x {args.threads} threads)")
+        print(f"confirmed     {confirmed}  sold out {sold_out}  errors {errors}")
+        print(f"seats         capacity {event.ticket_quantity}  sold {event.seats_sold}  remaining {event.seats_remaining}")
+        print(f"elapsed       {elapsed:.2f}s  ({args.attempts / elapsed:.0f} attempts/s, {confirmed / elapsed:.0f} bookings/s)")
+
+        problems = []
+        if booked > event.ticket_quantity:
+            problems.append(f"oversold: {booked} tickets booked for {event.ticket_quantity} seats")
+        if booked != event.seats_sold or booked != tickets:
+            problems.append(f"counter drift: bookings={booked} counter={event.seats_sold} reported={tickets}")
+        if event.seats_sold + event.seats_remaining != event.ticket_quantity:
+            problems.append("seats_sold + seats_remaining does not add up to capacity")
+        if rows != confirmed:
+            problems.append(f"{rows} booking rows but {confirmed} confirmed")
+
+    for problem in problems:
+        print("FAIL", problem)
+    if not problems:
+        print("OK no oversell")
+    if scratch:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
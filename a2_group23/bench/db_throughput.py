@@ -0,0 +1,155 @@
+# bench/db_throughput.py
+# Read / write throughput of the real site under gunicorn, with the old SQLite settings
+# (rollback journal, no busy timeout) against the tuned ones from config.py (WAL etc.).
+#
+#   python -m bench.db_throughput --workers 4 --clients 16 --seconds 10
+#
+# Each run gets a fresh database and its own gunicorn. Clients log in and mix event page
+# reads with comment posts (writes). The page cache is switched off so every read hits the DB.
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+from website import create_app, db
+from website.models import Event, User, Venue
+from flask_bcrypt import generate_password_hash
+
+from .server import free_port, start_gunicorn
+
+# "before" is SQLite as the app used to run it: default rollback journal, FULL sync, no wait.
+PROFILES = {
+    "before": {"journal_mode": "DELETE", "synchronous": "FULL", "busy_timeout": 0},
+    "after": None,  # the defaults in config.py
+}
+
+
+def _settings(db_uri, pragmas):
+    settings = {
+        "SQLALCHEMY_DATABASE_URI": db_uri,
+        "WTF_CSRF_ENABLED": False,
+        "CACHE_BACKEND": "none",
+        "HOLD_SWEEPER_INTERVAL": 0,
+        "LOGIN_LIMIT_BACKEND": "none",  # every client logs in from 127.0.0.1
+    }
+    if pragmas is not None:
+        settings["SQLITE_PRAGMAS"] = pragmas
+    return settings
+
+
+def _seed(settings, users):
+    app = create_app(settings)
+    with app.app_context():
+        venue = Venue(name="Bench Hall", location="Nowhere", num_of_capacity=100000)
+        db.session.add(venue)
+        password = generate_password_hash("bench")
+        db.session.add_all(
+            User(name=f"bench{i}", email=f"bench{i}@example.com", password_hash=password)
+            for i in range(users)
+        )
+        db.session.flush()
+        owner = db.session.scalar(db.select(User).where(User.role == "admin"))
+        events = [
+            Event(title=f"Bench event {i}", description="Benchmark", category="Rock",
+                  ticket_price=10, ticket_quantity=100000, owner_id=owner.id, venue_id=venue.id)
+            for i in range(20)
+        ]
+        db.session.add_all(events)
+        db.session.commit()
+        return [e.id for e in events]
+
+
+def _client(base, user, event_ids, write_ratio, ready, stop, results, rng):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    login = urllib.parse.urlencode({"user_name": user, "password": "bench"}).encode()
+    opener.open(base + "/login", login, timeout=60)
+    ready.wait()  # the clock only starts once everyone is logged in
+
+    reads = writes = errors = 0
+    while not stop.is_set():
+        event_id = rng.choice(event_ids)
+        try:
+            if rng.random() < write_ratio:
+                body = urllib.parse.urlencode({"comment": "benchmark comment"}).encode()
+                opener.open(f"{base}/events/{event_id}/comments", body, timeout=30).read()
+                writes += 1
+            else:
+                opener.open(f"{base}/events/{event_id}", timeout=30).read()
+                reads += 1
+        except OSError:  # HTTP errors, refused connections and timeouts
+            errors += 1
+    results.append((reads, writes, errors))
+
+
+def run_profile(name, args):
+    scratch = tempfile.mkdtemp(prefix=f"db-bench-{name}-")
+    try:
+        settings = _settings("sqlite:///" + os.path.join(scratch, "bench.sqlite"), PROFILES[name])
+        event_ids = _seed(settings, args.clients)
+        port = free_port()
+        proc = start_gunicorn(settings, args.workers, port)
+        try:
+            ready = threading.Barrier(args.clients + 1)
+            stop = threading.Event()
+            results = []
+            threads = [
+                threading.Thread(target=_client, args=(
+                    f"http://127.0.0.1:{port}", f"bench{i}", event_ids, args.write_ratio,
+                    ready, stop, results, random.Random(i),
+                ))
+                for i in range(args.clients)
+            ]
+            for t in threads:
+                t.start()
+            ready.wait()
+            time.sleep(args.seconds)
+            stop.set()
+            for t in threads:
+                t.join()
+        finally:
+            proc.terminate()
+            proc.wait()
+
+        reads = sum(r[0] for r in results)
+        writes = sum(r[1] for r in results)
+        errors = sum(r[2] for r in results)
+        return {
+            "profile": name,
+            "reads_per_sec": round(reads / args.seconds, 1),
+            "writes_per_sec": round(writes / args.seconds, 1),
+            "errors": errors,
+        }
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQLite read/write throughput under gunicorn")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent HTTP clients")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="share of requests that write")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    rows = [run_profile(name, args) for name in PROFILES]
+
+    print(f"{'profile':<10}{'reads/s':>10}{'writes/s':>10}{'errors':>8}")
+    for row in rows:
+        print(f"{row['profile']:<10}{row['reads_per_sec']:>10}{row['writes_per_sec']:>10}{row['errors']:>8}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"workers": args.workers, "clients": args.clients, "results": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+# bench/latency.py
+# Latency and throughput of the main pages, for comparing one commit with another.
+#
+#   python -m bench.seed --db sqlite:////tmp/bench.sqlite            # once, takes a minute
+#   python -m bench.latency --db sqlite:////tmp/bench.sqlite --out before.json
+#   ... change things ...
+#   python -m bench.latency --db sqlite:////tmp/bench.sqlite --baseline before.json
+#
+# Every scenario is run --requests times, through the Flask test client (the app on its own,
+# no network) and/or a local gunicorn (--mode gunicorn or both) with --concurrency clients.
+# We report p50/p95/p99, the mean and requests per second. With --baseline the run fails
+# (exit code 1) if any scenario's p95 got more than --max-regression slower, so it can gate a
+# change. Without --db a fresh dataset is seeded into a temporary database first.
+#
+# The page cache is off unless --cache says otherwise, so we measure the queries, not the cache.
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.cookiejar import CookieJar
+
+from website import create_app, db
+from website.forms import CATEGORIES
+from website.models import Event, User, local_now
+
+from . import seed as seeder
+from .server import APP_DIR, bench_settings, free_port, start_gunicorn
+
+SEARCH_WORDS = [word.lower() for word in seeder.WORDS]
+
+
+# -- what to request --
+# Each scenario picks a request for a random user: (method, path, form data or None)
+
+def _home(rng, data):
+    return "GET", "/", None
+
+
+def _search(rng, data):
+    return "GET", "/search?" + urllib.parse.urlencode({"search": rng.choice(SEARCH_WORDS)}), None
+
+
+def _filter(rng, data):
+    return "GET", f"/filter-event/{rng.choice(CATEGORIES)}", None
+
+
+def _event_detail(rng, data):
+    return "GET", f"/events/{rng.choice(data['events'])}", None
+
+
+def _booking(rng, data):
+    # Holds one seat and stops at the redirect to checkout. Holds that are never confirmed
+    # just expire, so a run doesn't sell anything out.
+    return "POST", f"/events/{rng.choice(data['upcoming'])}/book", {"no_of_tickets": "1"}
+
+
+def _my_bookings(rng, data):
+    return "GET", "/my-bookings", None
+
+
+SCENARIOS = {
+    "home": _home,
+    "search": _search,
+    "filter": _filter,
+    "event_detail": _event_detail,
+    "booking": _booking,
+    "my_bookings": _my_bookings,
+}
+
+
+def _dataset(app, sample=1000):
+    """Ids to pick from, plus the row counts that go in the results."""
+    with app.app_context():
+        users = db.session.scalars(
+            db.select(User.name).where(User.name.like("bench%")).order_by(User.id).limit(sample)
+        ).all()
+        events = db.session.scalars(
+            db.select(Event.id).order_by(db.func.random()).limit(sample)
+        ).all()
+        upcoming = db.session.scalars(
+            db.select(Event.id)
+            .where(Event.date_time > local_now(), Event.seats_remaining > 0)
+            .order_by(db.func.random()).limit(sample)
+        ).all()
+        counts = {
+            table.name: db.session.scalar(db.select(db.func.count()).select_from(table))
+            for table in db.metadata.sorted_tables if table.name in ("user", "venue", "event", "booking", "comment")
+        }
+    if not users or not upcoming:
+        raise SystemExit("The database has no bench users or upcoming events - seed it with bench.seed first.")
+    return {"users": users, "events": events, "upcoming": upcoming, "counts": counts}
+
+
+# -- how to send it --
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # report the 302 itself, like the test client does
+
+
+class TestClientSession:
+    """One logged-in user talking to the app in this process."""
+
+    def __init__(self, app, user):
+        self.client = app.test_client()
+        self.client.post("/login", data={"user_name": user, "password": seeder.PASSWORD})
+
+    def request(self, method, path, data):
+        response = self.client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code
+
+
+class HttpSession:
+    """One logged-in user talking to gunicorn over HTTP."""
+
+    def __init__(self, base, user):
+        self.base = base
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect)
+        body = urllib.parse.urlencode({"user_name": user, "password": seeder.PASSWORD}).encode()
+        self.request("POST", "/login", body)
+
+    def request(self, method, path, data):
+        if isinstance(data, dict):
+            data = urllib.parse.urlencode(data).encode()
+        try:
+            with self.opener.open(self.base + path, data if method == "POST" else None, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:  # 3xx/4xx/5xx - the status is what we want
+            exc.read()
+            return exc.code
+
+
+# -- measuring --
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def summarise(latencies, errors, seconds):
+    ordered = sorted(latencies)
+    ms = lambda s: round(s * 1000, 2)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "p50_ms": ms(_percentile(ordered, 50)),
+        "p95_ms": ms(_percentile(ordered, 95)),
+        "p99_ms": ms(_percentile(ordered, 99)),
+        "mean_ms": ms(sum(ordered) / len(ordered)),
+        "requests_per_sec": round(len(ordered) / seconds, 1),
+    }
+
+
+def run_scenario(sessions, scenario, data, requests, warmup, seed):
+    """Runs `requests` requests split over the sessions, one thread per session."""
+    pick = SCENARIOS[scenario]
+    per_session = [requests // len(sessions) + (i < requests % len(sessions)) for i in range(len(sessions))]
+    latencies, errors = [], []
+    ready = threading.Barrier(len(sessions) + 1)
+
+    def client(session, count, rng):
+        for _ in range(warmup):
+            session.request(*pick(rng, data))
+        mine, failed = [], 0
+        ready.wait()  # everyone starts together, after warming up
+        for _ in range(count):
+            request = pick(rng, data)
+            started = time.perf_counter()
+            try:
+                status = session.request(*request)
+            except OSError:
+                status = 0
+            mine.append(time.perf_counter() - started)
+            failed += status == 0 or status >= 400
+        latencies.extend(mine)
+        errors.append(failed)
+
+    threads = [
+        threading.Thread(target=client, args=(session, count, random.Random(f"{seed}-{scenario}-{i}")))
+        for i, (session, count) in enumerate(zip(sessions, per_session))
+    ]
+    for t in threads:
+        t.start()
+    ready.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    return summarise(latencies, sum(errors), time.perf_counter() - started)
+
+
+def run_mode(mode, settings, data, args):
+    users = data["users"]
+    proc = None
+    if mode == "client":
+        app = create_app(settings)
+        sessions = [TestClientSession(app, users[i % len(users)]) for i in range(args.concurrency)]
+    else:
+        port = free_port()
+        proc = start_gunicorn(settings, args.workers, port)
+        base = f"http://127.0.0.1:{port}"
+        sessions = [HttpSession(base, users[i % len(users)]) for i in range(args.concurrency)]
+    try:
+        results = {}
+        for scenario in args.scenarios:
+            results[scenario] = run_scenario(sessions, scenario, data, args.requests, args.warmup, args.seed)
+            print(_row(mode, scenario, results[scenario]), flush=True)
+        return results
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+
+# -- reporting --
+
+def _row(mode, scenario, r):
+    return (f"{mode:<9}{scenario:<14}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+            f"{r['mean_ms']:>9.1f}{r['requests_per_sec']:>10.1f}{r['errors']:>8}")
+
+
+def _commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=APP_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):  # not a git checkout
+        return None, None
+
+
+def compare(results, baseline, max_regression):
+    """Prints p95 against the baseline. Returns the scenarios that got too slow."""
+    regressions = []
+    print(f"\n{'':<23}{'p95 before':>12}{'p95 now':>10}{'change':>9}")
+    for mode, scenarios in results.items():
+        for scenario, now in scenarios.items():
+            before = baseline.get("results", {}).get(mode, {}).get(scenario)
+            if before is None:
+                continue
+            change = now["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+            slower = change > max_regression
+            print(f"{mode:<9}{scenario:<14}{before['p95_ms']:>12.1f}{now['p95_ms']:>10.1f}{change:>+9.0%}"
+                  + ("  REGRESSION" if slower else ""))
+            if slower:
+                regressions.append(f"{mode}/{scenario}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Page latency benchmark")
+    parser.add_argument("--db", help="an already seeded database URL (default: seed a temporary one)")
+    parser.add_argument("--mode", choices=["client", "gunicorn", "both"], default="client")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per client first")
+    parser.add_argument("--concurrency", type=int, default=1, help="clients sending at the same time")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--cache", default="none", help="CACHE_BACKEND to run with")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="fail if a p95 is more than this much slower than the baseline (0.10 = 10%%)")
+    # Only used when seeding a temporary database
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--venues", type=int, default=50)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--bookings", type=int, default=1000000)
+    parser.add_argument("--comments", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    scratch = None
+    db_uri = args.db
+    if db_uri is None:
+        scratch = tempfile.mkdtemp(prefix="latency-bench-")
+        db_uri = "sqlite:///" + os.path.join(scratch, "bench.sqlite")
+    settings = bench_settings(db_uri, CACHE_BACKEND=args.cache)
+    try:
+        if scratch:
+            print("Seeding a temporary database...", flush=True)
+            with create_app(seeder.seed_settings(db_uri)).app_context():
+                seeder.seed(args.users, args.venues, args.events, args.bookings, args.comments, args.seed)
+        data = _dataset(create_app(settings))
+
+        print(f"\n{'mode':<9}{'scenario':<14}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'mean ms':>9}"
+              f"{'req/s':>10}{'errors':>8}")
+        modes = ["client", "gunicorn"] if args.mode == "both" else [args.mode]
+        results = {mode: run_mode(mode, settings, data, args) for mode in modes}
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    commit, dirty = _commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "started": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": sys.version.split()[0],
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "dataset": data["counts"],
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"\np95 regressed by more than {args.max_regression:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# bench/seed.py
+# Fills a database with a big, realistic-looking dataset for the benchmarks:
+#
+#   python -m bench.seed --db sqlite:////tmp/bench.sqlite --events 100000 --bookings 1000000
+#
+# Rows go in with plain multi-row INSERTs in large batches (no ORM objects), so a million
+# bookings take seconds rather than hours. The same --seed gives the same data every time,
+# which keeps benchmark runs comparable. Meant for an empty database.
+import argparse
+import random
+import sys
+import time
+from datetime import timedelta
+
+from flask_bcrypt import generate_password_hash
+
+from website import create_app, db
+from website.counts import recount
+from website.forms import CATEGORIES
+from website.models import Booking, Comment, Event, User, Venue, local_now
+
+BATCH = 10000
+PASSWORD = "bench"  # every seeded user logs in as bench<n> / bench
+
+WORDS = [
+    "Midnight", "Summer", "Live", "Jazz", "Session", "Festival", "Night", "Acoustic", "Sunset",
+    "Rooftop", "Underground", "Orchestra", "Beats", "Soul", "Groove", "Tour", "Showcase", "Club",
+]
+PLACES = ["Brisbane", "Sydney", "Melbourne", "Gold Coast", "Perth", "Adelaide", "Hobart"]
+
+
+def _insert(table, rows):
+    """Inserts rows from a generator BATCH at a time. Returns how many went in."""
+    done = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH:
+            db.session.execute(db.insert(table), batch)
+            done += len(batch)
+            batch.clear()
+    if batch:
+        db.session.execute(db.insert(table), batch)
+        done += len(batch)
+    db.session.commit()
+    return done
+
+
+def _next_id(model):
+    return (db.session.scalar(db.select(db.func.max(model.id))) or 0) + 1
+
+
+def seed(users=1000, venues=50, events=100000, bookings=1000000, comments=100000, seed=1, report=print):
+    """Seeds the database of the current app. Returns the numbers of rows added."""
+    rng = random.Random(seed)
+    # Event times are local, like the ones organisers type in (see models.local_now)
+    now = local_now().replace(second=0, microsecond=0)
+    counts = {}
+
+    def step(name, model, rows):
+        started = time.perf_counter()
+        counts[name] = _insert(model.__table__, rows)
+        elapsed = time.perf_counter() - started
+        report(f"{name:<10}{counts[name]:>10} rows  {elapsed:6.1f}s  ({counts[name] / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    # bcrypt is slow on purpose, so everyone shares one hash
+    password = generate_password_hash(PASSWORD).decode()
+    first_user = _next_id(User)
+    step("users", User, (
+        {"name": f"bench{i}", "email": f"bench{i}@example.com", "password_hash": password,
+         "phone": "0400000000", "role": "user"}
+        for i in range(users)
+    ))
+    user_ids = range(first_user, first_user + users)
+
+    first_venue = _next_id(Venue)
+    capacities = [rng.choice([200, 500, 1000, 5000, 20000]) for _ in range(venues)]
+    step("venues", Venue, (
+        {"name": f"Bench Venue {i}", "location": rng.choice(PLACES), "num_of_capacity": capacities[i]}
+        for i in range(venues)
+    ))
+
+    # Events from a year ago to a year ahead, so there is history as well as upcoming shows
+    first_event = _next_id(Event)
+    event_venues = [rng.randrange(venues) for _ in range(events)]
+    quantities = [min(capacities[v], rng.choice([100, 250, 500, 1000])) for v in event_venues]
+    prices = [rng.choice([15, 25, 40, 60, 90, 150]) for _ in range(events)]
+    step("events", Event, (
+        {
+            "title": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}",
+            "description": " ".join(rng.choice(WORDS).lower() for _ in range(30)),
+            "date_time": now + timedelta(minutes=rng.randint(-525600, 525600)),
+            "status": "Open",
+            "duration_minutes": rng.choice([60, 90, 120, 180]),
+            "ticket_price": prices[i],
+            "ticket_quantity": quantities[i],
+            "seats_sold": 0,
+            "seats_remaining": quantities[i],
+            "owner_id": rng.choice(user_ids),
+            "category": rng.choice(CATEGORIES),
+            "venue_id": first_venue + event_venues[i],
+        }
+        for i in range(events)
+    ))
+
+    # Bookings never take more seats than an event has, so the counters stay believable
+    sold = [0] * events
+
+    def booking_rows():
+        for _ in range(bookings):
+            e = rng.randrange(events)
+            tickets = rng.randint(1, 4)
+            confirmed = rng.random() < 0.9 and sold[e] + tickets <= quantities[e]
+            if confirmed:
+                sold[e] += tickets
+            yield {
+                "booking_date": now - timedelta(minutes=rng.randint(0, 525600)),
+                "no_of_tickets": tickets,
+                "total_price": tickets * prices[e],
+                "booking_status": "Confirmed" if confirmed else "Expired",
+                "user_id": rng.choice(user_ids),
+                "event_id": first_event + e,
+            }
+    step("bookings", Booking, booking_rows())
+
+    db.session.execute(
+        db.update(Event.__table__).where(Event.__table__.c.id == db.bindparam("event_id")).values(
+            seats_sold=db.bindparam("sold"),
+            seats_remaining=db.bindparam("remaining"),
+            status=db.bindparam("status"),
+        ),
+        [
+            {"event_id": first_event + e, "sold": sold[e], "remaining": quantities[e] - sold[e],
+             "status": "Sold Out" if sold[e] == quantities[e] else "Open"}
+            for e in range(events) if sold[e]
+        ],
+    )
+    db.session.commit()
+
+    step("comments", Comment, (
+        {
+            "comment": " ".join(rng.choice(WORDS).lower() for _ in range(12)),
+            "posted_date": now - timedelta(minutes=rng.randint(0, 525600)),
+            "user_id": rng.choice(user_ids),
+            "event_id": first_event + rng.randrange(events),
+        }
+        for _ in range(comments)
+    ))
+    db.session.execute(
+        db.update(Event).where(Event.id >= first_event).values(comment_count=(
+            db.select(db.func.count()).where(Comment.event_id == Event.id).scalar_subquery()
+        )).execution_options(synchronize_session=False)
+    )
+
+    # The events went in without the ORM, so the genre / venue counts are built from them
+    recount(db.session.connection())
+    db.session.commit()
+    return counts
+
+
+def seed_settings(db_uri):
+    # Without the request metrics, or every batch would land in the slow query log
+    return {"SQLALCHEMY_DATABASE_URI": db_uri, "TESTING": True, "INSTRUMENTATION": False}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load a benchmark dataset")
+    parser.add_argument("--db", required=True, help="database URL, e.g. sqlite:////tmp/bench.sqlite")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--venues", type=int, default=50)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--bookings", type=int, default=1000000)
+    parser.add_argument("--comments", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    app = create_app(seed_settings(args.db))
+    with app.app_context():
+        seed(args.users, args.venues, args.events, args.bookings, args.comments, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# bench/server.py
+# Runs the site under a real gunicorn or uvicorn for the benchmarks that go over HTTP.
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def bench_settings(db_uri, **overrides):
+    """Settings for a site under benchmark: no CSRF tokens to fetch, no page cache (so we
+    measure the queries), no background sweeper and no login rate limit (every client logs in
+    from 127.0.0.1)."""
+    settings = {
+        "SQLALCHEMY_DATABASE_URI": db_uri,
+        "WTF_CSRF_ENABLED": False,
+        "CACHE_BACKEND": "none",
+        "HOLD_SWEEPER_INTERVAL": 0,
+        "LOGIN_LIMIT_BACKEND": "none",
+        "SLOW_QUERY_MS": 10000,  # the slow query log would drown out the results
+    }
+    settings.update(overrides)
+    return settings
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start(command, settings, port):
+    """Starts a server with `settings` passed in as FIREVENTS_ environment variables (see
+    config.py) and waits until it answers. Stop it with proc.terminate()."""
+    env = dict(os.environ)
+    env.update({f"FIREVENTS_{k}": json.dumps(v) for k, v in settings.items()})
+    proc = subprocess.Popen(command, cwd=APP_DIR, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=1)
+            return proc
+        except OSError:  # not listening yet, or still starting up
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{command[2]} did not start")
+
+
+def start_gunicorn(settings, workers, port, threads=1):
+    return _start(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(threads),
+         "-b", f"127.0.0.1:{port}", "--log-level", "warning", "website:create_app()"],
+        settings, port,
+    )
+
+
+def start_uvicorn(settings, workers, port, threads):
+    """The ASGI entry point (website/asgi.py) with `threads` request threads per process."""
+    return _start(
+        [sys.executable, "-m", "uvicorn", "--factory", "website.asgi:create_asgi_app",
+         "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        dict(settings, ASGI_THREADS=threads), port,
+    )
+
+
+def rss_mb(pid):
+    """Resident memory of a process and everything it started, in MB (Linux only)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except OSError:  # it exited while we were looking
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    total_kb = 0
+    todo = [pid]
+    while todo:
+        current = todo.pop()
+        todo += children.get(current, [])
+        try:
+            with open(f"/proc/{current}/status") as f:
+                total_kb += next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0)
+        except OSError:
+            pass
+    return round(total_kb / 1024, 1)
@@ -0,0 +1,142 @@
+# bench/serving.py
+# How many requests the site gets through with the same number of processes (so about the same
+# memory) when some requests are slow: gunicorn's sync workers, gunicorn with threads, and the
+# ASGI entry point under uvicorn (website/asgi.py).
+#
+#   python -m bench.serving --workers 2 --threads 15 --clients 32 --seconds 10
+#
+# Clients read event pages, and every so often one logs in again, which costs a bcrypt hash
+# (about 0.25s). With sync workers those logins hold up the page reads queued behind them.
+# We report page reads per second and their latency, logins per second, errors and the memory
+# of the whole server (all its processes).
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from website import create_app
+
+from . import seed as seeder
+from .latency import HttpSession, _dataset, summarise
+from .server import bench_settings, free_port, rss_mb, start_gunicorn, start_uvicorn
+
+SERVERS = ["sync", "gthread", "asgi"]
+
+
+def _start(server, settings, args, port):
+    if server == "sync":
+        return start_gunicorn(settings, args.workers, port)
+    if server == "gthread":
+        return start_gunicorn(settings, args.workers, port, threads=args.threads)
+    return start_uvicorn(settings, args.workers, port, args.threads)
+
+
+def _client(base, user, data, args, ready, stop, results, rng):
+    session = HttpSession(base, user)
+    ready.wait()  # the clock only starts once everyone is logged in
+    reads, logins, errors = [], 0, 0
+    while not stop.is_set():
+        if rng.random() < args.login_ratio:
+            status = session.request("POST", "/login", {"user_name": user, "password": seeder.PASSWORD})
+            logins += 1
+        else:
+            started = time.perf_counter()
+            try:
+                status = session.request("GET", f"/events/{rng.choice(data['events'])}", None)
+            except OSError:
+                status = 0
+            reads.append(time.perf_counter() - started)
+        errors += status == 0 or status >= 400
+    results.append((reads, logins, errors))
+
+
+def run_server(server, settings, data, args):
+    port = free_port()
+    proc = _start(server, settings, args, port)
+    try:
+        ready = threading.Barrier(args.clients + 1)
+        stop = threading.Event()
+        results = []
+        threads = [
+            threading.Thread(target=_client, args=(
+                f"http://127.0.0.1:{port}", data["users"][i % len(data["users"])], data, args,
+                ready, stop, results, random.Random(i),
+            ))
+            for i in range(args.clients)
+        ]
+        for t in threads:
+            t.start()
+        ready.wait()
+        memory = 0.0
+        deadline = time.perf_counter() + args.seconds
+        while time.perf_counter() < deadline:
+            memory = max(memory, rss_mb(proc.pid))
+            time.sleep(0.5)
+        stop.set()
+        for t in threads:
+            t.join()
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    reads = [latency for r in results for latency in r[0]]
+    summary = summarise(reads, sum(r[2] for r in results), args.seconds)
+    return {
+        "server": server,
+        "reads_per_sec": summary["requests_per_sec"],
+        "read_p50_ms": summary["p50_ms"],
+        "read_p95_ms": summary["p95_ms"],
+        "logins_per_sec": round(sum(r[1] for r in results) / args.seconds, 1),
+        "errors": summary["errors"],
+        "memory_mb": memory,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="sync gunicorn vs threads vs ASGI, with slow requests")
+    parser.add_argument("--db", help="an already seeded database URL (default: seed a small temporary one)")
+    parser.add_argument("--servers", nargs="+", choices=SERVERS, default=SERVERS)
+    parser.add_argument("--workers", type=int, default=2, help="processes, the same for every server")
+    parser.add_argument("--threads", type=int, default=15, help="request threads per process (gthread, asgi)")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--login-ratio", type=float, default=0.05, help="share of requests that are logins")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    scratch = None
+    db_uri = args.db
+    if db_uri is None:
+        scratch = tempfile.mkdtemp(prefix="serving-bench-")
+        db_uri = "sqlite:///" + os.path.join(scratch, "bench.sqlite")
+    try:
+        if scratch:
+            with create_app(seeder.seed_settings(db_uri)).app_context():
+                seeder.seed(users=100, venues=10, events=5000, bookings=20000, comments=5000, report=lambda line: None)
+        settings = bench_settings(db_uri)
+        data = _dataset(create_app(settings))
+
+        print(f"{'server':<10}{'reads/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'logins/s':>10}{'errors':>8}{'memory MB':>11}")
+        results = []
+        for server in args.servers:
+            r = run_server(server, settings, data, args)
+            results.append(r)
+            print(f"{server:<10}{r['reads_per_sec']:>9.1f}{r['read_p50_ms']:>9.1f}{r['read_p95_ms']:>9.1f}"
+                  f"{r['logins_per_sec']:>10.1f}{r['errors']:>8}{r['memory_mb']:>11.1f}", flush=True)
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
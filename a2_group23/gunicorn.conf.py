@@ -0,0 +1,35 @@
+# gunicorn.conf.py
+# Production settings for gunicorn, which reads this file from the folder it is started in:
+#
+#   gunicorn "website:create_app()"
+#
+# Each worker is a whole copy of the app (roughly 80MB here), so memory decides how many you
+# can have. With GUNICORN_THREADS=1 every worker handles one request at a time, and a slow
+# request (bcrypt at login, an image upload, a wait for the SQLite write lock) holds up the
+# requests queued behind it. Giving the workers threads, or running the ASGI entry point under
+# uvicorn instead, keeps pages moving at the same memory:
+#
+#   uvicorn --factory website.asgi:create_asgi_app --host 0.0.0.0 --port 8000 --workers 2
+#
+# (ASGI_THREADS sets the request threads per uvicorn process, see config.py.) Compare them on
+# your machine with:  python -m bench.serving --workers 2 --threads 15
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+# Two workers per core is a good start. Fewer if memory is tight - add threads instead.
+# With more than one, set FIREVENTS_CACHE_BACKEND='"redis"' or the workers' page caches
+# drift apart for up to CACHE_TTL (see cache.py).
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2))
+
+# More than 1 switches gunicorn to its threaded (gthread) worker. Keep it at or under the
+# database connection pool (SQLite: 5 + 10 overflow, see config.py for other databases).
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# A request that takes longer than this gets its worker restarted
+timeout = 30
+graceful_timeout = 30
+
+# Keep connections from a reverse proxy open between requests
+keepalive = 5
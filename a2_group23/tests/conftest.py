@@ -0,0 +1,81 @@
+# tests/conftest.py
+# Run from the a2_group23 folder:  python -m pytest tests
+#
+# One scratch SQLite database per test run, brought up to date by create_app() and filled with
+# a small version of the benchmark dataset (bench/seed.py) - enough rows per page that a query
+# per row would show up in the query budgets.
+import pytest
+
+from bench.seed import seed
+from website import create_app, db
+from website.assets import assets
+from website.cache import page_cache
+from website.identity import identity_cache
+from website.jobs import job_runner
+from website.metrics import metrics
+from website.passwords import password_hasher
+from website.ratelimit import login_limiter
+
+SEED = {"users": 10, "venues": 5, "events": 200, "bookings": 1500, "comments": 400}
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    path = tmp_path_factory.mktemp("db") / "test.sqlite"
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}",
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "INSTRUMENTATION": False,
+        # Every request goes to the database, so the tests count what a cache miss costs
+        "CACHE_BACKEND": "none",
+        "IDENTITY_CACHE_TTL": 0,
+        "LOGIN_LIMIT_BACKEND": "none",
+        "JOB_WORKERS": 0,
+        "HOLD_SWEEPER_INTERVAL": 0,
+    })
+    with app.app_context():
+        seed(**SEED, report=lambda line: None)
+    return app
+
+
+# The extensions are one object per process that init_app() sets up (a process only ever has
+# one app), so another app would leave its settings - a login limit, a cache - behind in them
+EXTENSIONS = [assets, identity_cache, job_runner, login_limiter, metrics, page_cache, password_hasher]
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Builds an app of its own on an empty scratch database, for tests that need settings the
+    shared one doesn't have, e.g. make_app(TRUSTED_PROXIES=1). The shared app's extension
+    settings are put back afterwards."""
+    saved = [(ext, dict(vars(ext))) for ext in EXTENSIONS]
+
+    def make_app(**overrides):
+        return create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'own.sqlite'}",
+            "TESTING": True,
+            "WTF_CSRF_ENABLED": False,
+            "HOLD_SWEEPER_INTERVAL": 0,
+            "JOB_WORKERS": 0,
+            **overrides,
+        })
+    yield make_app
+
+    for ext, state in saved:
+        vars(ext).clear()
+        vars(ext).update(state)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Logs the test client in, e.g. login("bench1", "bench")."""
+    def login(name, password):
+        r = client.post("/login", data={"user_name": name, "password": password})
+        assert r.status_code == 302, r.data[:500]
+    return login
@@ -0,0 +1,180 @@
+# tests/test_booking.py
+# The seat counters and seat holds (booking.py): an event never sells more seats than it has,
+# and a held seat goes back exactly once.
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from website import db
+from website.booking import (
+    _HOLD_COLUMNS, HoldExpired, NotEnoughSeats, _release, book_seats, cancel_hold, confirm_hold,
+    hold_seats, release_expired_holds, run_locked,
+)
+from website.models import Booking, Event, User, Venue
+
+
+@pytest.fixture
+def event_id(app):
+    """A new event with 10 seats."""
+    with app.app_context():
+        venue = Venue(name="Booking Hall", location="Hobart", num_of_capacity=10)
+        db.session.add(venue)
+        db.session.flush()
+        event = Event(title="Ten Seats", description="d", date_time=datetime(2041, 1, 1, 20),
+                      duration_minutes=60, ticket_price=20, ticket_quantity=10, owner_id=1,
+                      category="Rock", venue_id=venue.id)
+        db.session.add(event)
+        db.session.commit()
+        return event.id
+
+
+@pytest.fixture
+def buyer(app):
+    with app.app_context():
+        return db.session.scalar(db.select(User.id).where(User.name == "bench3"))
+
+
+def seats(app, event_id):
+    with app.app_context():
+        event = db.session.get(Event, event_id)
+        return event.seats_remaining, event.seats_sold, event.status
+
+
+def test_booking_takes_seats(app, event_id, buyer):
+    with app.app_context():
+        booking = book_seats(event_id, buyer, 4)
+        assert (booking.no_of_tickets, booking.total_price, booking.booking_status) == (4, 80, "Confirmed")
+    assert seats(app, event_id) == (6, 4, "Open")
+
+
+def test_booking_past_capacity(app, event_id, buyer):
+    with app.app_context():
+        book_seats(event_id, buyer, 7)
+        with pytest.raises(NotEnoughSeats):
+            book_seats(event_id, buyer, 4)
+        book_seats(event_id, buyer, 3)
+        with pytest.raises(NotEnoughSeats):
+            book_seats(event_id, buyer, 1)
+        assert db.session.scalar(db.select(db.func.count()).where(Booking.event_id == event_id)) == 2
+    assert seats(app, event_id) == (0, 10, "Sold Out")
+
+
+def test_buyers_at_once_never_oversell(app, event_id, buyer):
+    # 8 buyers want 2 seats each, only 5 of them can have them
+    results = []
+    ready = threading.Barrier(8)
+
+    def buy():
+        with app.app_context():
+            ready.wait()
+            try:
+                book_seats(event_id, buyer, 2)
+                results.append(True)
+            except NotEnoughSeats:
+                results.append(False)
+
+    threads = [threading.Thread(target=buy) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results.count(True) == 5
+    assert seats(app, event_id) == (0, 10, "Sold Out")
+
+
+# -- holds --
+
+def booking_status(app, booking_id):
+    with app.app_context():
+        return db.session.get(Booking, booking_id).booking_status
+
+
+def test_hold_then_confirm(app, event_id, buyer):
+    with app.app_context():
+        booking_id = hold_seats(event_id, buyer, 3, minutes=10).id
+    assert booking_status(app, booking_id) == "Pending"
+    assert seats(app, event_id) == (7, 3, "Open")
+
+    with app.app_context():
+        confirm_hold(booking_id, buyer)
+        confirm_hold(booking_id, buyer)  # a second click is fine
+        # and the sweeper leaves confirmed seats alone
+        release_expired_holds(now=datetime.utcnow() + timedelta(hours=1))
+    assert booking_status(app, booking_id) == "Confirmed"
+    assert seats(app, event_id) == (7, 3, "Open")
+
+
+def test_expired_hold_gives_seats_back(app, event_id, buyer):
+    with app.app_context():
+        booking_id = hold_seats(event_id, buyer, 10, minutes=10).id
+    assert seats(app, event_id) == (0, 10, "Sold Out")
+
+    with app.app_context():
+        release_expired_holds(now=datetime.utcnow() + timedelta(minutes=5))  # not yet
+    assert booking_status(app, booking_id) == "Pending"
+
+    with app.app_context():
+        assert release_expired_holds(now=datetime.utcnow() + timedelta(minutes=11)) >= 1
+    assert booking_status(app, booking_id) == "Expired"
+    assert seats(app, event_id) == (10, 0, "Open")
+
+
+def test_confirm_after_expiry(app, event_id, buyer):
+    with app.app_context():
+        booking_id = hold_seats(event_id, buyer, 2, minutes=-1).id
+        with pytest.raises(HoldExpired):
+            confirm_hold(booking_id, buyer)
+    assert booking_status(app, booking_id) == "Pending"  # until the sweeper gets to it
+
+    with app.app_context():
+        release_expired_holds()
+        with pytest.raises(HoldExpired):
+            confirm_hold(booking_id, buyer)
+    assert seats(app, event_id) == (10, 0, "Open")
+
+
+def test_cancel_hold(app, event_id, buyer):
+    with app.app_context():
+        booking_id = hold_seats(event_id, buyer, 4, minutes=10).id
+        assert cancel_hold(booking_id, buyer) is True
+        assert cancel_hold(booking_id, buyer) is False
+    assert booking_status(app, booking_id) == "Cancelled"
+    assert seats(app, event_id) == (10, 0, "Open")
+
+
+def test_same_hold_released_twice(app, event_id, buyer):
+    # What two sweepers on Postgres can do: both read the same Pending hold before either has
+    # released it, then both release it. Only the first gives the seats back.
+    with app.app_context():
+        booking_id = hold_seats(event_id, buyer, 4, minutes=10).id
+        rows = db.session.execute(
+            db.select(*_HOLD_COLUMNS).join(Event, Event.id == Booking.event_id).where(Booking.id == booking_id)
+        ).all()
+        db.session.commit()
+        assert [b.id for b in run_locked(lambda: _release(rows, "Expired"))] == [booking_id]
+        assert run_locked(lambda: _release(rows, "Cancelled")) == []
+    assert booking_status(app, booking_id) == "Expired"
+    assert seats(app, event_id) == (10, 0, "Open")
+
+
+def test_sweepers_at_once(app, event_id, buyer):
+    with app.app_context():
+        for _ in range(5):
+            hold_seats(event_id, buyer, 2, minutes=-1)
+    assert seats(app, event_id) == (0, 10, "Sold Out")
+
+    ready = threading.Barrier(4)
+
+    def sweep():
+        with app.app_context():
+            ready.wait()
+            release_expired_holds(batch_size=2)
+
+    threads = [threading.Thread(target=sweep) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert seats(app, event_id) == (10, 0, "Open")
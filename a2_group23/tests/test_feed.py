@@ -0,0 +1,42 @@
+# tests/test_feed.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from website import db
+from website.models import Event, Venue
+
+
+@pytest.fixture
+def busy_venue(app):
+    """A venue with 150 events in March 2040 - more than one page of the JSON feed."""
+    with app.app_context():
+        venue = Venue(name="Feed Arena", location="Brisbane", num_of_capacity=500)
+        db.session.add(venue)
+        db.session.flush()
+        start = datetime(2040, 3, 1, 10)
+        db.session.add_all(
+            Event(title=f"Show {i}", description="d", date_time=start + timedelta(hours=3 * i),
+                  duration_minutes=60, ticket_price=10, ticket_quantity=100, owner_id=1,
+                  category="Jazz", venue_id=venue.id)
+            for i in range(150)
+        )
+        db.session.commit()
+        return venue.id
+
+
+def test_ics_has_every_event_in_range(client, busy_venue):
+    r = client.get(f"/events/feed.ics?venue={busy_venue}&from=2040-03-01&to=2040-03-31&limit=10")
+    assert r.status_code == 200
+    body = r.data.decode()
+    assert body.count("BEGIN:VEVENT") == 150
+    assert "SUMMARY:Show 149\r\n" in body
+    assert body.endswith("END:VCALENDAR\r\n")
+
+
+def test_json_is_paged(client, busy_venue):
+    first = client.get(f"/events/feed?venue={busy_venue}&from=2040-03-01").get_json()
+    assert len(first["events"]) == 100
+    rest = client.get(first["next"]).get_json()
+    assert len(rest["events"]) == 50 and rest["next"] is None
+    assert {e["id"] for e in first["events"]}.isdisjoint(e["id"] for e in rest["events"])
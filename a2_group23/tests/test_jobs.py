@@ -0,0 +1,99 @@
+# tests/test_jobs.py
+# The job queue (jobs.py), run by hand with run_pending() / _claim() - under TESTING no worker
+# threads start.
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from website import db, jobs
+
+calls = []
+
+
+@jobs.task("test_record")
+def record(n):
+    calls.append(n)
+
+
+@jobs.task("test_broken")
+def broken():
+    raise ValueError("broken for good")
+
+
+def job(job_id):
+    return db.session.execute(db.select(jobs.jobs).where(jobs.jobs.c.id == job_id)).one()
+
+
+def job_id(name, **kwargs):
+    return db.session.scalar(
+        db.select(jobs.jobs.c.id).where(jobs.jobs.c.name == name, jobs.jobs.c.payload == json.dumps(kwargs))
+    )
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield app
+        # Leave nothing due for the next test
+        db.session.execute(jobs.jobs.delete().where(jobs.jobs.c.name.like("test_%")))
+        db.session.commit()
+
+
+def test_same_key_is_queued_once(ctx):
+    calls.clear()
+    assert jobs.enqueue("test_record", key="record:1", n=1) is True
+    assert jobs.enqueue("test_record", key="record:1", n=1) is False
+    db.session.commit()
+    assert jobs.enqueue("test_record", key="record:1", n=1) is False
+    assert jobs.run_pending() == 1
+    assert calls == [1]
+    # Finished jobs keep their key until they're purged
+    assert jobs.enqueue("test_record", key="record:1", n=1) is False
+
+
+def test_failing_job_backs_off_then_fails(ctx):
+    ctx.config.update(JOB_MAX_ATTEMPTS=3, JOB_RETRY_SECONDS=60)
+    try:
+        jobs.enqueue("test_broken")
+        db.session.commit()
+        broken_id = job_id("test_broken")
+
+        now = datetime.utcnow()
+        assert jobs.run_pending() == 1  # only once - the retry isn't due yet
+        first = job(broken_id)
+        assert (first.status, first.attempts) == ("queued", 1)
+        assert "ValueError: broken for good" in first.last_error
+        assert first.run_at >= now + timedelta(seconds=60)
+
+        # The second retry waits twice as long
+        jobs.run_job(*jobs._claim(first.run_at))
+        second = job(broken_id)
+        assert (second.status, second.attempts) == ("queued", 2)
+        assert second.run_at >= now + timedelta(seconds=120)
+
+        jobs.run_job(*jobs._claim(second.run_at))
+        assert (job(broken_id).status, job(broken_id).attempts) == ("failed", 3)
+        assert jobs._claim(datetime.utcnow() + timedelta(days=1)) is None
+    finally:
+        ctx.config.update(JOB_MAX_ATTEMPTS=5, JOB_RETRY_SECONDS=30)
+
+
+def test_worker_that_lost_its_lease_cant_finish(ctx):
+    calls.clear()
+    jobs.enqueue("test_record", n=2)
+    db.session.commit()
+    claimed, stale = jobs._claim(datetime.utcnow())
+
+    # The first worker stalls past JOB_LEASE_SECONDS and another one takes the job over
+    later = datetime.utcnow() + timedelta(seconds=ctx.config["JOB_LEASE_SECONDS"] + 1)
+    assert jobs._claim(later) == (claimed, stale + 1)
+
+    assert jobs._finish(claimed, stale, status="done") is False
+    assert jobs.run_job(claimed, stale) is False
+    assert (job(claimed).status, job(claimed).attempts) == ("running", stale + 1)
+
+    assert jobs.run_job(claimed, stale + 1) is True
+    assert job(claimed).status == "done"
+    assert jobs._finish(claimed, stale, status="queued") is False
+    assert job(claimed).status == "done"
@@ -0,0 +1,30 @@
+# tests/test_metrics.py
+import json
+import logging
+
+
+def slow_queries(caplog):
+    return [json.loads(r.getMessage()) for r in caplog.records if r.name == "website.slow_queries"]
+
+
+def test_slow_query_log_leaves_out_values(make_app, caplog):
+    # Every statement counts as slow, including the ones writing the admin's password hash
+    caplog.set_level(logging.WARNING, logger="website.slow_queries")
+    app = make_app(SLOW_QUERY_MS=0)
+    r = app.test_client().post("/register", data={
+        "user_name": "logged", "email": "secret@example.com", "phone": "0400123456",
+        "password": "hunter22", "confirm": "hunter22",
+    })
+    assert r.status_code in (200, 302)
+
+    entries = slow_queries(caplog)
+    assert any(e["sql"].startswith("INSERT INTO user") for e in entries)
+    assert all("params" not in e and "rows" in e for e in entries)
+    assert "$2b$" not in caplog.text and "secret@example.com" not in caplog.text
+
+
+def test_slow_query_values_when_asked_for(make_app, caplog):
+    caplog.set_level(logging.WARNING, logger="website.slow_queries")
+    app = make_app(SLOW_QUERY_MS=0, SLOW_QUERY_PARAMS=True)
+    app.test_client().get("/events/feed?venue=7")
+    assert any("params" in e for e in slow_queries(caplog))
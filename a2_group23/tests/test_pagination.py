@@ -0,0 +1,54 @@
+# tests/test_pagination.py
+# ?after= tokens come straight from the URL - a bad one is ignored (first page), never a 500.
+import base64
+import json
+
+import pytest
+
+from website.models import Event
+from website.pagination import _decode, after_token
+
+
+def token(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+COLUMNS = [Event.date_time, Event.id]
+
+BAD_TOKENS = {
+    "garbage": "not a token!",
+    "not a list": token("2026-01-01T00:00:00"),
+    "too short": token(["2026-01-01T00:00:00"]),
+    "not a time": token(["yesterday", 1]),
+    "fraction id": token(["2026-01-01T00:00:00", 1.5]),
+    "bool id": token(["2026-01-01T00:00:00", True]),
+    "string id": token(["2026-01-01T00:00:00", "1"]),
+    # ["2026-01-01T00:00:00", 1e400] - json reads 1e400 as infinity
+    "infinite id": "WyIyMDI2LTAxLTAxVDAwOjAwOjAwIiwgMWU0MDBd",
+    "id too big": token(["2026-01-01T00:00:00", 99999999999999999999999999]),
+    "id too small": token(["2026-01-01T00:00:00", -99999999999999999999999999]),
+    "nested too deep": base64.urlsafe_b64encode(b"[" * 5000).decode(),
+}
+
+
+@pytest.mark.parametrize("bad", BAD_TOKENS.values(), ids=BAD_TOKENS.keys())
+def test_bad_token_is_ignored(bad):
+    assert _decode(bad, COLUMNS) is None
+
+
+def test_good_token_round_trips():
+    from datetime import datetime
+    values = [datetime(2026, 1, 1, 20, 30), 42]
+    assert _decode(after_token(values), COLUMNS) == values
+
+
+@pytest.mark.parametrize("bad", BAD_TOKENS.values(), ids=BAD_TOKENS.keys())
+@pytest.mark.parametrize("url", ["/", "/filter-event/Jazz", "/events/feed", "/events/feed.ics"])
+def test_bad_token_on_pages(client, url, bad):
+    assert client.get(url, query_string={"after": bad}).status_code == 200
+
+
+@pytest.mark.parametrize("after", ["99999999999999999999999999", "²", "-5", "1e3", "abc"])
+def test_bad_search_offset_is_ignored(client, after):
+    r = client.get("/search", query_string={"search": "jazz", "after": after})
+    assert r.status_code == 200
@@ -0,0 +1,43 @@
+# tests/test_proxy.py
+# Behind a reverse proxy the login limit and /metrics have to see the visitor's address, not the
+# proxy's - but only when TRUSTED_PROXIES says there is a proxy to believe.
+import pytest
+
+
+@pytest.fixture
+def proxied_app(make_app):
+    def proxied_app(proxies):
+        return make_app(TRUSTED_PROXIES=proxies, LOGIN_LIMIT_PER_IP=(2, 0.001), LOGIN_LIMIT_PER_USER=(100, 100))
+    return proxied_app
+
+
+def failed_login(client, ip):
+    # Every request reaches the app from the proxy, on localhost
+    return client.post(
+        "/login", data={"user_name": "nobody", "password": "x"},
+        headers={"X-Forwarded-For": ip}, environ_base={"REMOTE_ADDR": "127.0.0.1"},
+    ).status_code
+
+
+def test_login_limit_is_per_visitor_behind_a_proxy(proxied_app):
+    client = proxied_app(1).test_client()
+    assert [failed_login(client, "203.0.113.1") for _ in range(3)] == [200, 200, 429]
+    assert failed_login(client, "203.0.113.2") == 200
+
+
+def test_forwarded_for_is_ignored_without_a_proxy(proxied_app):
+    client = proxied_app(0).test_client()
+    # Made-up addresses don't get anyone a fresh bucket
+    assert [failed_login(client, f"203.0.113.{i}") for i in range(3)] == [200, 200, 429]
+
+
+@pytest.mark.parametrize("proxies, forwarded_for, status", [
+    (1, None, 200),               # the scraper on the same machine
+    (1, "203.0.113.1", 404),      # someone outside, through the proxy
+    (0, "203.0.113.1", 200),      # no proxy trusted: the header means nothing
+])
+def test_metrics_only_for_localhost(proxied_app, proxies, forwarded_for, status):
+    client = proxied_app(proxies).test_client()
+    headers = {"X-Forwarded-For": forwarded_for} if forwarded_for else {}
+    r = client.get("/metrics", headers=headers, environ_base={"REMOTE_ADDR": "127.0.0.1"})
+    assert r.status_code == status
@@ -0,0 +1,64 @@
+# tests/test_query_budget.py
+# How many SQL statements the busiest pages run (with the page cache off). The budgets are what
+# the pages cost today - a page that starts loading something once per row goes over them no
+# matter how few rows there are. If a page really needs another query, raise its budget here.
+import pytest
+
+from website import db
+from website.booking import hold_seats
+from website.models import Booking, Event, User
+from website.queries import assert_max_queries
+
+
+@pytest.fixture
+def engine(app):
+    with app.app_context():
+        return db.engine
+
+
+@pytest.fixture
+def commented_event(app):
+    with app.app_context():
+        return db.session.scalar(db.select(Event.id).where(Event.comment_count > 1).limit(1))
+
+
+def test_index(client, engine):
+    with assert_max_queries(4, engine):
+        r = client.get("/")
+    assert r.status_code == 200
+    assert r.data.count(b'href="/events/') >= 20
+
+
+def test_event_detail(client, engine, commented_event):
+    with assert_max_queries(2, engine):
+        r = client.get(f"/events/{commented_event}")
+    assert r.status_code == 200
+
+
+def test_my_bookings(app, client, engine, login):
+    login("bench1", "bench")
+    with app.app_context():
+        user_id = db.session.scalar(db.select(User.id).where(User.name == "bench1"))
+        bookings = db.session.scalar(db.select(db.func.count()).where(Booking.user_id == user_id))
+    assert bookings > 24  # a full page
+
+    with assert_max_queries(2, engine):
+        r = client.get("/my-bookings")
+    assert r.status_code == 200
+
+
+def test_checkout(app, client, engine, login):
+    login("bench2", "bench")
+    with app.app_context():
+        user_id = db.session.scalar(db.select(User.id).where(User.name == "bench2"))
+        event_id = db.session.scalar(db.select(Event.id).where(Event.seats_remaining > 2).limit(1))
+        booking_id = hold_seats(event_id, user_id, 2, minutes=10).id
+
+    with assert_max_queries(4, engine):
+        r = client.get(f"/booking/{booking_id}/checkout")
+    assert r.status_code == 200
+
+    with assert_max_queries(5, engine):
+        r = client.post(f"/booking/{booking_id}/checkout")
+    assert r.status_code == 302
+    assert f"/booking/{booking_id}/confirmation" in r.headers["Location"]
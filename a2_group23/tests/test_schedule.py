@@ -0,0 +1,86 @@
+# tests/test_schedule.py
+# One venue, one event at a time (schedule.py), through the create and edit forms.
+from datetime import datetime
+
+import pytest
+
+from website import db
+from website.models import Event, Venue
+from website.schedule import overlapping_events
+
+
+@pytest.fixture
+def venue_id(app):
+    with app.app_context():
+        venue = Venue(name="Schedule Hall", location="Darwin", num_of_capacity=100)
+        db.session.add(venue)
+        db.session.commit()
+        return venue.id
+
+
+@pytest.fixture
+def admin(client, login):
+    login("admin", "123")
+    return client
+
+
+def create(client, venue_id, title, when, duration=120):
+    return client.post("/create-event", data={
+        "title": title, "description": "d", "date_time": when, "duration": duration,
+        "category": "Rock", "venue_id": venue_id, "price": 10, "quantity": 10,
+    })
+
+
+def titles(app, venue_id):
+    with app.app_context():
+        return set(db.session.scalars(db.select(Event.title).where(Event.venue_id == venue_id)))
+
+
+def event_id(app, venue_id, title):
+    with app.app_context():
+        return db.session.scalar(db.select(Event.id).where(Event.venue_id == venue_id, Event.title == title))
+
+
+def test_overlap_is_rejected(app, admin, venue_id):
+    assert create(admin, venue_id, "First", "2042-03-01T20:00").status_code == 302  # 20:00 - 22:00
+    for title, when in [("Inside", "2042-03-01T20:30"), ("Across start", "2042-03-01T19:00"),
+                        ("Across end", "2042-03-01T21:59")]:
+        r = create(admin, venue_id, title, when)
+        assert r.location.endswith("/create-event"), title
+    assert titles(app, venue_id) == {"First"}
+
+
+def test_back_to_back_is_allowed(app, admin, venue_id):
+    create(admin, venue_id, "First", "2042-03-01T20:00")
+    create(admin, venue_id, "After", "2042-03-01T22:00", duration=60)   # starts as First ends
+    create(admin, venue_id, "Before", "2042-03-01T19:00", duration=60)  # ends as First starts
+    assert titles(app, venue_id) == {"First", "After", "Before"}
+
+
+def test_edit_doesnt_clash_with_itself(app, admin, venue_id):
+    create(admin, venue_id, "First", "2042-03-01T20:00")
+    create(admin, venue_id, "Second", "2042-03-02T20:00")
+    first = event_id(app, venue_id, "First")
+
+    # Same slot, and a later start that overlaps its own old slot
+    for when in ["2042-03-01T20:00", "2042-03-01T20:30"]:
+        r = admin.post(f"/events/{first}/edit", data={"date_time": when, "venue_id": venue_id})
+        assert "/edit" not in r.location, when
+    with app.app_context():
+        assert db.session.get(Event, first).date_time == datetime(2042, 3, 1, 20, 30)
+
+    # but not onto the other event
+    r = admin.post(f"/events/{first}/edit", data={"date_time": "2042-03-02T19:00", "venue_id": venue_id})
+    assert r.location.endswith(f"/events/{first}/edit")
+    with app.app_context():
+        assert db.session.get(Event, first).date_time == datetime(2042, 3, 1, 20, 30)
+
+
+def test_cancelled_events_free_the_venue(app, admin, venue_id):
+    create(admin, venue_id, "First", "2042-03-01T20:00")
+    first = event_id(app, venue_id, "First")
+    admin.post(f"/events/{first}/edit", data={"date_time": "2042-03-01T20:00", "status": "Cancelled"})
+    create(admin, venue_id, "Instead", "2042-03-01T20:00")
+    assert titles(app, venue_id) == {"First", "Instead"}
+    with app.app_context():
+        assert [r.title for r in overlapping_events(venue_id, datetime(2042, 3, 1, 21), datetime(2042, 3, 1, 23))] == ["Instead"]
@@ -1,26 +1,58 @@
 # import flask - from 'package' import 'Class'
 from flask import Flask 
 from flask_bootstrap import Bootstrap5
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 import os
 from pathlib import Path
-from flask_bcrypt import generate_password_hash
 
 
 db = SQLAlchemy()
 
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)  # this is the name of the module/package that is calling this app
-    app.debug = True
-    app.secret_key = 'somesecretkey'
-    # set the app configuration data 
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///sitedata.sqlite'
+    # set the app configuration data - profile and environment overrides are in config.py.
+    # Extra settings can be passed in too (used by the benchmarks to point at a scratch database)
+    from .config import load_config, apply_sqlite_pragmas
+    load_config(app, config)
+    # The client's real address (and http/https) from the X-Forwarded-* headers of the proxies
+    # we trust - the login rate limit is per IP address (see TRUSTED_PROXIES in config.py)
+    proxies = app.config['TRUSTED_PROXIES']
+    if proxies:
+       app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
     # initialise db with flask app
     db.init_app(app)
+    with app.app_context():
+       apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+
+    # Server-Timing headers, /metrics and the slow query log (see metrics.py)
+    from .metrics import metrics
+    metrics.init_app(app)
 
     Bootstrap5(app)
+
+    # Cache for the public pages (see cache.py)
+    from .cache import page_cache
+    page_cache.init_app(app)
+
+    # Background jobs, run after the request has committed (see jobs.py)
+    from .jobs import job_runner
+    job_runner.init_app(app)
+
+    # Lets templates build the "next page" links
+    from .pagination import page_url
+    app.add_template_global(page_url)
+
+    # Resized event images for the templates (see images.py)
+    from .images import image_srcset, image_url
+    app.add_template_global(image_srcset)
+    app.add_template_global(image_url)
+
+    # Fingerprinted static URLs with year-long cache headers (see assets.py)
+    from .assets import assets
+    assets.init_app(app)
     
     # initialise the login manager
     login_manager = LoginManager()
@@ -37,9 +69,19 @@ def create_app():
     # create a user loader function takes userid and returns User
     # Importing inside the create_app function avoids circular references
     from .models import User
+    # Logged-in users come from a short-lived cache rather than a query per request (see identity.py)
+    from .identity import identity_cache
+    identity_cache.init_app(app)
+
     @login_manager.user_loader
     def load_user(user_id):
-       return db.session.scalar(db.select(User).where(User.id==user_id))
+       return identity_cache.load(user_id)
+
+    # bcrypt runs in a bounded pool and logins are rate limited (see passwords.py, ratelimit.py)
+    from .passwords import password_hasher
+    password_hasher.init_app(app)
+    from .ratelimit import login_limiter
+    login_limiter.init_app(app)
 
     from . import views
     app.register_blueprint(views.main_bp)
@@ -51,6 +93,40 @@ def create_app():
     from .events import events_bp
     app.register_blueprint(events_bp)
 
+    # Sales reports - /reports and flask reports show / refresh
+    from .reports import reports_bp
+    app.register_blueprint(reports_bp)
+
+    # Events between two dates as JSON or iCalendar - /events/feed, /events/feed.ics
+    from .feed import feed_bp
+    app.register_blueprint(feed_bp)
+
+    # flask search rebuild
+    from .search import search_cli
+    app.cli.add_command(search_cli)
+
+    # flask db upgrade / flask db check-indexes
+    from .migrations import db_cli
+    app.cli.add_command(db_cli)
+
+    # flask images build
+    from .images import images_cli
+    app.cli.add_command(images_cli)
+
+    # flask jobs run / status / retry
+    from .jobs import jobs_cli
+    app.cli.add_command(jobs_cli)
+
+    # flask assets build
+    from .assets import assets_cli
+    app.cli.add_command(assets_cli)
+
+    # flask venues import / export / conflicts
+    from .bulk import venues_cli
+    app.cli.add_command(venues_cli)
+    from .schedule import conflicts_command
+    venues_cli.add_command(conflicts_command)
+
 
 
     #To Make sure Images are saved at correct path
@@ -58,23 +134,32 @@ def create_app():
     app.config["MAX_CONTENT_LENGTH"] = 5 * 1024 * 1024  # 5 MB
     app.config["ALLOWED_IMAGE_EXTS"] = {"png", "jpg", "jpeg", "gif"}
 
-    Path(app.config["UPLOAD_FOLDER"]).mkdir(parents=True, exist_ok=True)
+    # Uploaded images are stored by content hash (see storage.py)
+    from . import storage
+    storage.init_app(app)
     
     
     # Create Admin User if not in db already - Admin can add venues and see all events 
     with app.app_context():
-       db.create_all()
+       # Create any new tables and bring older databases up to date with the current models
+       from .migrations import upgrade
+       upgrade(db.engine)
        admin= db.session.scalar(db.select(User).where(User.email == "admin@admin.com"))
        if not admin:
           admin_user = User(
              name="admin",
              email="admin@admin.com",
              phone="0000",
-             password_hash=generate_password_hash("123"),
+             password_hash=password_hasher.hash("123"),
              role="admin"
              )
           db.session.add(admin_user)
           db.session.commit()
+
+    # Background thread that gives back seats from abandoned checkouts
+    if app.config['HOLD_SWEEPER_INTERVAL'] and not app.testing:
+       from .booking import start_hold_sweeper
+       start_hold_sweeper(app, app.config['HOLD_SWEEPER_INTERVAL'])
           
     return app       
           
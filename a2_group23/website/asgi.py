@@ -0,0 +1,23 @@
+# website/asgi.py
+# Runs the site under an ASGI server (uvicorn) instead of gunicorn's sync workers:
+#
+#   uvicorn --factory website.asgi:create_asgi_app --host 0.0.0.0 --port 8000 --workers 2
+#
+# A sync gunicorn worker handles one request at a time, so a request stuck on bcrypt, an image
+# resize or a SQLite lock holds up everyone queued behind it in that worker. Here the event loop
+# takes in the connections and each request runs on one of ASGI_THREADS threads, so a process
+# keeps serving pages while a few requests are waiting on something slow. That means more
+# requests in flight for the same memory (see bench/serving.py for the numbers).
+#
+# The views stay the same sync Flask views - a2wsgi translates between ASGI and WSGI.
+# (asgiref's WsgiToAsgi runs every request on one shared thread, and uvicorn's own
+# WSGIMiddleware is deprecated in favour of a2wsgi.)
+from a2wsgi import WSGIMiddleware
+
+from . import create_app
+
+
+def create_asgi_app(config=None):
+    """The site as an ASGI app. `config` is passed on to create_app."""
+    app = create_app(config)
+    return WSGIMiddleware(app, workers=app.config["ASGI_THREADS"])
@@ -0,0 +1,167 @@
+# website/assets.py
+# Lets browsers keep static files for a year without ever asking again.
+#
+# `flask assets build` (run on deploy, after changing anything in static/) hashes every static
+# file and writes static/manifest.json, e.g. "images/logo.png" -> "images/logo.3f2a9c1d0b7e.png".
+# url_for('static', ...) then hands out the fingerprinted name, and those URLs are served with
+#   Cache-Control: public, max-age=31536000, immutable
+# When a file changes its fingerprint changes too, so the page links to a new URL and nobody
+# ever sees a stale copy. Uploaded event images already have a content hash for a name (see
+# storage.py), so they get the same headers without being in the manifest.
+#
+# The build also writes pre-compressed copies of text files (site.css.gz, site.css.br) which
+# are sent to browsers that accept them, so nothing is compressed per request. Brotli copies
+# need the optional `brotli` package.
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST = "manifest.json"
+ONE_YEAR = 365 * 24 * 3600
+COMPRESSIBLE = {".css", ".js", ".mjs", ".json", ".svg", ".txt", ".html", ".xml", ".map", ".ico"}
+MIN_COMPRESS_SIZE = 1024  # smaller files aren't worth it
+ENCODINGS = {"br": ".br", "gzip": ".gz"}  # in order of preference
+
+# Names that are already a content hash: uploads and their resized variants
+HASHED_NAME = re.compile(r"(^|/)[0-9a-f]{64}[.-]")
+
+
+def _fingerprinted(name, digest):
+    stem, dot, ext = name.rpartition(".")
+    return f"{stem}.{digest[:12]}.{ext}" if dot else f"{name}.{digest[:12]}"
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Assets:
+    def __init__(self):
+        self.urls = {}        # real name -> fingerprinted name
+        self.files = {}       # fingerprinted name -> real name
+        self.compressed = {}  # real name -> encodings with a pre-compressed copy
+
+    def init_app(self, app):
+        self.load(app.static_folder)
+        app.url_defaults(self._rewrite_url)
+        app.view_functions["static"] = self.serve
+        app.extensions["assets"] = self
+
+    def load(self, static_folder):
+        try:
+            with open(os.path.join(static_folder, MANIFEST)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:  # not built (e.g. local development) - plain URLs then
+            manifest = {}
+        self.urls = manifest.get("files", {})
+        self.files = {fingerprinted: name for name, fingerprinted in self.urls.items()}
+        self.compressed = manifest.get("compressed", {})
+
+    def _rewrite_url(self, endpoint, values):
+        if endpoint == "static" and values.get("filename") in self.urls:
+            values["filename"] = self.urls[values["filename"]]
+
+    def serve(self, filename):
+        """Replaces Flask's static view: maps fingerprinted names back to the real file, adds the
+        long cache headers and picks a pre-compressed copy if the browser takes one."""
+        name = self.files.get(filename, filename)
+        immutable = filename in self.files or HASHED_NAME.search(filename) is not None
+        max_age = ONE_YEAR if immutable else None  # None = Flask's usual revalidation
+
+        encoding = next(
+            (enc for enc in ENCODINGS if enc in self.compressed.get(name, ()) and enc in request.accept_encodings),
+            None,
+        )
+        if encoding:
+            mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            response = send_from_directory(
+                current_app.static_folder, name + ENCODINGS[encoding], mimetype=mimetype, max_age=max_age
+            )
+            response.content_encoding = encoding
+        else:
+            response = send_from_directory(current_app.static_folder, name, max_age=max_age)
+
+        if name in self.compressed:
+            response.vary.add("Accept-Encoding")
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
+
+
+def _compress(path):
+    """Writes .gz (and .br) next to a file, keeping only the ones that came out smaller."""
+    with open(path, "rb") as f:
+        data = f.read()
+    encoders = {"gzip": lambda d: gzip.compress(d, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoders["br"] = lambda d: brotli.compress(d, quality=11)
+
+    made = []
+    for encoding, encode in encoders.items():
+        packed = encode(data)
+        target = path + ENCODINGS[encoding]
+        if len(packed) < len(data):
+            with open(target, "wb") as f:
+                f.write(packed)
+            made.append(encoding)
+        elif os.path.exists(target):
+            os.remove(target)
+    return made
+
+
+def build_manifest(static_folder):
+    """Fingerprints and pre-compresses everything in static/ and writes the manifest."""
+    manifest = {"files": {}, "compressed": {}}
+    for root, dirs, names in os.walk(static_folder):
+        for filename in names:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, static_folder).replace(os.sep, "/")
+            if name == MANIFEST or filename.endswith((".gz", ".br", ".tmp")) or HASHED_NAME.search(name):
+                continue
+            manifest["files"][name] = _fingerprinted(name, _sha256(path))
+            ext = os.path.splitext(filename)[1].lower()
+            if ext in COMPRESSIBLE and os.path.getsize(path) >= MIN_COMPRESS_SIZE:
+                encodings = _compress(path)
+                if encodings:
+                    manifest["compressed"][name] = encodings
+
+    # Write then rename so running workers never read half a manifest
+    target = os.path.join(static_folder, MANIFEST)
+    with open(target + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(target + ".tmp", target)
+    return manifest
+
+
+# flask assets build
+assets_cli = AppGroup("assets", help="Fingerprinted, pre-compressed static files.")
+
+
+@assets_cli.command("build")
+def build_command():
+    """Writes static/manifest.json and the .gz/.br copies. Restart the app afterwards."""
+    manifest = build_manifest(current_app.static_folder)
+    click.echo(f"Fingerprinted {len(manifest['files'])} files, "
+               f"pre-compressed {len(manifest['compressed'])}.")
+    if brotli is None:
+        click.echo("brotli is not installed, only .gz copies were made (pip install brotli).")
@@ -1,8 +1,10 @@
-from flask import Blueprint, flash, render_template, request, url_for, redirect
-from flask_bcrypt import generate_password_hash, check_password_hash
+from flask import Blueprint, flash, render_template, request, session, url_for, redirect
 from flask_login import login_user, login_required, logout_user, current_user
 from .models import User
 from .forms import EditProfileForm, LoginForm, RegisterForm
+from .identity import SESSION_KEY, identity_cache
+from .passwords import PasswordCheckBusy, password_hasher
+from .ratelimit import login_limiter
 from . import db
 
 # Create a blueprint - make sure all BPs have unique names
@@ -16,12 +18,20 @@ def login():
     if login_form.validate_on_submit():
         user_name = login_form.user_name.data
         password = login_form.password.data
+        # Too many attempts from this address or at this user name - turned away before any hashing
+        if not login_limiter.allow(request.remote_addr, user_name):
+            flash("Too many login attempts. Please wait a minute and try again.", "danger")
+            return render_template('user.html', form=login_form, heading='Login'), 429
         user = db.session.scalar(db.select(User).where(User.name==user_name))
         if user is None:
             error = 'Incorrect user name'
-        elif not check_password_hash(user.password_hash, password): # takes the hash and cleartext password
+        elif not password_hasher.check(user.password_hash, password): # takes the hash and cleartext password
             error = 'Incorrect password'
         if error is None:
+            # Hashes made before BCRYPT_LOG_ROUNDS was changed are redone now we have the password
+            if password_hasher.needs_rehash(user.password_hash):
+                user.password_hash = password_hasher.hash(password)
+                db.session.commit()
             login_user(user)
             flash(f"Welcome back, {user.name}!", "success")
             nextp = request.args.get('next')
@@ -50,7 +60,7 @@ def register():
             return redirect(url_for('auth.register'))
 
         # Password hashing for security
-        hashed_password = generate_password_hash(form.password.data)
+        hashed_password = password_hasher.hash(form.password.data)
 
         # Creating new user record
         new_user = User(
@@ -78,26 +88,35 @@ def edit_profile():
     form = EditProfileForm(obj=current_user)
 
     if request.method == "POST" and form.validate_on_submit():
-        user = current_user
+        # current_user is only a cached copy (see identity.py), so change the real row
+        user = db.session.get(User, current_user.id)
         user.name = form.user_name.data
         user.email = form.email.data
         user.phone = form.phone.data
 
         # If btoh fields are present, then only update the pasword
         if form.password.data and form.confirm_password.data:
-            user.password_hash = generate_password_hash(form.password.data)
+            user.password_hash = password_hasher.hash(form.password.data)
 
         db.session.commit()
+        identity_cache.changed(user)
         flash("Profile updated successfully!", "success")
         return redirect(url_for("main.index"))
 
     return render_template("edit_profile.html", form=form)
 
+# Every password check or hash goes through a bounded pool (see passwords.py). When it is full
+# the user is asked to try again instead of waiting in a queue that only gets longer.
+@auth_bp.errorhandler(PasswordCheckBusy)
+def password_check_busy(error):
+    return render_template('503.html'), 503, {"Retry-After": "5"}
+
 # Logout user Fucntion
 @auth_bp.route('/logout')
 @login_required
 def logout():
     logout_user()  # Clear the user session
+    session.pop(SESSION_KEY, None)
     flash('You have been logged out.', 'info')
     return redirect(url_for('main.index'))
 
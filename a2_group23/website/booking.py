@@ -0,0 +1,246 @@
+# website/booking.py
+# Booking service. Anything that changes how many seats an event has left goes through here,
+# so the seat counter and the booking rows are always written together in one commit.
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import DBAPIError
+
+from . import db
+from .cache import page_cache
+from .models import Booking, Event
+
+
+class BookingError(Exception):
+    """Base class for bookings that could not be made."""
+
+
+class EventNotFound(BookingError):
+    pass
+
+
+class NotEnoughSeats(BookingError):
+    pass
+
+
+class HoldExpired(BookingError):
+    pass
+
+
+# Retry settings for lock / serialization failures. Backoff doubles each time up to the cap,
+# with jitter so competing workers don't all wake up together.
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.02  # seconds
+BACKOFF_CAP = 0.5
+
+# Postgres SQLSTATEs worth retrying: serialization failure, deadlock, lock not available.
+RETRYABLE_PG_CODES = {"40001", "40P01", "55P03"}
+
+
+def _is_retryable(exc):
+    orig = getattr(exc, "orig", None)
+    code = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+    if code in RETRYABLE_PG_CODES:
+        return True
+    message = str(orig).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def _begin_write():
+    """Starts the transaction with the write lock already held on SQLite.
+
+    A plain BEGIN on SQLite only takes the write lock at the first UPDATE, so two workers can
+    both read the event and then deadlock upgrading. BEGIN IMMEDIATE queues them up front instead.
+    """
+    conn = db.session.connection()
+    if conn.dialect.name == "sqlite" and not conn.connection.driver_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _lock_event(event_id):
+    """Loads the event, locking its row on databases that support SELECT ... FOR UPDATE."""
+    stmt = db.select(Event).where(Event.id == event_id).execution_options(populate_existing=True)
+    if db.session.get_bind().dialect.name == "postgresql":
+        stmt = stmt.with_for_update()
+    return db.session.scalar(stmt)
+
+
+def run_locked(work, attempts=MAX_ATTEMPTS):
+    """Runs work() in a single write transaction and commits it, retrying on lock errors.
+
+    work() must only touch the session - it is called again from scratch after a rollback.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            _begin_write()
+            result = work()
+            db.session.commit()
+            return result
+        except DBAPIError as exc:
+            db.session.rollback()
+            if attempt == attempts or not _is_retryable(exc):
+                raise
+            delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1))
+            time.sleep(random.uniform(0, delay))
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def book_seats(event_id, user_id, quantity, status="Confirmed", expires_at=None):
+    """Reserves seats and creates the booking in one transaction. Returns the Booking."""
+    if quantity < 1:
+        raise BookingError("Quantity must be at least 1.")
+
+    def work():
+        event = _lock_event(event_id)
+        if event is None:
+            raise EventNotFound(event_id)
+        if not event.reserve_seats(quantity):
+            raise NotEnoughSeats(event_id)
+
+        booking = Booking(
+            user_id=user_id,
+            event_id=event_id,
+            no_of_tickets=quantity,
+            total_price=event.ticket_price * quantity,
+            booking_status=status,
+            expires_at=expires_at,
+        )
+        db.session.add(booking)
+        db.session.flush()
+        return booking
+
+    return run_locked(work)
+
+
+# ---- Seat holds -------------------------------------------------------------------------------
+# Choosing tickets only creates a Pending booking that holds the seats for a few minutes.
+# The buyer then confirms it (cheap, no seat counting) or it expires and the sweeper gives
+# the seats back.
+
+def hold_seats(event_id, user_id, quantity, minutes):
+    """Holds seats for `minutes` as a Pending booking."""
+    expires_at = datetime.utcnow() + timedelta(minutes=minutes)
+    return book_seats(event_id, user_id, quantity, status="Pending", expires_at=expires_at)
+
+
+def confirm_hold(booking_id, user_id):
+    """Turns the user's Pending booking into a Confirmed one, if the hold hasn't run out."""
+    def work():
+        result = db.session.execute(
+            db.update(Booking)
+            .where(
+                Booking.id == booking_id,
+                Booking.user_id == user_id,
+                Booking.booking_status == "Pending",
+                Booking.expires_at > datetime.utcnow(),
+            )
+            .values(booking_status="Confirmed", expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    if not run_locked(work):
+        booking = db.session.get(Booking, booking_id)
+        if booking is None or booking.user_id != user_id or booking.booking_status != "Confirmed":
+            raise HoldExpired(booking_id)
+
+
+def _release(bookings, new_status):
+    """Marks Pending bookings as released and gives their seats back, one UPDATE per event.
+
+    Returns the bookings it released. The rows were read without a lock, so by now another
+    sweeper (or the buyer confirming) may have got to some of them - only the ones this UPDATE
+    still found Pending get their seats back, or the seats would be given back twice.
+    """
+    ids = [b.id for b in bookings]
+    released = set(db.session.scalars(
+        db.update(Booking)
+        .where(Booking.id.in_(ids), Booking.booking_status == "Pending")
+        .values(booking_status=new_status, expires_at=None)
+        .returning(Booking.id)
+        .execution_options(synchronize_session=False)
+    ).all())
+    bookings = [b for b in bookings if b.id in released]
+    seats = defaultdict(int)
+    for b in bookings:
+        seats[b.event_id] += b.no_of_tickets
+    for event_id, quantity in seats.items():
+        Event.release_seats(event_id, quantity)
+    return bookings
+
+
+def _released_seats_changed(rows):
+    # Called after commit - a sold out event may have reopened, so cached pages are stale.
+    for event_id, category in {(r.event_id, r.category) for r in rows}:
+        page_cache.event_changed(event_id, category)
+
+
+# The booking columns _release() needs, plus the genre for cache invalidation.
+_HOLD_COLUMNS = (Booking.id, Booking.event_id, Booking.no_of_tickets, Event.category)
+
+
+def cancel_hold(booking_id, user_id):
+    """Lets the buyer give up a hold straight away instead of waiting for it to expire."""
+    def work():
+        row = db.session.execute(
+            db.select(*_HOLD_COLUMNS).join(Event, Event.id == Booking.event_id).where(
+                Booking.id == booking_id,
+                Booking.user_id == user_id,
+                Booking.booking_status == "Pending",
+            )
+        ).first()
+        if row and _release([row], "Cancelled"):
+            return row
+        return None
+
+    row = run_locked(work)
+    if row:
+        _released_seats_changed([row])
+    return row is not None
+
+
+def release_expired_holds(batch_size=500, now=None):
+    """Releases every hold that has expired, batch_size bookings per transaction.
+
+    Returns how many bookings were released.
+    """
+    now = now or datetime.utcnow()
+    released = 0
+    while True:
+        def work():
+            rows = db.session.execute(
+                db.select(*_HOLD_COLUMNS).join(Event, Event.id == Booking.event_id)
+                .where(Booking.booking_status == "Pending", Booking.expires_at <= now)
+                .order_by(Booking.expires_at)
+                .limit(batch_size)
+            ).all()
+            return len(rows), _release(rows, "Expired") if rows else []
+
+        found, rows = run_locked(work)
+        _released_seats_changed(rows)
+        released += len(rows)
+        if found < batch_size:
+            return released
+
+
+def start_hold_sweeper(app, interval):
+    """Starts a daemon thread that releases expired holds every `interval` seconds."""
+    def sweep_forever():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    released = release_expired_holds()
+                    if released:
+                        app.logger.info("Released %d expired seat holds", released)
+                except Exception:
+                    app.logger.exception("Seat hold sweep failed")
+
+    thread = threading.Thread(target=sweep_forever, name="hold-sweeper", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,347 @@
+# website/bulk.py
+# Bulk import / export of events and venues, for onboarding a promoter's whole season at once:
+#   flask events import season.csv --owner promoter@example.com
+#   flask events export --format jsonl > events.jsonl
+#   flask venues import venues.csv
+#   flask venues export > venues.csv
+# Files are CSV (with a header row) or JSON Lines, picked by --format or the file extension.
+# Rows are read and written one at a time, so a file of any size runs in constant memory.
+#
+# Every row is checked with the same rules as the create-event / add-venue forms. Bad rows are
+# reported with their line number and skipped. Good rows are inserted BATCH_SIZE at a time with
+# one multi-row INSERT per batch, and each batch is committed on its own.
+import csv
+import json
+import time
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+
+from . import db
+from .cache import page_cache
+from .counts import COUNTS_TAG, events_added
+from .forms import CATEGORIES, MIN_LEAD_TIME
+from .models import Event, Ticket, User, Venue, event_end, local_now
+from .schedule import VenueCalendar, describe_overlap
+
+BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 50  # bad rows listed at the end (the rest are only counted)
+
+EVENT_FIELDS = [
+    "id", "title", "description", "category", "date_time", "duration_minutes", "ticket_price",
+    "ticket_quantity", "seats_sold", "status", "venue_id", "venue", "owner_id", "image",
+]
+VENUE_FIELDS = ["id", "name", "location", "num_of_capacity"]
+
+
+class RowError(ValueError):
+    pass
+
+
+# -- reading and writing rows --
+
+def _format(fmt, stream):
+    if fmt:
+        return fmt
+    name = getattr(stream, "name", "")
+    return "jsonl" if name.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def read_rows(stream, fmt=None):
+    """Yields (line number, dict) for every row in a CSV or JSONL file."""
+    if _format(fmt, stream) == "jsonl":
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else {"__invalid__": "not a JSON object"}
+    else:
+        # Line 1 is the header, so the first row is on line 2
+        for line_no, row in enumerate(csv.DictReader(stream), 2):
+            yield line_no, row
+
+
+def write_rows(stream, rows, fields, fmt=None):
+    if _format(fmt, stream) == "jsonl":
+        for row in rows:
+            stream.write(json.dumps(row, default=str) + "\n")
+    else:
+        writer = csv.DictWriter(stream, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# -- validation (the same rules as EventForm / TicketForm and events.create) --
+
+def _text(row, field, max_length):
+    value = row.get(field)
+    value = str(value).strip() if value is not None else ""
+    if not value:
+        raise RowError(f"{field} is required")
+    if len(value) > max_length:
+        raise RowError(f"{field} cannot be longer than {max_length} characters")
+    return value
+
+
+def _int(row, field, minimum):
+    try:
+        value = int(row.get(field))
+    except (TypeError, ValueError):
+        raise RowError(f"{field} must be a whole number")
+    if value < minimum:
+        raise RowError(f"{field} must be at least {minimum}")
+    return value
+
+
+def _date_time(row):
+    value = row.get("date_time")
+    try:
+        value = datetime.fromisoformat(value) if isinstance(value, str) else None
+    except ValueError:
+        return None
+    # Event times are stored as local time, like the form's datetime-local field
+    return value if value is None or value.tzinfo is None else None
+
+
+class EventRowChecker:
+    """Checks event rows against the form rules. Venues are loaded once up front, since a season
+    import has thousands of events but only a handful of venues."""
+
+    def __init__(self, now=None):
+        self.now = now or local_now()
+        self.venues = {}  # id -> capacity
+        self.venue_ids = {}  # name -> id
+        for venue_id, name, capacity in db.session.execute(
+            db.select(Venue.id, Venue.name, Venue.num_of_capacity)
+        ):
+            self.venues[venue_id] = capacity
+            self.venue_ids.setdefault(name, venue_id)
+        # Bookings already in the database plus the rows accepted so far, so two rows of the
+        # same file can't take the same venue either
+        self.calendar = VenueCalendar(self.now)
+
+    def __call__(self, row):
+        if "__invalid__" in row:
+            raise RowError(row["__invalid__"])
+        title = _text(row, "title", 100)
+        description = _text(row, "description", 500)
+
+        category = row.get("category")
+        if category not in CATEGORIES:
+            raise RowError(f"category must be one of {', '.join(CATEGORIES)}")
+
+        date_time = _date_time(row)
+        if date_time is None:
+            raise RowError("date_time must look like 2030-01-31T20:00")
+        if date_time - self.now < MIN_LEAD_TIME:
+            raise RowError("Event start time must be at least 5 hours from now")
+
+        duration = _int(row, "duration_minutes", 1)
+        price = _int(row, "ticket_price", 0)
+        quantity = _int(row, "ticket_quantity", 1)
+
+        # Venue by id, or by name for files written by hand
+        venue_id = row.get("venue_id")
+        try:
+            venue_id = int(venue_id) if venue_id not in (None, "") else self.venue_ids.get(row.get("venue"))
+        except (TypeError, ValueError):
+            venue_id = None
+        if venue_id not in self.venues:
+            raise RowError("Select a valid venue")
+        if quantity > self.venues[venue_id]:
+            raise RowError(f"Number of seats cannot exceed the venue capacity ({self.venues[venue_id]} seats)")
+
+        ends_at = event_end(date_time, duration)
+        clash = self.calendar.find(venue_id, date_time, ends_at)
+        if clash:
+            raise RowError(f"That venue is taken: {describe_overlap(clash)}")
+        self.calendar.add(venue_id, date_time, ends_at, title)
+
+        return {
+            "title": title,
+            "description": description,
+            "category": category,
+            "date_time": date_time,
+            "duration_minutes": duration,
+            "ends_at": ends_at,
+            "ticket_price": price,
+            "ticket_quantity": quantity,
+            "seats_sold": 0,
+            "seats_remaining": quantity,
+            "status": "Open",
+            "venue_id": venue_id,
+            "image": row.get("image") or None,
+        }
+
+
+class VenueRowChecker:
+    """Same checks as the add-venue form, including skipping venues that already exist."""
+
+    def __init__(self):
+        self.seen = set(db.session.execute(db.select(Venue.name, Venue.location)).tuples())
+
+    def __call__(self, row):
+        if "__invalid__" in row:
+            raise RowError(row["__invalid__"])
+        name = _text(row, "name", 100)
+        location = _text(row, "location", 200)
+        capacity = _int(row, "num_of_capacity" if "num_of_capacity" in row else "capacity", 1)
+        if (name, location) in self.seen:
+            raise RowError("That venue already exists")
+        self.seen.add((name, location))
+        return {"name": name, "location": location, "num_of_capacity": capacity}
+
+
+# -- import --
+
+def _insert_events(rows, owner_id):
+    for row in rows:
+        row["owner_id"] = owner_id
+    # Core inserts (no ORM objects), sent as a few multi-row INSERTs per batch. Each new event
+    # comes back with its price and quantity, so its ticket row doesn't depend on row order.
+    created = db.session.execute(
+        db.insert(Event.__table__).returning(Event.id, Event.ticket_price, Event.ticket_quantity), rows
+    )
+    db.session.execute(db.insert(Ticket.__table__), [
+        {"event_id": event_id, "price": price, "quantity": quantity}
+        for event_id, price, quantity in created
+    ])
+    events_added(db.session.connection(), rows)
+
+
+def _insert_venues(rows):
+    db.session.execute(db.insert(Venue.__table__), rows)
+
+
+def bulk_import(rows, check, insert, batch_size=BATCH_SIZE, dry_run=False, report=None):
+    """Checks and inserts rows from read_rows(). Returns (imported, skipped, errors) where errors
+    lists the first few (line number, message). `report(done, elapsed)` runs after every batch."""
+    started = time.perf_counter()
+    imported = skipped = 0
+    errors = []
+    batch = []
+
+    def flush():
+        nonlocal imported
+        if batch and not dry_run:
+            insert(batch)
+            db.session.commit()
+        imported += len(batch)
+        batch.clear()
+        if report:
+            report(imported, time.perf_counter() - started)
+
+    for line_no, row in rows:
+        try:
+            batch.append(check(row))
+        except RowError as e:
+            skipped += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append((line_no, str(e)))
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return imported, skipped, errors
+
+
+def _progress(done, elapsed):
+    rate = done / elapsed if elapsed else 0
+    click.echo(f"  {done} rows ({rate:,.0f} rows/s)", err=True)
+
+
+def _finish(kind, imported, skipped, errors, dry_run):
+    for line_no, message in errors:
+        click.echo(f"line {line_no}: {message}", err=True)
+    if skipped > len(errors):
+        click.echo(f"... and {skipped - len(errors)} more", err=True)
+    verb = "Checked" if dry_run else "Imported"
+    click.echo(f"{verb} {imported} {kind}, skipped {skipped} invalid rows.")
+    if skipped:
+        raise SystemExit(1)
+
+
+def import_events(stream, owner_email=None, fmt=None, batch_size=BATCH_SIZE, dry_run=False):
+    owner = db.session.scalar(
+        db.select(User).where(User.email == owner_email) if owner_email
+        else db.select(User).where(User.role == "admin").order_by(User.id).limit(1)
+    )
+    if owner is None:
+        raise click.ClickException(f"No user with email {owner_email}.")
+
+    imported, skipped, errors = bulk_import(
+        read_rows(stream, fmt), EventRowChecker(), lambda rows: _insert_events(rows, owner.id),
+        batch_size, dry_run, _progress,
+    )
+    if imported and not dry_run:
+        # New events show up on the home page and the genre pages
+        page_cache.invalidate("listing:all", COUNTS_TAG, *[f"listing:{c.lower()}" for c in CATEGORIES])
+    _finish("events", imported, skipped, errors, dry_run)
+
+
+def import_venues(stream, fmt=None, batch_size=BATCH_SIZE, dry_run=False):
+    imported, skipped, errors = bulk_import(
+        read_rows(stream, fmt), VenueRowChecker(), _insert_venues, batch_size, dry_run, _progress,
+    )
+    _finish("venues", imported, skipped, errors, dry_run)
+
+
+# -- export --
+
+def event_rows():
+    """Every event as a dict, streamed from the database a page at a time."""
+    stmt = (
+        db.select(
+            Event.id, Event.title, Event.description, Event.category, Event.date_time,
+            Event.duration_minutes, Event.ticket_price, Event.ticket_quantity, Event.seats_sold,
+            Event.status, Event.venue_id, Venue.name.label("venue"), Event.owner_id, Event.image,
+        )
+        .join(Venue, Venue.id == Event.venue_id)
+        .order_by(Event.id)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+    for row in db.session.execute(stmt):
+        row = row._asdict()
+        row["date_time"] = row["date_time"].isoformat(timespec="minutes")
+        yield row
+
+
+def venue_rows():
+    stmt = db.select(*[getattr(Venue, f) for f in VENUE_FIELDS]).order_by(Venue.id)
+    for row in db.session.execute(stmt.execution_options(yield_per=BATCH_SIZE)):
+        yield row._asdict()
+
+
+# -- commands (the event ones are registered in events.py) --
+
+def import_options(command):
+    command = click.option("--dry-run", is_flag=True, help="Only check the rows, insert nothing.")(command)
+    command = click.option("--batch-size", default=BATCH_SIZE, show_default=True, help="Rows per INSERT / commit.")(command)
+    command = click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), help="Default: from the file extension.")(command)
+    return click.argument("source", type=click.File("r", encoding="utf-8"))(command)
+
+
+def export_options(command):
+    command = click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), help="Default: from the file extension.")(command)
+    return click.argument("target", type=click.File("w", encoding="utf-8"), default="-")(command)
+
+
+venues_cli = AppGroup("venues", help="Venue admin commands.")
+
+
+@venues_cli.command("import")
+@import_options
+def import_venues_command(source, fmt, batch_size, dry_run):
+    """Adds venues from a CSV or JSONL file (name, location, num_of_capacity)."""
+    import_venues(source, fmt, batch_size, dry_run)
+
+
+@venues_cli.command("export")
+@export_options
+def export_venues_command(target, fmt):
+    """Writes every venue as CSV or JSONL (to stdout by default)."""
+    write_rows(target, venue_rows(), VENUE_FIELDS, fmt)
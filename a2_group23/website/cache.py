@@ -0,0 +1,237 @@
+# website/cache.py
+# Page cache for the public pages (home, genre filter, event detail). Those pages look the same
+# for every anonymous visitor, so the rendered HTML is kept and reused until something that
+# appears on the page is changed.
+#
+# Invalidation works with "tags". Every cached page lists the tags it depends on:
+#   listing:all     - the home page and the "All" filter
+#   listing:<genre> - one genre's filter page
+#   event:<id>      - one event's detail page
+# Each tag has a generation number that is part of the cache key. When an event is created,
+# edited, deleted, sells out or gets a comment, its tags' generations are bumped. Pages cached
+# under the old numbers are then never read again and age out on their own. This works the
+# same on any backend that can get/set/delete/incr, in-process or Redis.
+#
+# With the default "memory" backend every process has its own cache and its own generations,
+# so a change only reaches the cache of the process that made it. Under gunicorn the other
+# workers keep serving their copy - a sold-out event still showing seats, a new event missing
+# from the home page - for up to CACHE_TTL seconds. The same goes for changes made outside the
+# web workers: holds let go by the sweeper thread of another worker, and `flask events import`
+# or any other CLI command, which reaches none of them. That's fine for one worker or a short
+# CACHE_TTL. With several workers set CACHE_BACKEND = "redis" so they share one cache.
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, current_app, request, session
+from flask_login import current_user
+
+
+class MemoryBackend:
+    """In-process LRU cache with a time-to-live on every entry. Safe to share between threads."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._counters = {}  # generation numbers are never evicted
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Shares the cache between worker processes through Redis.
+
+    `client` can be anything with redis-py's get / set(ex=) / delete / incr methods, such as a
+    redis.Redis instance or the LocalRedis stand-in below.
+    """
+
+    def __init__(self, client, prefix="firevents:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=int(ttl))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def counter(self, key):
+        return int(self.client.get(self.prefix + "gen:" + key) or 0)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + "gen:" + key)
+
+
+class LocalRedis:
+    """A tiny in-memory stand-in for a Redis client (enough for RedisBackend), for running the
+    Redis code path without a Redis server."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self._data.get(key, (None, None))
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._data.get(key, (0, None))[0]) + 1
+            self._data[key] = (str(value).encode(), None)
+            return value
+
+
+class PageCache:
+    def __init__(self):
+        self.backend = None
+        self.ttl = 30
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault("CACHE_BACKEND", "memory")  # "memory", "redis" or "none"
+        app.config.setdefault("CACHE_REDIS_URL", "redis://localhost:6379/0")
+        app.config.setdefault("CACHE_TTL", 30)
+        app.config.setdefault("CACHE_MAX_ENTRIES", 512)
+
+        backend = app.config["CACHE_BACKEND"]
+        if backend == "redis":
+            import redis  # only needed when the Redis backend is switched on
+            self.backend = RedisBackend(redis.Redis.from_url(app.config["CACHE_REDIS_URL"]))
+        elif backend == "memory":
+            self.backend = MemoryBackend(app.config["CACHE_MAX_ENTRIES"])
+        else:
+            self.backend = None
+        self.ttl = app.config["CACHE_TTL"]
+        app.extensions["page_cache"] = self
+
+    # -- stats --
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    # -- invalidation --
+
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        for tag in tags:
+            self.backend.incr(tag)
+
+    def event_changed(self, event_id, *categories):
+        """Drops every cached page that shows this event (pass the old and new genre on edits)."""
+        tags = ["listing:all", f"event:{event_id}"]
+        tags += [f"listing:{c.lower()}" for c in set(categories) if c]
+        self.invalidate(*tags)
+
+    # -- the decorator --
+
+    def _cacheable(self):
+        # Only anonymous GETs with nothing flashed - anything else can differ per visitor.
+        return (
+            self.backend is not None
+            and request.method == "GET"
+            and not current_user.is_authenticated
+            and "_flashes" not in session
+        )
+
+    def cached(self, tags):
+        """Caches a view's response for anonymous visitors.
+
+        `tags` is called with the view's arguments and returns the tags the page depends on.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if not self._cacheable():
+                    return view(**kwargs)
+
+                page_tags = tags(**kwargs)
+                generations = ".".join(str(self.backend.counter(t)) for t in page_tags)
+                key = f"page:{request.endpoint}:{generations}:{request.full_path}"
+
+                cached = self.backend.get(key)
+                if cached is not None:
+                    self._count(True)
+                    body, mimetype = cached
+                    response = Response(body, mimetype=mimetype)
+                    response.headers["X-Cache"] = "HIT"
+                    return response
+
+                self._count(False)
+                response = current_app.make_response(view(**kwargs))
+                if response.status_code == 200 and not session.modified:
+                    self.backend.set(key, (response.get_data(), response.mimetype), self.ttl)
+                response.headers["X-Cache"] = "MISS"
+                return response
+            return wrapper
+        return decorator
+
+
+page_cache = PageCache()
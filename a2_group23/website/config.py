@@ -0,0 +1,143 @@
+# website/config.py
+# App settings. Pick a profile with the APP_ENV environment variable:
+#   APP_ENV=development  - debug mode on, for working on the site locally
+#   APP_ENV=production   - debug off, SECRET_KEY must come from the environment
+#   (not set)            - same as production but with a fallback secret key
+# Any setting can also be overridden with a FIREVENTS_ environment variable, for example
+#   FIREVENTS_PAGE_SIZE=48  or  FIREVENTS_CACHE_BACKEND='"redis"'  (values are read as JSON).
+import os
+
+from sqlalchemy import event
+
+
+def _database_url():
+    url = os.environ.get("DATABASE_URL", "sqlite:///sitedata.sqlite")
+    # Some hosts hand out postgres:// URLs, SQLAlchemy only accepts postgresql://
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+class Config:
+    DEBUG = False
+    SECRET_KEY = os.environ.get("SECRET_KEY", "somesecretkey")
+    SQLALCHEMY_DATABASE_URI = _database_url()
+
+    # SQLite connection settings. WAL lets readers carry on while someone writes, NORMAL sync is
+    # safe with WAL, busy_timeout makes writers wait for the lock instead of failing straight
+    # away, and mmap lets reads come straight from the OS page cache.
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    }
+
+    # Connection pool for Postgres (and other server databases)
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+    DB_POOL_RECYCLE = 1800  # seconds
+
+    # How long seats are held at checkout, and how often expired holds are swept (0 = never)
+    HOLD_MINUTES = 10
+    HOLD_SWEEPER_INTERVAL = 60
+
+    # Rows per page on the listing pages
+    PAGE_SIZE = 24
+    COMMENTS_PAGE_SIZE = 20
+
+    # Page cache (see cache.py). "memory" is per process: with several gunicorn workers a
+    # change is only seen by the worker that made it, the others (and CLI imports) leave stale
+    # pages for up to CACHE_TTL seconds. Use "redis" to share one cache between them
+    CACHE_BACKEND = "memory"
+    CACHE_TTL = 30
+
+    # Threads that make the resized copies of uploaded images (see images.py)
+    IMAGE_WORKERS = 2
+
+    # Background jobs (see jobs.py). JOB_WORKERS threads per process, 0 leaves the jobs to
+    # `flask jobs run`. Failed jobs are retried after 30s, 60s, 120s... up to JOB_MAX_ATTEMPTS tries
+    JOB_WORKERS = 2
+    JOB_POLL_SECONDS = 5
+    JOB_MAX_ATTEMPTS = 5
+    JOB_RETRY_SECONDS = 30
+    JOB_LEASE_SECONDS = 300
+    JOB_KEEP_HOURS = 24
+
+    # How long each worker trusts its copy of a logged-in user (see identity.py, 0 = no cache)
+    IDENTITY_CACHE_TTL = 60
+
+    # Password hashing (see passwords.py). Raising BCRYPT_LOG_ROUNDS rehashes on each next login
+    BCRYPT_LOG_ROUNDS = 12
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_QUEUE = 8
+
+    # Login attempts allowed: (burst, refills per minute) per IP address and per user name.
+    # "memory" keeps the buckets in each worker, "redis" shares them (see ratelimit.py)
+    LOGIN_LIMIT_BACKEND = "memory"
+    LOGIN_LIMIT_PER_IP = (20, 10)
+    LOGIN_LIMIT_PER_USER = (5, 2)
+
+    # How many reverse proxies / load balancers sit in front of the app, each adding itself to
+    # X-Forwarded-For. Behind one, set it to 1 - otherwise every visitor has the proxy's IP
+    # address, the per-IP login limit above becomes one limit for the whole site, and /metrics
+    # thinks everyone is on localhost. Leave it at 0 when the app is reached directly, or anyone
+    # can pick their own IP address by sending the header.
+    TRUSTED_PROXIES = 0
+
+    # Request threads per process under uvicorn (see asgi.py). More than SQLAlchemy's default
+    # connection pool (5 + 10 overflow) would only leave threads waiting for a connection
+    ASGI_THREADS = 15
+
+    # Per-request timings, /metrics and the slow query log (see metrics.py)
+    INSTRUMENTATION = True
+    SLOW_QUERY_MS = 100
+    # Also log the values bound to slow statements. Off: they include password hashes and
+    # personal details, which don't belong in the application logs
+    SLOW_QUERY_PARAMS = False
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    SECRET_KEY = os.environ.get("SECRET_KEY")
+
+
+CONFIGS = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+}
+
+
+def load_config(app, overrides=None):
+    app.config.from_object(CONFIGS.get(os.environ.get("APP_ENV"), Config))
+    app.config.from_prefixed_env("FIREVENTS")
+    if overrides:
+        app.config.update(overrides)
+
+    if not app.config["SECRET_KEY"]:
+        raise RuntimeError("Set the SECRET_KEY environment variable for the production profile.")
+
+    if not app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {
+            "pool_size": app.config["DB_POOL_SIZE"],
+            "max_overflow": app.config["DB_MAX_OVERFLOW"],
+            "pool_recycle": app.config["DB_POOL_RECYCLE"],
+            "pool_pre_ping": True,  # drop connections the server has closed instead of erroring
+        })
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Sets the pragmas on every new SQLite connection the engine opens."""
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
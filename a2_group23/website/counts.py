@@ -0,0 +1,192 @@
+# website/counts.py
+# How many upcoming events each genre and each venue has - "Jazz (142)" on the genre buttons
+# and a column on the venues page - without a COUNT(*) over the event table for every button.
+#
+# event_count keeps one row per (genre, venue) with the events starting at or after the mark
+# (event_count_mark.counted_from). Every write keeps it in step, in the same transaction:
+#   - new, deleted and moved events (date, genre or venue) - the mapper events at the bottom
+#   - bulk imports, which insert with Core - events_added(), called from bulk.py
+# Time passing is the other change: events that start stop being upcoming. Reading the counts
+# takes off the few that started since the mark (a short range on ix_event_date_time), and the
+# next write more than ROLL_AFTER after the mark takes them off for good and moves the mark up.
+# This is the same stored + live split as daily_sales in reports.py.
+#
+#   flask events recount   - builds the counts again from the events (never needed day to day)
+from collections import Counter
+from datetime import timedelta
+
+from sqlalchemy import event as sa_event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import db
+from .forms import CATEGORIES
+from .models import Event, EventCount, EventCountMark, local_now
+
+ROLL_AFTER = timedelta(minutes=10)
+
+# Page cache tag of the pages showing the counts. Dropped when events are added, moved or
+# deleted, not when seats sell.
+COUNTS_TAG = "listing:counts"
+
+counts = EventCount.__table__
+mark = EventCountMark.__table__
+
+
+def _add(conn, deltas):
+    """Adds {(category, venue_id): change} to event_count."""
+    rows = [
+        {"category": category, "venue_id": venue_id, "upcoming": change}
+        for (category, venue_id), change in deltas.items() if change
+    ]
+    if not rows:
+        return
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(conn.dialect.name)
+    if dialect is not None:
+        stmt = dialect.insert(counts)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=["category", "venue_id"],
+            set_={"upcoming": counts.c.upcoming + stmt.excluded.upcoming},
+        ), rows)
+        return
+    for row in rows:
+        updated = conn.execute(
+            counts.update()
+            .where(counts.c.category == row["category"], counts.c.venue_id == row["venue_id"])
+            .values(upcoming=counts.c.upcoming + row["upcoming"])
+        )
+        if updated.rowcount == 0:
+            conn.execute(counts.insert(), row)
+
+
+def _grouped(conn, *where):
+    """{(category, venue_id): events} for the events matching `where`."""
+    return Counter({
+        (category, venue_id): n for category, venue_id, n in conn.execute(
+            db.select(Event.category, Event.venue_id, db.func.count())
+            .where(*where)
+            .group_by(Event.category, Event.venue_id)
+        )
+    })
+
+
+def _started(conn, since, until):
+    return _grouped(conn, Event.date_time >= since, Event.date_time < until)
+
+
+def recount(conn, now=None):
+    """Builds event_count from scratch, counting from `now`."""
+    now = now or local_now()
+    conn.execute(counts.delete())
+    conn.execute(counts.insert().from_select(
+        ["category", "venue_id", "upcoming"],
+        db.select(Event.category, Event.venue_id, db.func.count())
+        .where(Event.date_time >= now)
+        .group_by(Event.category, Event.venue_id),
+    ))
+    conn.execute(mark.delete())
+    conn.execute(mark.insert().values(id=1, counted_from=now))
+
+
+def roll_forward(conn, now=None):
+    """Takes the events that have started since the mark off the counts and moves the mark to
+    `now`. Returns the mark, or None if nothing has been counted yet. Only one of two writers
+    racing to do it gets to (the UPDATE on the mark is conditional), the other sees the new mark."""
+    now = now or local_now()
+    counted_from = conn.scalar(db.select(mark.c.counted_from).where(mark.c.id == 1))
+    if counted_from is None or now - counted_from < ROLL_AFTER:
+        return counted_from
+    moved = conn.execute(
+        mark.update().where(mark.c.id == 1, mark.c.counted_from == counted_from).values(counted_from=now)
+    )
+    if moved.rowcount != 1:
+        return conn.scalar(db.select(mark.c.counted_from).where(mark.c.id == 1))
+    _add(conn, {key: -n for key, n in _started(conn, counted_from, now).items()})
+    return now
+
+
+def events_added(conn, rows):
+    """Counts events inserted without the ORM (dicts with category, venue_id and date_time)."""
+    counted_from = roll_forward(conn)
+    if counted_from is None:
+        return
+    _add(conn, Counter(
+        (row["category"], int(row["venue_id"])) for row in rows if row["date_time"] >= counted_from
+    ))
+
+
+# -- reading --
+
+def upcoming_counts(now=None):
+    """{(category, venue_id): events starting at or after `now`}."""
+    now = now or local_now()
+    conn = db.session.connection()
+    counted_from = conn.scalar(db.select(mark.c.counted_from).where(mark.c.id == 1))
+    if counted_from is None:
+        # Never counted (a database from before counts.py that hasn't been upgraded)
+        return _grouped(conn, Event.date_time >= now)
+    stored = Counter({(row.category, row.venue_id): row.upcoming for row in conn.execute(counts.select())})
+    if now > counted_from:
+        stored.subtract(_started(conn, counted_from, now))
+    return stored
+
+
+def category_counts(now=None):
+    """[(category, events)] for the genre buttons, in the usual order, leaving out empty ones."""
+    totals = Counter()
+    for (category, _), n in upcoming_counts(now).items():
+        totals[category] += n
+    return [(category, totals[category]) for category in CATEGORIES if totals[category] > 0]
+
+
+def venue_counts(now=None):
+    """{venue_id: upcoming events}."""
+    totals = Counter()
+    for (_, venue_id), n in upcoming_counts(now).items():
+        totals[venue_id] += n
+    return totals
+
+
+# -- keeping the counts in step with ORM writes --
+# Until the counts have been built once (migrations.py does that) there is nothing to keep in
+# step, and upcoming_counts() counts the events directly.
+
+def _key(category, venue_id):
+    return category, int(venue_id)
+
+
+def _counts_from(connection, when):
+    counted_from = roll_forward(connection)
+    return counted_from is not None and when >= counted_from
+
+
+@sa_event.listens_for(Event, "after_insert")
+def _event_inserted(mapper, connection, target):
+    if _counts_from(connection, target.date_time):
+        _add(connection, {_key(target.category, target.venue_id): 1})
+
+
+@sa_event.listens_for(Event, "after_delete")
+def _event_deleted(mapper, connection, target):
+    if _counts_from(connection, target.date_time):
+        _add(connection, {_key(target.category, target.venue_id): -1})
+
+
+@sa_event.listens_for(Event, "before_update")
+def _event_moved(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in ("category", "venue_id", "date_time")):
+        return
+    # The row still has the old values until this flush writes the new ones
+    old = connection.execute(
+        db.select(Event.category, Event.venue_id, Event.date_time).where(Event.id == target.id)
+    ).one()
+    counted_from = roll_forward(connection)
+    if counted_from is None:
+        return
+    deltas = Counter()
+    if old.date_time >= counted_from:
+        deltas[_key(old.category, old.venue_id)] -= 1
+    if target.date_time >= counted_from:
+        deltas[_key(target.category, target.venue_id)] += 1
+    _add(connection, deltas)
+
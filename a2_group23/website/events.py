@@ -1,12 +1,21 @@
 from flask import Blueprint, abort, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
 from datetime import datetime
-import os, uuid
 
 from . import db
-from .models import Event, Venue, Comment, Booking, Ticket
-from .forms import EventForm, TicketForm, BookingForm
+from .models import Event, Venue, Comment, Booking, Ticket, event_end, local_now
+from .forms import EventForm, TicketForm, BookingForm, MIN_LEAD_TIME, CATEGORIES
+from .queries import event_detail as event_detail_query, event_comments
+from .pagination import paginate
+from .cache import page_cache
+from .booking import hold_seats, confirm_hold, cancel_hold, release_expired_holds
+from .booking import NotEnoughSeats, EventNotFound, HoldExpired
+from .images import queue_variants
+from .schedule import overlapping_events, describe_overlap
+from .counts import recount, venue_counts, COUNTS_TAG
+from .storage import save_upload
+from .bulk import import_events, event_rows, write_rows, import_options, export_options, EVENT_FIELDS
+import click
 
 events_bp = Blueprint("events", __name__)
 
@@ -29,9 +38,9 @@ def create():
 
 
         # Making sure event time is at least 5 hours after to the event creation.
-        current_time = datetime.now()
+        current_time = local_now()
         time_difference = event_dt - current_time
-        if time_difference.total_seconds() < 5 * 3600:  
+        if time_difference < MIN_LEAD_TIME:
             flash("Event start time must be at least 5 hours from now.", "danger")
             return redirect(url_for("events.create"))
         
@@ -44,11 +53,8 @@ def create():
             if ext not in {"jpg", "jpeg", "png", "gif"}:
                 flash("Unsupported image type.", "warning")
                 return redirect(url_for("events.create"))
-            safe_name = secure_filename(image_file.filename)
-            new_name = f"{uuid.uuid4().hex[:8]}_{safe_name}"
-            save_path = os.path.join(current_app.config["UPLOAD_FOLDER"], new_name)
-            image_file.save(save_path)
-            image_filename = new_name
+            # Stored under a hash of its contents, so a re-used picture is only kept once
+            image_filename = save_upload(image_file)
 
         # Validating venue - Hard for hacker to manipulate, but can be done with burpsuite. 
         venue_id = request.form.get("venue_id")
@@ -63,6 +69,12 @@ def create():
             flash(f"Number of seats cannot exceed the venue capacity ({venue.num_of_capacity} seats).", "danger")
             return redirect(url_for("events.create"))
 
+        # The venue can't already be taken for any of that time
+        clash = overlapping_events(venue.id, event_dt, event_end(event_dt, duration))
+        if clash:
+            flash(f"That venue is taken: {describe_overlap(clash[0])}.", "danger")
+            return redirect(url_for("events.create"))
+
 
         # Making sure category selected
         category = event_form.category.data
@@ -96,7 +108,11 @@ def create():
         )
         db.session.add(ticket)
 
+        # Resized copies are made by a background job, the page shows the original until then
+        queue_variants(image_filename)
         db.session.commit()
+        page_cache.event_changed(new_event.id, category)
+        page_cache.invalidate(COUNTS_TAG)
         flash("Event created successfully!", "success")
         return redirect(url_for("main.events"))
 
@@ -125,33 +141,47 @@ def edit(event_id):
     form = EventForm(obj=event)
     
     if request.method == "POST":
+        old_category = event.category
         event.title = request.form.get("title", event.title)
         event.description = request.form.get("description", event.description)
         event.duration_minutes = int(request.form.get("duration") or event.duration_minutes)
         event.ticket_price = int(request.form.get("ticket_price") or event.ticket_price)
-        event.ticket_quantity = int(request.form.get("ticket_quantity") or event.ticket_quantity)
-        event.status = request.form.get("status", event.status)
-        event.venue_id = request.form.get("venue_id") or event.venue_id
-        event.category = request.form.get("category") or event.category
+        # Kept aside: set_ticket_quantity() turns event.status into an SQL expression (Open or
+        # Sold Out, worked out from the seats already sold), which is no good for an if below
+        status = request.form.get("status", event.status)
+        event.status = status
+        event.set_ticket_quantity(int(request.form.get("ticket_quantity") or event.ticket_quantity))
+        event.venue_id = int(request.form.get("venue_id") or event.venue_id)
+        # Only one of the genres (the form's select), anything else leaves it as it was
+        if request.form.get("category") in CATEGORIES:
+            event.category = request.form["category"]
         event.date_time = form.date_time.data
 
+        # A new time, length or venue mustn't land on another event (no_autoflush: the
+        # half-edited event shouldn't be written out just to run the check)
+        if status != "Cancelled":
+            with db.session.no_autoflush:
+                clash = overlapping_events(int(event.venue_id), event.date_time,
+                                           event_end(event.date_time, event.duration_minutes), exclude_id=event.id)
+            if clash:
+                db.session.rollback()
+                flash(f"That venue is taken: {describe_overlap(clash[0])}.", "danger")
+                return redirect(url_for("events.edit", event_id=event_id))
 
         # Handle image replacement
         image_file = request.files.get("image")
         if image_file and image_file.filename:
             ext = image_file.filename.rsplit(".", 1)[-1].lower()
             if ext in {"jpg", "jpeg", "png", "gif"}:
-                safe_name = secure_filename(image_file.filename)
-                new_name = f"{uuid.uuid4().hex[:8]}_{safe_name}"
-                save_path = os.path.join(current_app.config["UPLOAD_FOLDER"], new_name)
-                image_file.save(save_path)
-                if event.image:
-                    old_path = os.path.join(current_app.config["UPLOAD_FOLDER"], event.image)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                event.image = new_name
+                # The old file may be shared with another event, so it's left for
+                # `flask images gc` to remove once nothing uses it
+                event.image = save_upload(image_file)
+                queue_variants(event.image)
 
+        new_category = event.category
         db.session.commit()
+        page_cache.event_changed(event_id, old_category, new_category)
+        page_cache.invalidate(COUNTS_TAG)
         flash("Event updated successfully!", "success")
         return redirect(url_for("main.events"))
 
@@ -168,16 +198,12 @@ def delete(event_id):
         flash("Event not found.", "warning")
         return redirect(url_for("main.events"))
 
-    if event.image:
-        img_path = os.path.join(current_app.config["UPLOAD_FOLDER"], event.image)
-        try:
-            if os.path.exists(img_path):
-                os.remove(img_path)
-        except OSError:
-            pass
-
+    # The image file stays - another event may share it. `flask images gc` clears unused ones.
+    category = event.category
     db.session.delete(event)
     db.session.commit()
+    page_cache.event_changed(event_id, category)
+    page_cache.invalidate(COUNTS_TAG)
     flash("Event deleted.", "success")
     return redirect(url_for("main.events"))
 
@@ -195,33 +221,98 @@ def book_event(event_id):
     if form.validate_on_submit():
         quantity = form.no_of_tickets.data
 
-        # Checking if user is trying to buy more tickets than available for the show
-        if quantity > event.tickets_left():
+        # The seats are held for a few minutes while the user confirms at checkout.
+        # It fails if user is trying to buy more tickets than available for the show.
+        status_before = event.status
+        try:
+            booking = hold_seats(event.id, current_user.id, quantity, current_app.config["HOLD_MINUTES"])
+        except EventNotFound:
+            abort(404)
+        except NotEnoughSeats:
             flash("Not enough tickets available.", "warning")
             return redirect(url_for('events.book_event', event_id=event.id))
 
-        total_price = event.ticket_price * quantity
+        # Cached pages only show the status, so they only go stale when the event sells out
+        if event.status != status_before:
+            page_cache.event_changed(event.id, event.category)
 
-        # Add Booking
-        booking = Booking(
-            user_id=current_user.id,
-            event_id=event.id,
-            no_of_tickets=quantity,
-            total_price=total_price,
-            booking_status='Confirmed'
-        )
+        return redirect(url_for('events.checkout', booking_id=booking.id))
 
-        db.session.add(booking)
-        db.session.commit()
+    return render_template('book_event.html', event=event, form=form)
 
-        event.update_status()
 
-        flash("Booking confirmed successfully!", "success")
+# Checkout - confirm the seats being held
+@events_bp.route('/booking/<int:booking_id>/checkout', methods=['GET', 'POST'])
+@login_required
+def checkout(booking_id):
+    booking = db.session.get(Booking, booking_id)
+    if not booking or booking.user_id != current_user.id:
+        abort(404)
+    if booking.booking_status == "Confirmed":
+        return redirect(url_for('events.order_confirmation', booking_id=booking.id))
 
+    if request.method == "POST":
+        try:
+            confirm_hold(booking.id, current_user.id)
+        except HoldExpired:
+            flash("Your hold on these tickets has expired. Please book again.", "warning")
+            return redirect(url_for('events.book_event', event_id=booking.event_id))
+
+        flash("Booking confirmed successfully!", "success")
         # Redirecting user to the Order COnfirmation pagee.
         return redirect(url_for('events.order_confirmation', booking_id=booking.id))
 
-    return render_template('book_event.html', event=event, form=form)
+    if booking.booking_status != "Pending" or booking.expires_at <= datetime.utcnow():
+        flash("Your hold on these tickets has expired. Please book again.", "warning")
+        return redirect(url_for('events.book_event', event_id=booking.event_id))
+
+    seconds_left = int((booking.expires_at - datetime.utcnow()).total_seconds())
+    return render_template('checkout.html', booking=booking, event=booking.event, seconds_left=seconds_left)
+
+
+# Give up held seats straight away
+@events_bp.route('/booking/<int:booking_id>/cancel', methods=['POST'])
+@login_required
+def cancel_booking(booking_id):
+    booking = db.session.get(Booking, booking_id)
+    if not booking or booking.user_id != current_user.id:
+        abort(404)
+
+    if cancel_hold(booking.id, current_user.id):
+        flash("Your held tickets have been released.", "info")
+    return redirect(url_for('events.event_detail', event_id=booking.event_id))
+
+
+# Release expired holds from the command line: flask events sweep-holds
+@events_bp.cli.command("sweep-holds")
+@click.option("--batch-size", default=500, show_default=True, help="Bookings released per transaction.")
+def sweep_holds(batch_size):
+    released = release_expired_holds(batch_size=batch_size)
+    click.echo(f"Released {released} expired holds.")
+
+
+# Build the upcoming event counts again from scratch: flask events recount (see counts.py)
+@events_bp.cli.command("recount")
+def recount_command():
+    recount(db.session.connection())
+    db.session.commit()
+    click.echo(f"Counted {sum(venue_counts().values())} upcoming events.")
+
+
+# flask events import / export - whole seasons at once (see bulk.py)
+@events_bp.cli.command("import")
+@import_options
+@click.option("--owner", "owner_email", help="Email of the organiser the events belong to. Default: admin.")
+def import_events_command(source, owner_email, fmt, batch_size, dry_run):
+    """Adds events from a CSV or JSONL file, checked like the create-event form."""
+    import_events(source, owner_email, fmt, batch_size, dry_run)
+
+
+@events_bp.cli.command("export")
+@export_options
+def export_events_command(target, fmt):
+    """Writes every event as CSV or JSONL (to stdout by default)."""
+    write_rows(target, event_rows(), EVENT_FIELDS, fmt)
 
 
 # Booking Confirmation Route
@@ -232,6 +323,8 @@ def order_confirmation(booking_id):
     booking = db.session.get(Booking, booking_id)
     if not booking or booking.user_id != current_user.id:
         abort(404)
+    if booking.booking_status == "Pending":
+        return redirect(url_for('events.checkout', booking_id=booking.id))
 
     event = booking.event
     return render_template('order-confirmation.html', booking=booking, event=event)
@@ -252,15 +345,18 @@ def my_bookings():
 
 # Event Details Page
 @events_bp.route('/events/<event_id>')
+@page_cache.cached(lambda event_id: [f"event:{event_id}"])
 def event_detail(event_id):
-    event = db.session.get(Event, int(event_id))
+    event = db.session.scalar(event_detail_query(int(event_id)))
     if not event:
         abort(404)
 
-    event.update_status() 
-
-    comments = event.comments
-    comments.sort(key=lambda c: c.posted_date, reverse=True)
+    # Read only - the status is kept up to date by bookings and edits, not here.
+    # Comments are paged newest first, "Older comments" follows ?comments_after=.
+    comments = paginate(
+        event_comments(event.id), [Comment.posted_date, Comment.id],
+        request.args.get("comments_after"), size=current_app.config["COMMENTS_PAGE_SIZE"], descending=True,
+    )
     return render_template('event.html', event=event, comments=comments)
 
 
@@ -279,7 +375,11 @@ def add_comment(event_id):
 
     c = Comment(comment=text, user_id=current_user.id, event_id=event.id)
     db.session.add(c)
+    Event.count_comments(event.id, 1)
+    category = event.category
     db.session.commit()
+    # The event page and the listing cards both show the comment count
+    page_cache.event_changed(event_id, category)
     flash("Comment posted.", "success")
     return redirect(url_for("events.event_detail", event_id=event.id) + "#comments")
 
@@ -299,7 +399,10 @@ def delete_comment(comment_id):
         flash("You don't have permission to delete this comment.", "danger")
         return redirect(url_for("events.event_detail", event_id=c.event_id) + "#comments")
 
+    event_id, category = c.event_id, c.event.category
     db.session.delete(c)
+    Event.count_comments(event_id, -1)
     db.session.commit()
+    page_cache.event_changed(event_id, category)
     flash("Comment deleted.", "success")
-    return redirect(url_for("events.event_detail", event_id=c.event_id) + "#comments")
+    return redirect(url_for("events.event_detail", event_id=event_id) + "#comments")
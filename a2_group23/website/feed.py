@@ -0,0 +1,212 @@
+# website/feed.py
+# Events between two dates, for calendars and other sites:
+#   /events/feed      - JSON
+#   /events/feed.ics  - iCalendar, for subscribing from Google Calendar, Outlook, phones
+# Query string (all optional):
+#   from=2025-06-06    first day, or a full time like 2025-06-06T18:00 (default: now)
+#   to=2025-06-08      last day, included, or a full time (default: no end)
+#   venue=3            one venue's events
+#   category=Jazz      one genre's events
+#   limit=100          events per response, at most MAX_LIMIT (JSON only)
+#   after=...          the next page, from the JSON "next" link (JSON only)
+# Calendar apps can't follow a "next" link, so the .ics feed is never paged: it has every event
+# in the range, however many that is.
+# So "this weekend" is ?from=2025-06-06&to=2025-06-08 and "next 30 days at venue 3" is
+# ?venue=3&to=<today + 30 days>. Leaving out `from` means only upcoming events.
+#
+# Rows are read and written out a batch at a time, so a big slice never sits in memory whole.
+# Every combination of filters walks an index on event: (date_time, id), (category, date_time, id)
+# or (venue_id, date_time, id).
+import json
+from datetime import date, datetime, time, timedelta, timezone
+
+from flask import Blueprint, Response, abort, request, stream_with_context, url_for
+
+from . import db
+from .forms import CATEGORIES
+from .models import Event, Venue, local_now
+from .pagination import after_filter, after_token
+
+feed_bp = Blueprint("feed", __name__)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def _time_arg(name, end=False):
+    """A from/to argument as a datetime. A date on its own means the start of that day, or for
+    `to` the end of it."""
+    value = request.args.get(name, "").strip()
+    if not value:
+        return None
+    try:
+        if len(value) == 10:
+            day = date.fromisoformat(value)
+            return datetime.combine(day + timedelta(days=1) if end else day, time.min)
+        return datetime.fromisoformat(value.removesuffix("Z"))
+    except ValueError:
+        abort(400, f"{name} must be a date (YYYY-MM-DD) or a time (YYYY-MM-DDTHH:MM).")
+
+
+def _int_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        abort(400, f"{name} must be a number.")
+
+
+def feed_query(start, end=None, venue_id=None, category=None):
+    """Events from `start` up to (not including) `end`, soonest first, with their venue."""
+    stmt = (
+        db.select(
+            Event.id, Event.title, Event.description, Event.date_time, Event.ends_at,
+            Event.category, Event.status, Event.ticket_price, Event.seats_remaining,
+            Venue.id.label("venue_id"), Venue.name.label("venue_name"), Venue.location.label("venue_location"),
+        )
+        .join(Venue, Venue.id == Event.venue_id)
+        .where(Event.date_time >= start)
+    )
+    if end is not None:
+        stmt = stmt.where(Event.date_time < end)
+    if venue_id is not None:
+        stmt = stmt.where(Event.venue_id == venue_id)
+    if category:
+        # Matched case-insensitively here, so the query is a plain indexed equality
+        genres = {c.lower(): c for c in CATEGORIES}
+        stmt = stmt.where(Event.category == genres.get(category.lower(), category))
+    return stmt
+
+
+def _slice(paged=True):
+    """The rows the request asked for, plus the "after" token of the next page (or None).
+    The token is only known once the rows have been read, so it is handed out through `more`.
+    Without `paged` it is the whole range, and there is never a next page."""
+    start = _time_arg("from") or local_now()
+    end = _time_arg("to", end=True)
+    limit = min(max(_int_arg("limit", DEFAULT_LIMIT), 1), MAX_LIMIT) if paged else None
+    columns = [Event.date_time, Event.id]
+    stmt = feed_query(start, end, _int_arg("venue"), request.args.get("category"))
+    if paged:
+        stmt = after_filter(stmt, columns, request.args.get("after")).limit(limit + 1)
+    stmt = stmt.order_by(*columns).execution_options(yield_per=200)
+
+    more = {}
+
+    def rows():
+        last = None
+        for count, row in enumerate(db.session.execute(stmt)):
+            if count == limit:
+                more["after"] = after_token([last.date_time, last.id])
+                break
+            last = row
+            yield row
+
+    return rows(), more
+
+
+def _local(moment):
+    # Event times are the wall-clock time at the venue, as the organiser typed them in, with no
+    # timezone - so they go out the same way ("floating" times), not as UTC
+    return moment.isoformat(timespec="seconds")
+
+
+# -- JSON --
+
+def _event_json(row):
+    return {
+        "id": row.id,
+        "title": row.title,
+        "url": url_for("events.event_detail", event_id=row.id, _external=True),
+        "start": _local(row.date_time),
+        "end": _local(row.ends_at),
+        "category": row.category,
+        "status": row.status,
+        "price": row.ticket_price,
+        "seats_remaining": max(row.seats_remaining, 0),
+        "venue": {"id": row.venue_id, "name": row.venue_name, "location": row.venue_location},
+    }
+
+
+def _json_chunks(rows, more):
+    yield '{"events": ['
+    for count, row in enumerate(rows):
+        yield ("," if count else "") + json.dumps(_event_json(row))
+    next_url = None
+    if "after" in more:
+        next_url = url_for("feed.events_json", **dict(request.args.items(), after=more["after"]), _external=True)
+    yield '], "next": ' + json.dumps(next_url) + "}"
+
+
+# -- iCalendar (RFC 5545) --
+
+def _ics_text(value):
+    return (value or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+
+
+def _ics_line(line):
+    # Lines longer than 75 bytes are folded: CRLF and a space, then the rest
+    encoded = line.encode()
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        while cut and (encoded[cut] & 0xC0) == 0x80:  # don't split a UTF-8 character
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    parts.append(encoded.decode())
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ics_time(moment):
+    # Floating time (no Z, no TZID): calendars show it as the same clock time wherever they are
+    return moment.strftime("%Y%m%dT%H%M%S")
+
+
+def _ics_chunks(rows):
+    # DTSTAMP is when the file was made, which RFC 5545 wants in UTC
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    host = request.host.split(":")[0]
+    yield "".join(_ics_line(line) for line in [
+        "BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Firevents//Events//EN", "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH", "X-WR-CALNAME:Firevents",
+    ])
+    for row in rows:
+        yield "".join(_ics_line(line) for line in [
+            "BEGIN:VEVENT",
+            f"UID:event-{row.id}@{host}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{_ics_time(row.date_time)}",
+            f"DTEND:{_ics_time(row.ends_at)}",
+            f"SUMMARY:{_ics_text(row.title)}",
+            f"DESCRIPTION:{_ics_text(row.description)}",
+            f"LOCATION:{_ics_text(f'{row.venue_name}, {row.venue_location}')}",
+            f"CATEGORIES:{_ics_text(row.category)}",
+            f"URL:{url_for('events.event_detail', event_id=row.id, _external=True)}",
+            f"STATUS:{'CANCELLED' if row.status == 'Cancelled' else 'CONFIRMED'}",
+            "END:VEVENT",
+        ])
+    yield _ics_line("END:VCALENDAR")
+
+
+# Calendars poll the feed, a minute's caching spares the database most of that
+CACHE_HEADERS = {"Cache-Control": "public, max-age=60"}
+
+
+@feed_bp.route("/events/feed")
+def events_json():
+    rows, more = _slice()
+    return Response(stream_with_context(_json_chunks(rows, more)), mimetype="application/json",
+                    headers=CACHE_HEADERS)
+
+
+@feed_bp.route("/events/feed.ics")
+def events_ics():
+    rows, _ = _slice(paged=False)
+    return Response(
+        stream_with_context(_ics_chunks(rows)),
+        mimetype="text/calendar",
+        headers={**CACHE_HEADERS, "Content-Disposition": "inline; filename=firevents.ics"},
+    )
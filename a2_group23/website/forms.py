@@ -7,6 +7,12 @@ import datetime
 
 ALLOWED_FILE = {"png", "jpg", "jpeg", "gif", "PNG", "JPG", "JPEG", "GIF"}
 
+# Music genres an event can be listed under
+CATEGORIES = ["Jazz", "Hip-Hop", "House", "Classical", "Rock", "Electronic", "Indie"]
+
+# Events have to be created at least this long before they start
+MIN_LEAD_TIME = datetime.timedelta(hours=5)
+
 
 
 # creates the login information
@@ -45,7 +51,7 @@ class TicketForm(FlaskForm):
 class EventForm(FlaskForm):
     title = StringField('Title', validators=[DataRequired(), Length(max=100)])
     description = TextAreaField('Description', validators=[DataRequired(), Length(max=500)])
-    category = SelectField("Category", choices=[("", "Select a genre"),("Jazz", "Jazz"), ("Hip-Hop", "Hip-Hop"), ("House", "House"), ("Classical", "Classical"), ("Rock", "Rock"), ("Electronic", "Electronic"), ("Indie", "Indie")], validators=[DataRequired(message="please select a genre")])
+    category = SelectField("Category", choices=[("", "Select a genre")] + [(c, c) for c in CATEGORIES], validators=[DataRequired(message="please select a genre")])
     date_time = DateTimeLocalField('Event Date & Time', format='%Y-%m-%dT%H:%M', validators=[DataRequired()])
     duration = IntegerField('Event Duration (minutes)', validators=[DataRequired(), NumberRange(min=1)])
     image = FileField('Event Image', validators=[FileAllowed(['jpg', 'jpeg', 'png', 'gif'], 'Images only!')])
@@ -0,0 +1,93 @@
+# website/identity.py
+# Who is logged in, without a query on every request. Flask-Login calls load_user() for every
+# request from a logged-in user, and it used to SELECT the whole user row each time. Now each
+# worker keeps a small copy of the user (id, name, email, phone, role) for IDENTITY_CACHE_TTL
+# seconds and only goes to the database when that copy is missing or out of date.
+#
+# "Out of date" is decided with a stamp: a short hash of the user's details and password hash.
+# The stamp the browser last saw is kept in its session. When the profile or password changes,
+# the stamp in the database no longer matches the cached one, edit_profile() drops this
+# worker's copy and stores the new stamp in the session, so every worker that sees that stamp
+# and has an older copy loads the user again. Other workers may show the old name for up to
+# the TTL to *other* browsers of the same user, which is fine for a name.
+import hashlib
+
+from flask import session
+from flask_login import UserMixin
+
+from . import db
+from .cache import MemoryBackend
+from .models import User
+
+SESSION_KEY = "_identity"
+
+
+class Identity(UserMixin):
+    """What the pages need to know about the logged-in user. A plain object, not a database row,
+    so it can be shared between requests - load the User when something needs changing."""
+
+    def __init__(self, id, name, email, phone, role, stamp):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.phone = phone
+        self.role = role
+        self.stamp = stamp
+
+    def __repr__(self):
+        return f"<Identity {self.email}>"
+
+
+def _stamp(row):
+    details = "\0".join(str(value) for value in (row.name, row.email, row.phone, row.role, row.password_hash))
+    return hashlib.sha256(details.encode()).hexdigest()[:16]
+
+
+class IdentityCache:
+    def __init__(self):
+        self.backend = MemoryBackend(max_entries=10000)
+        self.ttl = 60
+
+    def init_app(self, app):
+        app.config.setdefault("IDENTITY_CACHE_TTL", 60)  # 0 turns the cache off
+        self.ttl = app.config["IDENTITY_CACHE_TTL"]
+        app.extensions["identity_cache"] = self
+
+    def fetch(self, user_id):
+        """Reads the user from the database and caches it. None if there is no such user."""
+        row = db.session.execute(
+            db.select(User.id, User.name, User.email, User.phone, User.role, User.password_hash)
+            .where(User.id == user_id)
+        ).one_or_none()
+        if row is None:
+            self.forget(user_id)
+            return None
+        identity = Identity(row.id, row.name, row.email, row.phone, row.role, _stamp(row))
+        if self.ttl:
+            self.backend.set(int(user_id), identity, self.ttl)
+        return identity
+
+    def load(self, user_id):
+        """For Flask-Login's user_loader."""
+        try:
+            user_id = int(user_id)
+        except ValueError:  # a tampered session
+            return None
+        cached = self.backend.get(user_id) if self.ttl else None
+        if cached is not None and cached.stamp == session.get(SESSION_KEY):
+            return cached
+        identity = self.fetch(user_id)
+        if identity is not None and session.get(SESSION_KEY) != identity.stamp:
+            session[SESSION_KEY] = identity.stamp
+        return identity
+
+    def forget(self, user_id):
+        self.backend.delete(int(user_id))
+
+    def changed(self, user):
+        """Call after committing changes to `user` (a User row) made by its own session."""
+        self.forget(user.id)
+        session[SESSION_KEY] = _stamp(user)
+
+
+identity_cache = IdentityCache()
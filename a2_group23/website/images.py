@@ -0,0 +1,170 @@
+# website/images.py
+# Smaller copies ("variants") of the uploaded event images. Uploads are often multi-megabyte
+# photos straight off a camera, and the home page used to send those as card thumbnails.
+# After an upload we make a few width-bounded copies in WebP and JPEG:
+#   thumb - 320px wide (tables, booking history)
+#   card  - 640px wide (event cards on the home page)
+#   hero  - 1280px wide (top of the event page)
+# and the templates offer them with srcset so the browser picks the smallest one that fits.
+#
+# Resizing takes a while, so it is a background job (jobs.py), queued with the event it belongs to
+# and run after the request has returned. Until the copies exist (or if Pillow isn't installed)
+# the pages simply show the original. `flask images build` makes them on a thread pool instead.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+
+from .jobs import enqueue, task
+from .storage import collect_garbage, image_storage, rehash_legacy
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, without it only the originals are served
+    Image = None
+
+VARIANTS = {"thumb": 320, "card": 640, "hero": 1280}
+FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+VARIANT_DIR = "variants"  # inside the upload folder
+
+_pool = None
+_pool_lock = threading.Lock()
+_ready = set()  # images whose variants are known to exist (saves a stat per card)
+
+
+def variant_path(filename, variant, ext):
+    """Path of a variant relative to the upload folder, e.g. variants/ab12_gig-card.webp"""
+    stem = filename.rsplit(".", 1)[0]
+    return f"{VARIANT_DIR}/{stem}-{variant}.{ext}"
+
+
+def make_variants(folder, filename):
+    """Writes every variant of one image. Returns False if Pillow is missing or it isn't an image."""
+    if Image is None:
+        return False
+    try:
+        with Image.open(os.path.join(folder, filename)) as original:
+            original = ImageOps.exif_transpose(original)  # phones store rotation separately
+            if original.mode not in ("RGB", "L"):
+                original = original.convert("RGB")  # JPEG has no alpha channel
+            os.makedirs(os.path.join(folder, VARIANT_DIR), exist_ok=True)
+            for variant, width in VARIANTS.items():
+                copy = original.copy()
+                copy.thumbnail((width, width * 4))  # only ever shrinks, keeps the aspect ratio
+                for ext, fmt in FORMATS.items():
+                    target = os.path.join(folder, variant_path(filename, variant, ext))
+                    # Write then rename, so a page never links to a half-written file
+                    tmp = f"{target}.{os.getpid()}.tmp"
+                    if fmt == "JPEG":
+                        copy.save(tmp, fmt, quality=82, optimize=True, progressive=True)
+                    else:
+                        copy.save(tmp, fmt, quality=80, method=4)
+                    os.replace(tmp, target)
+    except (OSError, ValueError):  # missing, truncated or not an image at all
+        return False
+    _ready.add(filename)
+    return True
+
+
+def remove_variants(folder, filename):
+    _ready.discard(filename)
+    for variant in VARIANTS:
+        for ext in FORMATS:
+            try:
+                os.remove(os.path.join(folder, variant_path(filename, variant, ext)))
+            except OSError:
+                pass
+
+
+def _executor(app):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=app.config["IMAGE_WORKERS"], thread_name_prefix="image-variants"
+            )
+        return _pool
+
+
+def queue_variants(filename):
+    """Queues a job making the variants, in the current transaction. Returns False if there is
+    nothing to do (Pillow missing, variants already there) or it's already queued."""
+    if Image is None or not filename or has_variants(filename):
+        return False  # identical uploads share a file, so their variants may already be there
+    return enqueue("image_variants", key=f"image_variants:{filename}", filename=filename)
+
+
+@task("image_variants")
+def _variants_job(filename):
+    # Raising makes the job runner try again later, and keep the error if it never works
+    if not has_variants(filename) and not make_variants(current_app.config["UPLOAD_FOLDER"], filename):
+        raise RuntimeError(f"Could not make the variants of {filename}")
+
+
+def has_variants(filename):
+    if filename in _ready:
+        return True
+    # The last file written is the largest JPEG, so if that's there they all are
+    last = list(VARIANTS)[-1]
+    if os.path.exists(os.path.join(current_app.config["UPLOAD_FOLDER"], variant_path(filename, last, "jpg"))):
+        _ready.add(filename)
+        return True
+    return False
+
+
+def image_srcset(filename, ext="jpg"):
+    """srcset value listing every variant of an image in one format ("" if there are none yet)."""
+    if not filename or not has_variants(filename):
+        return ""
+    return ", ".join(
+        f"{url_for('static', filename='images/' + variant_path(filename, variant, ext))} {width}w"
+        for variant, width in VARIANTS.items()
+    )
+
+
+def image_url(filename, variant="card"):
+    """URL of one JPEG variant, or of the original while the variants are still being made."""
+    if filename and has_variants(filename):
+        return url_for("static", filename="images/" + variant_path(filename, variant, "jpg"))
+    return url_for("static", filename="images/" + filename)
+
+
+# flask images build / gc / rehash
+images_cli = AppGroup("images", help="Event image variants and storage.")
+
+
+@images_cli.command("build")
+@click.option("--force", is_flag=True, help="Remake variants that already exist.")
+def build_command(force):
+    """Makes variants for images uploaded before they existed."""
+    if Image is None:
+        raise click.ClickException("Pillow is not installed (pip install pillow).")
+    folder = current_app.config["UPLOAD_FOLDER"]
+    names = sorted(image_storage().names())
+    if not force:
+        names = [name for name in names if not has_variants(name)]
+
+    pool = _executor(current_app)
+    made = sum(pool.map(lambda name: make_variants(folder, name), names))
+    click.echo(f"Made variants for {made} of {len(names)} images.")
+
+
+@images_cli.command("gc")
+@click.option("--grace", default=60, show_default=True, help="Keep unused images younger than this many minutes.")
+@click.option("--dry-run", is_flag=True, help="Only list what would be removed.")
+def gc_command(grace, dry_run):
+    """Removes uploaded images that no event uses any more."""
+    orphans = collect_garbage(grace * 60, dry_run)
+    for name in orphans:
+        click.echo(name)
+    click.echo(f"{'Would remove' if dry_run else 'Removed'} {len(orphans)} unused images.")
+
+
+@images_cli.command("rehash")
+def rehash_command():
+    """Renames old uploads to content-addressed names (run gc afterwards to drop the old files)."""
+    renamed = rehash_legacy()
+    click.echo(f"Rehashed {len(renamed)} images into {len(set(renamed.values()))} files.")
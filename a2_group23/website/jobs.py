@@ -0,0 +1,273 @@
+# website/jobs.py
+# Work that doesn't have to happen before the response goes back, like resizing an uploaded
+# image. A view queues it with enqueue() before it commits, so the job is saved in the same
+# transaction as the change it belongs to: if the request fails there is no job, and if the
+# process dies before running it the job is still in the table.
+#
+#   @task("name")                        - makes a function a job type
+#   enqueue("name", key=..., **kwargs)   - queues it; a job with the same key is only queued once
+#   job_runner                           - JOB_WORKERS threads per process that run due jobs
+#   flask jobs run                       - a worker process of its own (or --once to empty the queue)
+#   flask jobs status / retry            - what's in the queue, and requeue the failed jobs
+#
+# A job that raises is tried again after JOB_RETRY_SECONDS, doubling every time, until it has
+# had JOB_MAX_ATTEMPTS tries; then it stays "failed" with its error. A worker holds a job for
+# JOB_LEASE_SECONDS, and if it dies meanwhile someone else picks the job up again after that -
+# so a job can run twice and should be safe to. Every claim adds one to the job's attempts, and
+# a worker only records how the job went if attempts is still the number it claimed it with, so
+# one that overran its lease can't overwrite what the worker that took over has done.
+#
+# The in-process threads start with the first job a process queues (not under TESTING - call
+# run_pending() there). Jobs left from before a restart, and retries, are run by whichever
+# worker is polling: the in-process threads once started, or `flask jobs run`.
+# Finished jobs (and their keys) are kept for JOB_KEEP_HOURS, then deleted.
+import json
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event as sa_event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import Job
+
+TASKS = {}  # name -> function
+
+jobs = Job.__table__
+DUE = ["queued", "running"]  # running ones are due again when their lease runs out
+
+
+def task(name):
+    """Registers a job type. The function is called with the job's keyword arguments inside an
+    app context, and the session is committed after it returns."""
+    def decorator(fn):
+        TASKS[name] = fn
+        return fn
+    return decorator
+
+
+def enqueue(name, key=None, delay=0, **kwargs):
+    """Queues a job in the current transaction - it can run once that commits. Returns False
+    (and queues nothing) if a job with the same key is already there."""
+    if name not in TASKS:
+        raise ValueError(f"No job called {name!r}")
+    now = datetime.utcnow()
+    row = {
+        "name": name, "payload": json.dumps(kwargs), "key": key, "status": "queued",
+        "attempts": 0, "run_at": now + timedelta(seconds=delay), "created_at": now,
+    }
+    conn = db.session.connection()
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(conn.dialect.name)
+    if key is None:
+        stmt = jobs.insert()
+    elif dialect is not None:
+        stmt = dialect.insert(jobs).on_conflict_do_nothing(index_elements=["key"])
+    else:
+        if conn.scalar(db.select(jobs.c.id).where(jobs.c.key == key)) is not None:
+            return False
+        stmt = jobs.insert()
+    queued = conn.execute(stmt, row).rowcount == 1
+    if queued:
+        db.session.info["jobs_queued"] = True
+    return queued
+
+
+# Wakes the workers as soon as the transaction with the new jobs commits
+@sa_event.listens_for(Session, "after_commit")
+def _jobs_committed(session):
+    if session.info.pop("jobs_queued", False):
+        job_runner.wake()
+
+
+@sa_event.listens_for(Session, "after_rollback")
+def _jobs_rolled_back(session):
+    session.info.pop("jobs_queued", None)
+
+
+# -- running jobs --
+
+def _claim(now):
+    """Takes the next due job for this worker. Returns (id, attempt), or None if nothing is due.
+    Two workers can pick the same job, but only one of them gets it: the UPDATE only
+    matches if nobody took the job in the meantime."""
+    lease = timedelta(seconds=current_app.config["JOB_LEASE_SECONDS"])
+    candidates = db.session.execute(
+        db.select(jobs.c.id, jobs.c.attempts).where(jobs.c.status.in_(DUE), jobs.c.run_at <= now)
+        .order_by(jobs.c.run_at).limit(5)
+    ).all()
+    for job_id, attempts in candidates:
+        taken = db.session.execute(
+            jobs.update()
+            .where(jobs.c.id == job_id, jobs.c.status.in_(DUE), jobs.c.run_at <= now,
+                   jobs.c.attempts == attempts)
+            .values(status="running", run_at=now + lease, attempts=attempts + 1)
+        )
+        db.session.commit()
+        if taken.rowcount == 1:
+            return job_id, attempts + 1
+    return None
+
+
+def _finish(job_id, attempt, **values):
+    """Records how the job went, if this worker still has it. Returns False if it doesn't."""
+    finished = db.session.execute(
+        jobs.update()
+        .where(jobs.c.id == job_id, jobs.c.status == "running", jobs.c.attempts == attempt)
+        .values(**values)
+    )
+    db.session.commit()
+    if finished.rowcount != 1:
+        current_app.logger.warning("Job %s: lease ran out before attempt %s finished, left as it is", job_id, attempt)
+        return False
+    return True
+
+
+def run_job(job_id, attempt):
+    """Runs one claimed job and records how it went. Returns True if it succeeded."""
+    job = db.session.execute(db.select(jobs).where(jobs.c.id == job_id)).one()
+    config = current_app.config
+    try:
+        TASKS[job.name](**json.loads(job.payload))
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        error = f"{type(exc).__name__}: {exc}"
+        if attempt >= config["JOB_MAX_ATTEMPTS"]:
+            current_app.logger.error("Job %s (%s) failed for good: %s", job.id, job.name, error)
+            _finish(job_id, attempt, status="failed", last_error=error, run_at=datetime.utcnow())
+        else:
+            backoff = config["JOB_RETRY_SECONDS"] * 2 ** (attempt - 1)
+            current_app.logger.warning("Job %s (%s) failed, retrying in %ss: %s", job.id, job.name, backoff, error)
+            _finish(job_id, attempt, status="queued", last_error=error,
+                    run_at=datetime.utcnow() + timedelta(seconds=backoff))
+        return False
+    return _finish(job_id, attempt, status="done", run_at=datetime.utcnow())
+
+
+def run_next():
+    """Claims and runs the next due job. Returns False if there was none."""
+    claimed = _claim(datetime.utcnow())
+    if claimed is None:
+        return False
+    run_job(*claimed)
+    return True
+
+
+def run_pending(limit=None):
+    """Runs due jobs in this thread until there are none left (or `limit` have run)."""
+    ran = 0
+    while (limit is None or ran < limit) and run_next():
+        ran += 1
+    return ran
+
+
+def purge_finished(now=None):
+    """Deletes the jobs that finished over JOB_KEEP_HOURS ago (failed ones stay)."""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(hours=current_app.config["JOB_KEEP_HOURS"])
+    deleted = db.session.execute(jobs.delete().where(jobs.c.status == "done", jobs.c.run_at < cutoff))
+    db.session.commit()
+    return deleted.rowcount
+
+
+class JobRunner:
+    """The worker threads of one process."""
+
+    def __init__(self):
+        self.app = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def init_app(self, app):
+        app.config.setdefault("JOB_WORKERS", 2)  # 0 = only `flask jobs run` runs jobs
+        app.config.setdefault("JOB_POLL_SECONDS", 5)
+        app.config.setdefault("JOB_MAX_ATTEMPTS", 5)
+        app.config.setdefault("JOB_RETRY_SECONDS", 30)
+        app.config.setdefault("JOB_LEASE_SECONDS", 300)
+        app.config.setdefault("JOB_KEEP_HOURS", 24)
+        self.app = app
+        app.extensions["job_runner"] = self
+
+    def start(self, app, workers):
+        with self._lock:
+            if self._threads:
+                return self._threads
+            for i in range(workers):
+                thread = threading.Thread(target=self._work, args=(app,), name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self._threads
+
+    def wake(self):
+        app = self.app
+        if not self._threads and app is not None and app.config["JOB_WORKERS"] and not app.testing:
+            self.start(app, app.config["JOB_WORKERS"])
+        self._wake.set()
+
+    def _work(self, app):
+        poll = app.config["JOB_POLL_SECONDS"]
+        purged_at = None
+        while True:
+            ran = False
+            with app.app_context():
+                try:
+                    ran = run_next()
+                    if purged_at is None or datetime.utcnow() - purged_at > timedelta(hours=1):
+                        purged_at = datetime.utcnow()
+                        purge_finished()
+                except Exception:
+                    app.logger.exception("Job worker failed")
+                    db.session.rollback()
+            if not ran:
+                self._wake.wait(poll)
+                self._wake.clear()
+
+
+job_runner = JobRunner()
+
+
+# flask jobs run / status / retry
+jobs_cli = AppGroup("jobs", help="Background jobs.")
+
+
+@jobs_cli.command("run")
+@click.option("--workers", default=2, show_default=True, help="Jobs run at the same time.")
+@click.option("--once", is_flag=True, help="Run the jobs that are due, then stop.")
+def run_command(workers, once):
+    """Runs queued jobs until stopped (Ctrl-C)."""
+    if once:
+        click.echo(f"Ran {run_pending()} jobs.")
+        return
+    app = current_app._get_current_object()
+    click.echo(f"Running jobs with {workers} workers ({', '.join(sorted(TASKS))}).")
+    for thread in job_runner.start(app, workers):
+        thread.join()
+
+
+@jobs_cli.command("status")
+def status_command():
+    """How many jobs are in each state, and the latest failures."""
+    for status, count in db.session.execute(
+        db.select(jobs.c.status, db.func.count()).group_by(jobs.c.status).order_by(jobs.c.status)
+    ):
+        click.echo(f"{status:<8}{count:>8}")
+    for job in db.session.execute(
+        db.select(jobs).where(jobs.c.status == "failed").order_by(jobs.c.run_at.desc()).limit(10)
+    ):
+        click.echo(f"#{job.id} {job.name} {job.payload} after {job.attempts} tries: {job.last_error}")
+
+
+@jobs_cli.command("retry")
+def retry_command():
+    """Queues the failed jobs again."""
+    requeued = db.session.execute(
+        jobs.update().where(jobs.c.status == "failed")
+        .values(status="queued", attempts=0, run_at=datetime.utcnow())
+    )
+    db.session.commit()
+    click.echo(f"Queued {requeued.rowcount} failed jobs again.")
@@ -0,0 +1,206 @@
+# website/metrics.py
+# Where the time goes in each request. For every request we record:
+#   - wall time
+#   - how many SQL statements ran and how long the database took (SQLAlchemy cursor events)
+#   - how long the Jinja templates took to render
+# Each response carries them in a Server-Timing header, so they show up in the browser's dev
+# tools (Network tab -> Timing), and each request is logged as one JSON line to the
+# "website.requests" logger. Totals and latency histograms per endpoint are served at /metrics
+# in the Prometheus text format. Any statement slower than SLOW_QUERY_MS is logged with its SQL
+# and row count to "website.slow_queries". The values bound to it are left out - they include
+# password hashes, emails and phone numbers - unless SLOW_QUERY_PARAMS is turned on (for
+# working on the site locally).
+#
+# The numbers are kept per process, so under gunicorn every worker reports its own and
+# Prometheus adds them up.
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, abort, g, has_request_context, request, before_render_template, template_rendered
+from flask_login import current_user
+from sqlalchemy import event as sa_event
+
+from . import db
+
+request_log = logging.getLogger("website.requests")
+slow_query_log = logging.getLogger("website.slow_queries")
+
+# Upper bounds of the latency histogram buckets, in seconds (Prometheus' defaults)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = defaultdict(int)  # (method, status) -> count
+        self.buckets = [0] * len(BUCKETS)
+        self.seconds = 0.0
+        self.count = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+
+    def add(self, method, status, seconds, queries, db_seconds, render_seconds):
+        self.requests[(method, status)] += 1
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+        self.seconds += seconds
+        self.count += 1
+        self.queries += queries
+        self.db_seconds += db_seconds
+        self.render_seconds += render_seconds
+
+
+class Metrics:
+    def __init__(self):
+        self.endpoints = defaultdict(EndpointStats)
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+        self.slow_query_seconds = 0.1
+        self.log_params = False
+
+    def init_app(self, app):
+        app.config.setdefault("INSTRUMENTATION", True)
+        app.config.setdefault("SLOW_QUERY_MS", 100)
+        app.config.setdefault("SLOW_QUERY_PARAMS", False)
+        if not app.config["INSTRUMENTATION"]:
+            return
+        self.slow_query_seconds = app.config["SLOW_QUERY_MS"] / 1000
+        self.log_params = app.config["SLOW_QUERY_PARAMS"]
+
+        with app.app_context():
+            sa_event.listen(db.engine, "before_cursor_execute", self._before_cursor_execute)
+            sa_event.listen(db.engine, "after_cursor_execute", self._after_cursor_execute)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule("/metrics", "metrics", self.view)
+        app.extensions["metrics"] = self
+
+    # -- collecting --
+
+    def _start_request(self):
+        g.metrics = {"start": time.perf_counter(), "queries": 0, "db": 0.0, "render": 0.0}
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        current = g.get("metrics") if has_request_context() else None
+        if current is not None:
+            current["queries"] += 1
+            current["db"] += elapsed
+        if elapsed >= self.slow_query_seconds:
+            with self._lock:
+                self.slow_queries += 1
+            entry = {
+                "ms": round(elapsed * 1000, 1),
+                "endpoint": request.endpoint if has_request_context() else None,
+                "sql": statement,
+                # -1 for SELECTs on most drivers: the count is only known once the rows are read
+                "rows": cursor.rowcount,
+            }
+            if executemany:
+                entry["batch"] = len(parameters)
+            if self.log_params:
+                entry["params"] = parameters if not executemany else parameters[:10]
+            slow_query_log.warning(json.dumps(entry, default=str))
+
+    def _before_render(self, app, template, context, **extra):
+        if "metrics" in g:
+            g.metrics["render_start"] = time.perf_counter()
+
+    def _after_render(self, app, template, context, **extra):
+        if "metrics" in g and "render_start" in g.metrics:
+            g.metrics["render"] += time.perf_counter() - g.metrics.pop("render_start")
+
+    def _finish_request(self, response):
+        current = g.pop("metrics", None)
+        if current is None:
+            return response
+        total = time.perf_counter() - current["start"]
+        # Unmatched URLs (404s) are lumped together so random paths can't create endless series
+        endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={current["db"] * 1000:.1f};desc="{current["queries"]} queries", '
+            f'render;dur={current["render"] * 1000:.1f}, total;dur={total * 1000:.1f}',
+        )
+        request_log.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "endpoint": endpoint,
+            "status": response.status_code,
+            "ms": round(total * 1000, 1),
+            "queries": current["queries"],
+            "db_ms": round(current["db"] * 1000, 1),
+            "render_ms": round(current["render"] * 1000, 1),
+        }))
+        with self._lock:
+            self.endpoints[endpoint].add(
+                request.method, response.status_code, total,
+                current["queries"], current["db"], current["render"],
+            )
+        return response
+
+    # -- /metrics --
+
+    def render(self):
+        """Everything collected so far in the Prometheus text format."""
+        lines = [
+            "# HELP http_requests_total Requests handled.",
+            "# TYPE http_requests_total counter",
+        ]
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            for name, stats in endpoints:
+                for (method, status), count in sorted(stats.requests.items()):
+                    lines.append(f'http_requests_total{{endpoint="{name}",method="{method}",status="{status}"}} {count}')
+
+            lines += [
+                "# HELP http_request_duration_seconds Time from the start of the request to the response.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for name, stats in endpoints:
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    lines.append(f'http_request_duration_seconds_bucket{{endpoint="{name}",le="{bound}"}} {count}')
+                lines.append(f'http_request_duration_seconds_bucket{{endpoint="{name}",le="+Inf"}} {stats.count}')
+                lines.append(f'http_request_duration_seconds_sum{{endpoint="{name}"}} {stats.seconds:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{endpoint="{name}"}} {stats.count}')
+
+            for metric, kind, help_text, attr in (
+                ("db_queries_total", "counter", "SQL statements run while handling requests.", "queries"),
+                ("db_time_seconds_total", "counter", "Time spent waiting for the database.", "db_seconds"),
+                ("template_render_seconds_total", "counter", "Time spent rendering templates.", "render_seconds"),
+            ):
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+                for name, stats in endpoints:
+                    value = getattr(stats, attr)
+                    value = f"{value:.6f}" if isinstance(value, float) else value
+                    lines.append(f'{metric}{{endpoint="{name}"}} {value}')
+
+            lines += [
+                "# HELP db_slow_queries_total Statements slower than SLOW_QUERY_MS.",
+                "# TYPE db_slow_queries_total counter",
+                f"db_slow_queries_total {self.slow_queries}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def view(self):
+        # For the Prometheus scraper on the same machine, or an admin having a look. Behind a
+        # reverse proxy every request comes from 127.0.0.1 unless TRUSTED_PROXIES is set
+        # (config.py), so set it - or block /metrics at the proxy.
+        if request.remote_addr not in ("127.0.0.1", "::1") and not (
+            current_user.is_authenticated and current_user.role == "admin"
+        ):
+            abort(404)
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+metrics = Metrics()
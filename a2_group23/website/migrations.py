@@ -0,0 +1,258 @@
+# website/migrations.py
+# db.create_all() only creates tables that are missing, it never changes a table that
+# already exists. So anything that alters an existing table (like instance/sitedata.sqlite)
+# goes here as a numbered step. Steps are written so they are also safe on a brand new database.
+#
+#   flask db upgrade         - run any migrations that haven't been applied (also done at startup)
+#   flask db check-indexes   - EXPLAIN the hot queries and fail if any of them scans a whole table
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect, text
+
+from . import db
+
+
+def _columns(conn, table):
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+# 1 - Seat counters on event, filled in from the confirmed bookings.
+def _event_seat_counters(conn):
+    columns = _columns(conn, "event")
+    if "seats_sold" not in columns:
+        conn.execute(text("ALTER TABLE event ADD COLUMN seats_sold INTEGER NOT NULL DEFAULT 0"))
+    if "seats_remaining" not in columns:
+        conn.execute(text("ALTER TABLE event ADD COLUMN seats_remaining INTEGER NOT NULL DEFAULT 0"))
+
+    conn.execute(text(
+        "UPDATE event SET seats_sold = ("
+        " SELECT COALESCE(SUM(b.no_of_tickets), 0) FROM booking b"
+        " WHERE b.event_id = event.id AND b.booking_status = 'Confirmed')"
+    ))
+    conn.execute(text(
+        "UPDATE event SET seats_remaining ="
+        " CASE WHEN ticket_quantity > seats_sold THEN ticket_quantity - seats_sold ELSE 0 END"
+    ))
+
+
+# 2 - Expiry time for Pending bookings (seat holds).
+def _booking_hold_expiry(conn):
+    if "expires_at" not in _columns(conn, "booking"):
+        conn.execute(text("ALTER TABLE booking ADD COLUMN expires_at TIMESTAMP"))
+
+
+# 3 - Full-text search index over events (see search.py).
+def _event_search_index(conn):
+    from .search import install, rebuild
+    if install(conn):
+        rebuild(conn)
+
+
+def _create_indexes(conn, *models):
+    """Creates any indexes declared on the models that the database doesn't have yet. Indexes on
+    columns that a later step adds are left for that step."""
+    for model in models:
+        columns = _columns(conn, model.__tablename__)
+        for index in model.__table__.indexes:
+            if all(column.name in columns for column in index.columns):
+                index.create(conn, checkfirst=True)
+
+
+# 4 - Indexes for the hot queries (declared in models.py).
+def _hot_query_indexes(conn):
+    from .models import Booking, Comment, Event, User
+    _create_indexes(conn, User, Event, Comment, Booking)
+
+
+# 5 - Index for adding up confirmed sales by date (reports.py). The daily_sales table itself
+# is new, so create_all() makes it.
+def _sales_report_index(conn):
+    from .models import Booking
+    _create_indexes(conn, Booking)
+
+
+# 6 - Index for a venue's events in date order (the feed in feed.py).
+def _event_venue_index(conn):
+    from .models import Event
+    _create_indexes(conn, Event)
+
+
+# 7 - When each event ends, so overlapping events at a venue can be found with an index
+# (schedule.py). Events without a duration count as DEFAULT_DURATION (2 hours).
+def _event_ends_at(conn):
+    from .models import Event
+    if "ends_at" not in _columns(conn, "event"):
+        conn.execute(text("ALTER TABLE event ADD COLUMN ends_at TIMESTAMP"))
+    if conn.dialect.name == "sqlite":
+        ends = "datetime(date_time, '+' || COALESCE(duration_minutes, 120) || ' minutes')"
+    else:
+        ends = "date_time + COALESCE(duration_minutes, 120) * INTERVAL '1 minute'"
+    conn.execute(text(f"UPDATE event SET ends_at = {ends} WHERE ends_at IS NULL"))
+    _create_indexes(conn, Event)
+
+
+# 8 - Upcoming events per genre and venue (counts.py). The tables are new, so create_all()
+# makes them, this fills them in.
+def _event_counts(conn):
+    from .counts import recount
+    recount(conn)
+
+
+# 9 - Number of comments on each event, counted from the comments there are.
+def _event_comment_count(conn):
+    if "comment_count" not in _columns(conn, "event"):
+        conn.execute(text("ALTER TABLE event ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0"))
+    conn.execute(text(
+        "UPDATE event SET comment_count = (SELECT COUNT(*) FROM comment c WHERE c.event_id = event.id)"
+    ))
+
+
+# (version, description, step) - only ever append to this list.
+MIGRATIONS = [
+    (1, "event seat counters", _event_seat_counters),
+    (2, "booking hold expiry", _booking_hold_expiry),
+    (3, "event search index", _event_search_index),
+    (4, "hot query indexes", _hot_query_indexes),
+    (5, "sales report index", _sales_report_index),
+    (6, "event venue index", _event_venue_index),
+    (7, "event end times", _event_ends_at),
+    (8, "event counts", _event_counts),
+    (9, "event comment count", _event_comment_count),
+]
+
+
+MIGRATION_LOCK = 20240601  # Postgres advisory lock id, any number nothing else uses
+MIGRATION_WAIT_MS = 10 * 60 * 1000  # how long a worker waits for another one's migration
+
+
+def _lock_schema(conn):
+    """Makes the other workers starting at the same time wait until this upgrade is committed.
+
+    Every gunicorn worker runs upgrade() when it starts. Without the lock two of them can both
+    see a step as not done, and the second fails halfway through it (e.g. "duplicate column").
+    On SQLite BEGIN IMMEDIATE takes the write lock for the whole upgrade - without it the ALTER
+    TABLEs would run outside any transaction. Postgres has transactional DDL, and an advisory
+    lock that is let go at commit.
+    """
+    if conn.dialect.name == "sqlite":
+        # A long backfill takes longer than the usual busy_timeout, so wait longer here
+        default_wait = conn.exec_driver_sql("PRAGMA busy_timeout").scalar()
+        conn.exec_driver_sql(f"PRAGMA busy_timeout = {MIGRATION_WAIT_MS}")
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        finally:
+            conn.exec_driver_sql(f"PRAGMA busy_timeout = {int(default_wait)}")
+    elif conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK})
+
+
+def upgrade(engine):
+    """Runs every migration newer than the version recorded in the database, all in one
+    transaction that only one process at a time gets to run."""
+    from . import models  # noqa: F401 - every table has to be in db.metadata for create_all
+
+    with engine.begin() as conn:
+        _lock_schema(conn)
+        # New tables first (create_all never changes a table that is already there). Under the
+        # lock too, so two workers don't both try to create the same one
+        db.metadata.create_all(conn)
+        # Read after taking the lock, so a worker that waited sees what the first one did
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+        current = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+        for version, _description, step in MIGRATIONS:
+            if version > current:
+                step(conn)
+                conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": version})
+
+
+# ---- Query plan check -------------------------------------------------------------------------
+
+def _hot_queries():
+    """The queries every busy page runs, written the same way the views build them."""
+    from .models import Booking, Comment, Event, Job, User, local_now
+
+    now = local_now()
+    by_date = [Event.date_time, Event.id]
+    return {
+        "home page": db.select(Event).where(Event.date_time >= now).order_by(*by_date).limit(25),
+        "home page, later page": db.select(Event)
+            .where(Event.date_time >= now, db.tuple_(*by_date) > db.tuple_(now, 1)).order_by(*by_date).limit(25),
+        "genre filter": db.select(Event).where(Event.category == "Jazz", Event.date_time >= now)
+            .order_by(*by_date).limit(25),
+        "feed, date range": db.select(Event).where(Event.date_time >= now, Event.date_time < now)
+            .order_by(*by_date).limit(101),
+        "feed, venue": db.select(Event).where(Event.venue_id == 1, Event.date_time >= now)
+            .order_by(*by_date).limit(101),
+        "genre counts, since the mark": db.select(Event.category, Event.venue_id, db.func.count())
+            .where(Event.date_time >= now, Event.date_time < now).group_by(Event.category, Event.venue_id),
+        "venue overlap check": db.select(Event.id)
+            .where(Event.venue_id == 1, Event.ends_at > now, Event.date_time < now).limit(3),
+        "my events": db.select(Event).where(Event.owner_id == 1)
+            .order_by(Event.date_time.desc(), Event.id.desc()).limit(25),
+        "my bookings": db.select(Booking).where(Booking.user_id == 1).order_by(Booking.id.desc()).limit(25),
+        "event bookings": db.select(Booking).where(Booking.event_id == 1, Booking.booking_status == "Confirmed"),
+        "event comments": db.select(Comment).where(Comment.event_id == 1)
+            .order_by(Comment.posted_date.desc()).limit(20),
+        "login": db.select(User).where(User.name == "admin"),
+        "recent sales": db.select(Booking.event_id, db.func.sum(Booking.total_price))
+            .where(Booking.booking_status == "Confirmed", Booking.booking_date >= now).group_by(Booking.event_id),
+        "expired holds": db.select(Booking.id).where(Booking.booking_status == "Pending", Booking.expires_at <= now)
+            .order_by(Booking.expires_at).limit(500),
+        "next jobs due": db.select(Job.id).where(Job.status.in_(["queued", "running"]), Job.run_at <= now)
+            .order_by(Job.run_at).limit(5),
+    }
+
+
+def _is_full_scan(dialect, line):
+    if dialect == "sqlite":
+        # e.g. "SCAN event" is a full scan, "SCAN event USING INDEX ix_..." walks an index
+        return line.startswith("SCAN ") and " USING " not in line and "VIRTUAL TABLE" not in line
+    return "Seq Scan" in line
+
+
+def full_scans(conn):
+    """EXPLAINs every hot query. Returns {name: plan lines} for the ones that scan a whole table."""
+    dialect = conn.dialect.name
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    failures = {}
+    for name, stmt in _hot_queries().items():
+        compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})  # IN lists as plain values
+        params = compiled.params
+        if compiled.positiontup:
+            # the plan doesn't depend on the values, they only need to be something the driver accepts
+            params = tuple(
+                str(params[key]) if isinstance(params[key], datetime) else params[key]
+                for key in compiled.positiontup
+            )
+        plan = [row[-1] for row in conn.exec_driver_sql(prefix + str(compiled), params)]
+        if any(_is_full_scan(dialect, line) for line in plan):
+            failures[name] = plan
+    return failures
+
+
+db_cli = AppGroup("db", help="Database schema tools.")
+
+
+@db_cli.command("upgrade")
+def upgrade_command():
+    """Applies any migrations this database is missing."""
+    upgrade(db.engine)
+    with db.engine.connect() as conn:
+        version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    click.echo(f"Database is at version {version}.")
+
+
+@db_cli.command("check-indexes")
+def check_indexes_command():
+    """Fails if any hot query falls back to a full table scan."""
+    with db.engine.connect() as conn:
+        failures = full_scans(conn)
+    for name, plan in failures.items():
+        click.echo(f"FULL SCAN  {name}")
+        for line in plan:
+            click.echo(f"    {line}")
+    if failures:
+        raise SystemExit(1)
+    click.echo(f"All {len(_hot_queries())} hot queries use an index.")
@@ -1,11 +1,44 @@
 # website/models.py
 from . import db
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask_login import UserMixin
+from sqlalchemy import event as sa_event
+
+
+# New events start with every seat available.
+def _initial_seats_remaining(context):
+    return context.get_current_parameters()["ticket_quantity"]
+
+
+# Event times are the wall-clock time at the venue, as the organiser typed them in, with no
+# timezone. Anything deciding whether an event has started (upcoming lists, counts, lead time)
+# compares against this clock. Bookings, jobs and the rest of the bookkeeping use UTC - those
+# are only ever compared with each other.
+def local_now():
+    return datetime.now()
+
+
+# How long an event without a duration is taken to last (venue bookings, calendar entries)
+DEFAULT_DURATION = timedelta(hours=2)
+
+
+def event_end(start, duration_minutes):
+    if start is None:
+        return None
+    return start + (timedelta(minutes=duration_minutes) if duration_minutes else DEFAULT_DURATION)
+
+
+# Also covers the Core inserts of bulk imports, which don't go through the ORM events below
+def _initial_ends_at(context):
+    params = context.get_current_parameters()
+    return event_end(params.get("date_time"), params.get("duration_minutes"))
 
 # User Table Structure 
 class User(db.Model, UserMixin):
     __tablename__ = "user"
+    __table_args__ = (
+        db.Index("ix_user_name", "name"),  # login looks users up by name
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -49,18 +82,38 @@ class Venue(db.Model):
 # Event Model 
 class Event(db.Model):
     __tablename__ = "event"
+    # Indexes match how the pages list events: by date (home page, with id to break ties for
+    # paging), by genre then date (filter buttons and the feed), by owner then date (My Events)
+    # and by venue then date (the feed's venue filter and `flask venues conflicts`).
+    __table_args__ = (
+        db.Index("ix_event_date_time", "date_time", "id"),
+        db.Index("ix_event_category_date_time", "category", "date_time", "id"),
+        db.Index("ix_event_owner_date_time", "owner_id", "date_time", "id"),
+        db.Index("ix_event_venue_date_time", "venue_id", "date_time", "id"),
+        # Finding events at a venue that overlap a time slot (schedule.py)
+        db.Index("ix_event_venue_ends_at", "venue_id", "ends_at", "date_time"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
-    date_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_time = db.Column(db.DateTime, nullable=False, default=local_now)
     image = db.Column(db.String(255))
     status = db.Column(db.String(20), nullable=False, default="Open")
     duration_minutes = db.Column(db.Integer)
+    # When the venue is free again - date_time + duration, kept up to date on every save
+    ends_at = db.Column(db.DateTime, default=_initial_ends_at)
 
     ticket_price = db.Column(db.Integer, nullable=False)
     ticket_quantity = db.Column(db.Integer, nullable=False)
 
+    # Seat counters kept up to date by reserve_seats(), so we never have to add up the bookings.
+    seats_sold = db.Column(db.Integer, nullable=False, default=0)
+    seats_remaining = db.Column(db.Integer, nullable=False, default=_initial_seats_remaining)
+
+    # Kept up to date by count_comments(), so list pages can show it without loading comments.
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+
     owner_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     category = db.Column(db.String(120), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey("venue.id"), nullable=False)
@@ -74,27 +127,80 @@ class Event(db.Model):
 
     # This method returns how many tickets are left.
     def tickets_left(self):
-        booked = sum(b.no_of_tickets for b in self.bookings if b.booking_status == "Confirmed")
-        remaining = self.ticket_quantity - booked
-        return max(remaining, 0)
-    
-    # This method updates the event status based on remaining tickets.
-    def update_status(self):
-        remaining = self.tickets_left()
-        new_status = "Sold Out" if remaining == 0 else "Open"
-        if self.status != new_status:
-            self.status = new_status
-            db.session.commit()
+        return max(self.seats_remaining or 0, 0)
+
+    # Takes seats with one conditional UPDATE, so two buyers can never both get the last seats.
+    # Returns False when there are not enough seats left. Runs inside the caller's transaction.
+    def reserve_seats(self, quantity):
+        result = db.session.execute(
+            db.update(Event)
+            .where(Event.id == self.id, Event.seats_remaining >= quantity)
+            .values(
+                seats_sold=Event.seats_sold + quantity,
+                seats_remaining=Event.seats_remaining - quantity,
+                status=db.case((Event.seats_remaining == quantity, "Sold Out"), else_=Event.status),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.expire(self, ["seats_sold", "seats_remaining", "status"])
+        return result.rowcount == 1
+
+    # Gives seats back (expired or cancelled holds). Reopens the event if it had sold out.
+    # Takes the id so the hold sweeper can release seats without loading every event.
+    @classmethod
+    def release_seats(cls, event_id, quantity):
+        db.session.execute(
+            db.update(Event)
+            .where(Event.id == event_id)
+            .values(
+                seats_sold=Event.seats_sold - quantity,
+                seats_remaining=Event.seats_remaining + quantity,
+                status=db.case((Event.status == "Sold Out", "Open"), else_=Event.status),
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    # Adds `change` (1 for a new comment, -1 for a deleted one) to comment_count with one UPDATE,
+    # so two people commenting at once both get counted. Runs inside the caller's transaction.
+    @classmethod
+    def count_comments(cls, event_id, change):
+        db.session.execute(
+            db.update(Event)
+            .where(Event.id == event_id)
+            .values(comment_count=Event.comment_count + change)
+            .execution_options(synchronize_session=False)
+        )
+
+    # Changing the capacity has to keep the counters (and Open / Sold Out) in step with seats
+    # already sold. This and the seat methods above are the only places the status changes, so
+    # reading an event never has to write anything.
+    def set_ticket_quantity(self, quantity):
+        self.ticket_quantity = quantity
+        self.seats_remaining = db.case(
+            (Event.seats_sold >= quantity, 0), else_=quantity - Event.seats_sold
+        )
+        if self.status != "Cancelled":
+            self.status = db.case((Event.seats_sold >= quantity, "Sold Out"), else_="Open")
 
 
     def __repr__(self):
         return f"<Event {self.id}:{self.title}>"
 
 
+@sa_event.listens_for(Event, "before_insert")
+@sa_event.listens_for(Event, "before_update")
+def _set_ends_at(mapper, connection, target):
+    if target.date_time is not None:
+        target.ends_at = event_end(target.date_time, target.duration_minutes)
+
+
 
 # Comments Model 
 class Comment(db.Model):
     __tablename__ = "comment"
+    __table_args__ = (
+        db.Index("ix_comment_event_posted", "event_id", "posted_date"),  # newest comments on an event
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     comment = db.Column(db.Text, nullable=False)
@@ -112,12 +218,20 @@ class Comment(db.Model):
 # Bookings Model
 class Booking(db.Model):
     __tablename__ = "booking"
+    __table_args__ = (
+        db.Index("ix_booking_user", "user_id", "id"),  # booking history, newest first
+        db.Index("ix_booking_event_status", "event_id", "booking_status"),
+        db.Index("ix_booking_status_expires", "booking_status", "expires_at"),  # hold sweeper
+        db.Index("ix_booking_status_date", "booking_status", "booking_date"),  # sales reports
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     booking_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     no_of_tickets = db.Column(db.Integer, nullable=False)
     total_price = db.Column(db.Integer, nullable=False)
     booking_status = db.Column(db.String(20), nullable=False, default="Pending")
+    # Pending bookings hold their seats until this time, then the sweeper releases them.
+    expires_at = db.Column(db.DateTime)
 
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     event_id = db.Column(db.Integer, db.ForeignKey("event.id"), nullable=False)
@@ -146,3 +260,64 @@ class Ticket(db.Model):
 
     def __repr__(self):
         return f"<Ticket {self.id} price={self.price} qty={self.quantity}>"
+
+
+# Confirmed sales per event per day, rolled up from the bookings by reports.refresh_rollup() so the
+# sales reports don't have to add up every booking ever made. Only whole days that are over
+# are rolled up; anything newer is still added up live (see reports.py).
+class DailySales(db.Model):
+    __tablename__ = "daily_sales"
+
+    day = db.Column(db.Date, primary_key=True)
+    event_id = db.Column(db.Integer, primary_key=True)
+    bookings = db.Column(db.Integer, nullable=False)
+    tickets = db.Column(db.Integer, nullable=False)
+    revenue = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<DailySales {self.day} event={self.event_id}>"
+
+
+# Upcoming events per genre per venue, for the genre buttons and the venues page (see counts.py).
+# Holds the events starting at or after event_count_mark.counted_from. Events that have started
+# since then are taken off when the counts are read, and for good when the mark moves up.
+class EventCount(db.Model):
+    __tablename__ = "event_count"
+
+    category = db.Column(db.String(120), primary_key=True)
+    venue_id = db.Column(db.Integer, primary_key=True)
+    upcoming = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<EventCount {self.category} venue={self.venue_id}: {self.upcoming}>"
+
+
+# A single row: when event_count was last brought up to date.
+class EventCountMark(db.Model):
+    __tablename__ = "event_count_mark"
+
+    id = db.Column(db.Integer, primary_key=True)
+    counted_from = db.Column(db.DateTime, nullable=False)
+
+
+# Background jobs waiting to run, running, or finished (see jobs.py).
+class Job(db.Model):
+    __tablename__ = "job"
+    __table_args__ = (
+        # The next jobs due. For running jobs run_at is when their lease runs out, so a job whose
+        # worker died is due again then; for finished ones it's when they finished.
+        db.Index("ix_job_status_run_at", "status", "run_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default="{}")  # keyword arguments, as JSON
+    key = db.Column(db.String(200), unique=True)  # idempotency key, at most one job per key
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.name} {self.status}>"
@@ -0,0 +1,102 @@
+# website/pagination.py
+# Keyset ("cursor") pagination for the listing pages. Instead of OFFSET, each page asks for the
+# rows that come after the last row of the previous page, so page 500 costs the same as page 1.
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app, request, url_for
+
+from . import db
+
+
+class Page:
+    """One page of results plus the token for the page after it (None on the last page)."""
+
+    def __init__(self, items, next_after):
+        self.items = items
+        self.next_after = next_after
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+# Biggest value an integer column holds (SQLite and Postgres BIGINT are 64-bit)
+MAX_INT = 2 ** 63 - 1
+
+
+def _encode(values):
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def _value(column, value):
+    kind = column.type.python_type
+    if kind is datetime:
+        return datetime.fromisoformat(value)
+    if kind is int:
+        # JSON also has 1.5, true, 1e400 (infinity) and numbers with any number of digits -
+        # only a whole number the database can store is a real id
+        if type(value) is not int or not -MAX_INT <= value <= MAX_INT:
+            raise ValueError(value)
+        return value
+    return kind(value)
+
+
+def _decode(token, columns):
+    """Turns an ?after= token back into column values. Returns None if it is not valid.
+    Tokens come from the URL, so anyone can send anything here."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        return [_value(col, v) for col, v in zip(columns, values)]
+    except (ValueError, TypeError, OverflowError, RecursionError):
+        return None
+
+
+def after_filter(stmt, columns, after, descending=False):
+    """Limits stmt to the rows that come after an ?after= token. An invalid token is ignored."""
+    values = _decode(after, columns) if after else None
+    if values is None:
+        return stmt
+    key = db.tuple_(*columns)
+    return stmt.where(key < db.tuple_(*values) if descending else key > db.tuple_(*values))
+
+
+def after_token(values):
+    """The ?after= token for the page that starts after a row with these column values."""
+    return _encode(values)
+
+
+def paginate(stmt, columns, after=None, size=None, descending=False):
+    """Runs stmt one page at a time, ordered by `columns` (the last one must be unique).
+
+    `after` is the token from the previous page's next_after.
+    """
+    size = size or current_app.config["PAGE_SIZE"]
+    stmt = after_filter(stmt, columns, after, descending)
+
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = db.session.scalars(stmt.order_by(*order).limit(size + 1)).unique().all()
+
+    next_after = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_after = _encode([getattr(rows[-1], c.key) for c in columns])
+    return Page(rows, next_after)
+
+
+def page_url(after, arg="after", _anchor=None):
+    """URL of the current page with ?after= swapped for the given token (used in templates).
+
+    Pages with more than one list use a different `arg` for each.
+    """
+    args = request.args.to_dict()
+    args.pop(arg, None)
+    if after:
+        args[arg] = after
+    return url_for(request.endpoint, **(request.view_args or {}), **args, _anchor=_anchor)
@@ -0,0 +1,82 @@
+# website/passwords.py
+# Password hashing. bcrypt is slow on purpose (about 0.25s at cost 12), so a burst of login
+# attempts used to keep every worker busy hashing and the whole site stopped answering.
+#
+# Checking a password now goes through a small, bounded pool of threads (bcrypt lets go of the
+# GIL while it hashes, so threads are enough):
+#   - at most PASSWORD_HASH_WORKERS hashes run at the same time in each worker process,
+#   - at most PASSWORD_HASH_QUEUE more may wait for a turn,
+#   - anything beyond that is refused at once with PasswordCheckBusy rather than piling up.
+# The other threads of the worker carry on serving pages in the meantime.
+#
+# The cost is BCRYPT_LOG_ROUNDS. When it is changed, old hashes keep working and each user's
+# hash is redone at the new cost the next time they log in (see needs_rehash).
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import bcrypt
+
+
+class PasswordCheckBusy(Exception):
+    """Too many password checks already running or waiting - try again in a moment."""
+
+
+def _as_bytes(value):
+    return value.encode() if isinstance(value, str) else value
+
+
+def hash_cost(password_hash):
+    """The cost a bcrypt hash was made with ("$2b$12$..." -> 12)."""
+    return int(_as_bytes(password_hash).split(b"$")[2])
+
+
+class PasswordHasher:
+    def __init__(self):
+        self.rounds = 12
+        self.timeout = 10
+        self._pool = None
+        self._slots = None
+
+    def init_app(self, app):
+        app.config.setdefault("BCRYPT_LOG_ROUNDS", 12)
+        app.config.setdefault("PASSWORD_HASH_WORKERS", 2)
+        app.config.setdefault("PASSWORD_HASH_QUEUE", 8)
+        app.config.setdefault("PASSWORD_HASH_TIMEOUT", 10)  # seconds a login waits at most
+
+        self.rounds = app.config["BCRYPT_LOG_ROUNDS"]
+        self.timeout = app.config["PASSWORD_HASH_TIMEOUT"]
+        workers = app.config["PASSWORD_HASH_WORKERS"]
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(workers + app.config["PASSWORD_HASH_QUEUE"])
+        app.extensions["password_hasher"] = self
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordCheckBusy()
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Still in the queue: take it out. Already hashing: it finishes and frees its slot.
+            future.cancel()
+            raise PasswordCheckBusy()
+
+    def hash(self, password):
+        """A new hash at the configured cost (a str, ready for User.password_hash)."""
+        hashed = self._run(bcrypt.hashpw, password.encode(), bcrypt.gensalt(self.rounds))
+        return hashed.decode()
+
+    def check(self, password_hash, password):
+        return self._run(bcrypt.checkpw, password.encode(), _as_bytes(password_hash))
+
+    def needs_rehash(self, password_hash):
+        return hash_cost(password_hash) != self.rounds
+
+
+password_hasher = PasswordHasher()
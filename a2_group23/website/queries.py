@@ -0,0 +1,79 @@
+# website/queries.py
+# Shared queries for the list pages. Each one loads exactly the relationships its template
+# uses, so rendering a page doesn't fire one extra query per row (the "N+1" problem).
+from contextlib import contextmanager
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import joinedload
+
+from . import db
+from .models import Booking, Comment, Event
+
+
+# Home / filter / search cards only show columns from the event row itself.
+def event_cards():
+    return db.select(Event)
+
+
+# My Events / All Events table shows the venue name on each row.
+def events_with_venue():
+    return db.select(Event).options(joinedload(Event.venue))
+
+
+# Booking history cards show the event and its venue for every booking.
+def bookings_with_event():
+    return db.select(Booking).options(joinedload(Booking.event).joinedload(Event.venue))
+
+
+# Event page shows the venue and the organiser.
+def event_detail(event_id):
+    return (
+        db.select(Event)
+        .where(Event.id == event_id)
+        .options(joinedload(Event.venue), joinedload(Event.owner))
+    )
+
+
+# Comments under an event, each with its author's name. Paged newest first by the view.
+def event_comments(event_id):
+    return db.select(Comment).where(Comment.event_id == event_id).options(joinedload(Comment.author))
+
+
+class QueryLog:
+    """The SQL statements run inside count_queries()."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __len__(self):
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Records every statement sent to the database while the block runs."""
+    engine = engine or db.engine
+    log = QueryLog()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        log.statements.append(statement)
+
+    sa_event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield log
+    finally:
+        sa_event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """Fails if the block runs more than `limit` SQL statements, e.g.
+
+        with assert_max_queries(4):
+            client.get("/my-bookings")
+    """
+    with count_queries(engine) as log:
+        yield log
+    if len(log) > limit:
+        listing = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(log.statements, 1))
+        raise AssertionError(f"Expected at most {limit} queries, ran {len(log)}:\n{listing}")
@@ -0,0 +1,100 @@
+# website/ratelimit.py
+# Token buckets for slowing down password guessing. Every key (an IP address, a user name) has
+# a bucket holding up to `burst` tokens that refills at `per_minute` tokens a minute. Each login
+# attempt takes a token, and when the bucket is empty the attempt is turned away straight
+# away - before any password hashing, which is the expensive part.
+#
+# The buckets live in this process by default (LOGIN_LIMIT_BACKEND = "memory"). With several
+# gunicorn workers each one then has its own buckets, so the real limit is workers x burst.
+# Set it to "redis" to share them between workers and machines.
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBuckets:
+    """Buckets in a dict. Safe to share between threads. Old buckets are dropped when there are
+    more than `max_keys`, so a flood of made-up user names can't eat the memory."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last update)
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, per_minute):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * per_minute / 60)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Same arithmetic as MemoryBuckets.take, run inside Redis so it is atomic across processes
+_TAKE_SCRIPT = """
+local burst, per_minute = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')  -- Redis' own clock, so workers on different machines agree
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens, updated = tonumber(bucket[1]) or burst, tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * per_minute / 60)
+local allowed = tokens >= 1
+if allowed then tokens = tokens - 1 end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst * 60 / per_minute) + 1)
+return allowed and 1 or 0
+"""
+
+
+class RedisBuckets:
+    """Buckets in Redis, shared by every worker. `client` is a redis.Redis instance."""
+
+    def __init__(self, client, prefix="firevents:bucket:"):
+        self.prefix = prefix
+        self._take = client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key, burst, per_minute):
+        return bool(self._take(keys=[self.prefix + key], args=[burst, per_minute]))
+
+
+class LoginLimiter:
+    def __init__(self):
+        self.backend = None
+        self.limits = {}
+
+    def init_app(self, app):
+        app.config.setdefault("LOGIN_LIMIT_BACKEND", "memory")  # "memory", "redis" or "none"
+        app.config.setdefault("LOGIN_LIMIT_REDIS_URL", app.config.get("CACHE_REDIS_URL", "redis://localhost:6379/0"))
+        app.config.setdefault("LOGIN_LIMIT_PER_IP", (20, 10))  # (burst, refills per minute)
+        app.config.setdefault("LOGIN_LIMIT_PER_USER", (5, 2))
+
+        backend = app.config["LOGIN_LIMIT_BACKEND"]
+        if backend == "redis":
+            import redis  # only needed when the Redis backend is switched on
+            self.backend = RedisBuckets(redis.Redis.from_url(app.config["LOGIN_LIMIT_REDIS_URL"]))
+        elif backend == "memory":
+            self.backend = MemoryBuckets()
+        else:
+            self.backend = None
+        self.limits = {"ip": app.config["LOGIN_LIMIT_PER_IP"], "user": app.config["LOGIN_LIMIT_PER_USER"]}
+        app.extensions["login_limiter"] = self
+
+    def allow(self, ip, user_name):
+        """Takes a token from the IP's and the user name's bucket. False if either is empty."""
+        if self.backend is None:
+            return True
+        # Both buckets are always charged, so guessing at many names from one address and at
+        # one name from many addresses are both slowed down.
+        ip_ok = self.backend.take(f"ip:{ip}", *self.limits["ip"])
+        user_ok = self.backend.take(f"user:{user_name.strip().lower()}", *self.limits["user"])
+        return ip_ok and user_ok
+
+
+login_limiter = LoginLimiter()
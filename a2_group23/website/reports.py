@@ -0,0 +1,221 @@
+# website/reports.py
+# Sales reports: revenue, tickets and bookings per event, venue, genre and day. Organisers see
+# their own events, admins see everything.
+#   /reports                 - the four summaries
+#   /reports/<by>.csv        - one full report as a CSV download (by = event, venue, category, day)
+#   flask reports show --by venue [--csv]
+#   flask reports refresh    - roll finished days up into daily_sales (run it from cron, nightly)
+#
+# Everything is added up in the database with GROUP BY, never by looping over bookings in
+# Python. To keep that fast with millions of bookings, finished days are rolled up into the
+# daily_sales table (one row per event per day). A report reads the rolled-up days from there
+# and only adds up the raw bookings for the days after, so it is always up to date even if the
+# rollup hasn't run for a while.
+import csv
+import io
+from datetime import date, datetime, time, timedelta
+
+import click
+from flask import Blueprint, Response, abort, current_app, render_template, request, stream_with_context
+from flask_login import current_user, login_required
+
+from . import db
+from .models import Booking, DailySales, Event, User, Venue
+
+reports_bp = Blueprint("reports", __name__, url_prefix="/reports")
+
+REPORTS = ["event", "venue", "category", "day"]
+SUMMARY_ROWS = 50  # rows per table on the page, the CSV has all of them
+
+
+# -- daily rollup --
+
+def _rolled_until():
+    """First day that isn't in daily_sales yet (None if nothing has been rolled up)."""
+    last = db.session.scalar(db.select(db.func.max(DailySales.day)))
+    return last + timedelta(days=1) if last else None
+
+
+def _closed_until(now=None):
+    """First day that can't be rolled up yet. A booking can still be confirmed until its hold
+    runs out, so a day is only final HOLD_MINUTES after midnight."""
+    now = now or datetime.utcnow()
+    return (now - timedelta(minutes=current_app.config["HOLD_MINUTES"])).date()
+
+
+def _booking_day():
+    return db.func.date(Booking.booking_date, type_=db.Date)
+
+
+def _live_sales():
+    day = _booking_day().label("day")
+    return (
+        db.select(
+            day, Booking.event_id,
+            db.func.count().label("bookings"),
+            db.func.sum(Booking.no_of_tickets).label("tickets"),
+            db.func.sum(Booking.total_price).label("revenue"),
+        )
+        .where(Booking.booking_status == "Confirmed")
+        .group_by(day, Booking.event_id)
+    )
+
+
+def refresh_rollup(now=None):
+    """Adds the finished days since the last refresh to daily_sales. Returns the rows added."""
+    start, end = _rolled_until(), _closed_until(now)
+    if start is not None and start >= end:
+        return 0
+
+    stmt = _live_sales().where(Booking.booking_date < datetime.combine(end, time.min))
+    if start is not None:
+        stmt = stmt.where(Booking.booking_date >= datetime.combine(start, time.min))
+    columns = ["day", "event_id", "bookings", "tickets", "revenue"]
+    result = db.session.execute(db.insert(DailySales).from_select(columns, stmt))
+    db.session.commit()
+    return result.rowcount
+
+
+# -- reports --
+
+def _sales(start=None, end=None):
+    """(day, event_id, bookings, tickets, revenue) for every day with sales between start and
+    end (inclusive): rolled-up days from daily_sales, plus the raw bookings after them."""
+    rolled_until = _rolled_until()
+
+    live = _live_sales()
+    live_from = max(filter(None, [start, rolled_until]), default=None)
+    if live_from:
+        live = live.where(Booking.booking_date >= datetime.combine(live_from, time.min))
+    if end:
+        live = live.where(Booking.booking_date < datetime.combine(end + timedelta(days=1), time.min))
+    if rolled_until is None:
+        return live.subquery("sales")
+
+    rolled = db.select(
+        DailySales.day, DailySales.event_id, DailySales.bookings, DailySales.tickets, DailySales.revenue
+    )
+    if start:
+        rolled = rolled.where(DailySales.day >= start)
+    if end:
+        rolled = rolled.where(DailySales.day <= end)
+    return db.union_all(rolled, live).subquery("sales")
+
+
+def report_query(by, owner_id=None, start=None, end=None):
+    """One report as a select. `owner_id` limits it to one organiser's events."""
+    sales = _sales(start, end)
+    keys = {
+        "event": [Event.id.label("event_id"), Event.title.label("event"), Event.date_time.label("date")],
+        "venue": [Venue.id.label("venue_id"), Venue.name.label("venue")],
+        "category": [Event.category.label("category")],
+        "day": [sales.c.day.label("day")],
+    }[by]
+    revenue = db.func.sum(sales.c.revenue).label("revenue")
+    stmt = (
+        db.select(
+            *keys,
+            db.func.sum(sales.c.bookings).label("bookings"),
+            db.func.sum(sales.c.tickets).label("tickets"),
+            revenue,
+        )
+        .select_from(sales)
+        .join(Event, Event.id == sales.c.event_id)
+        .join(Venue, Venue.id == Event.venue_id)
+        .group_by(*keys)
+        # Days in date order, everything else best seller first
+        .order_by(sales.c.day.desc() if by == "day" else revenue.desc())
+    )
+    if owner_id is not None:
+        stmt = stmt.where(Event.owner_id == owner_id)
+    return stmt
+
+
+def _date_arg(name):
+    try:
+        return date.fromisoformat(request.args[name]) if request.args.get(name) else None
+    except ValueError:
+        abort(400)
+
+
+def _owner_filter():
+    # Admins see every event's sales, organisers only their own
+    return None if current_user.role == "admin" else current_user.id
+
+
+@reports_bp.route("/")
+@login_required
+def index():
+    start, end = _date_arg("from"), _date_arg("to")
+    owner_id = _owner_filter()
+    tables = {
+        by: db.session.execute(report_query(by, owner_id, start, end).limit(SUMMARY_ROWS)).all()
+        for by in REPORTS
+    }
+    # Grand totals, from the per-genre report (there are only a handful of genres)
+    by_category = report_query("category", owner_id, start, end).subquery()
+    totals = db.session.execute(db.select(
+        *[db.func.coalesce(db.func.sum(by_category.c[name]), 0) for name in ("bookings", "tickets", "revenue")]
+    )).one()
+    return render_template("reports.html", tables=tables, totals=totals, start=start, end=end,
+                           summary_rows=SUMMARY_ROWS)
+
+
+def _csv_lines(stmt):
+    # One line at a time, so a report with a row per event never sits in memory whole
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    result = db.session.execute(stmt.execution_options(yield_per=1000))
+    writer.writerow(result.keys())
+    for row in result:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+@reports_bp.route("/<by>.csv")
+@login_required
+def download(by):
+    if by not in REPORTS:
+        abort(404)
+    stmt = report_query(by, _owner_filter(), _date_arg("from"), _date_arg("to"))
+    return Response(
+        stream_with_context(_csv_lines(stmt)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=sales-by-{by}.csv"},
+    )
+
+
+# flask reports show / refresh
+@reports_bp.cli.command("show")
+@click.option("--by", type=click.Choice(REPORTS), default="event", show_default=True)
+@click.option("--owner", "owner_email", help="Only this organiser's events.")
+@click.option("--from", "start", type=click.DateTime(["%Y-%m-%d"]), help="First day (YYYY-MM-DD).")
+@click.option("--to", "end", type=click.DateTime(["%Y-%m-%d"]), help="Last day (YYYY-MM-DD).")
+@click.option("--csv", "as_csv", is_flag=True, help="Write CSV instead of a table.")
+def show_command(by, owner_email, start, end, as_csv):
+    """Prints a sales report."""
+    owner_id = None
+    if owner_email:
+        owner_id = db.session.scalar(db.select(User.id).where(User.email == owner_email))
+        if owner_id is None:
+            raise click.ClickException(f"No user with email {owner_email}.")
+    stmt = report_query(by, owner_id, start and start.date(), end and end.date())
+
+    if as_csv:
+        for line in _csv_lines(stmt):
+            click.echo(line, nl=False)
+        return
+    result = db.session.execute(stmt)
+    click.echo("  ".join(f"{key:>12}" for key in result.keys()))
+    for row in result:
+        click.echo("  ".join(f"{str(value)[:12]:>12}" for value in row))
+
+
+@reports_bp.cli.command("refresh")
+def refresh_command():
+    """Rolls finished days up into daily_sales."""
+    added = refresh_rollup()
+    click.echo(f"Added {added} daily sales rows.")
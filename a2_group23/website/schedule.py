@@ -0,0 +1,138 @@
+# website/schedule.py
+# Stops two events being booked into the same venue at the same time. An event takes up its
+# venue from date_time until ends_at (date_time + duration, see models.py). Cancelled events
+# don't count.
+#
+#   overlapping_events()    - one time slot, checked with the (venue_id, ends_at, date_time)
+#                             index: only events at that venue that end after the slot starts
+#                             are looked at, not the venue's whole history
+#   VenueCalendar           - the same check in memory, for a bulk import of many events
+#   find_conflicts()        - every overlap already in the database, in one sorted sweep
+#   flask venues conflicts  - prints them
+#
+# The create and edit views check first and insert after, with nothing locking the venue in
+# between, so two organisers saving clashing events at the same moment can both get through.
+# That's rare enough for a venue's calendar that we accept it instead of serialising every
+# event write - `flask venues conflicts` finds any that slip past.
+import heapq
+from bisect import bisect_left
+
+import click
+
+from . import db
+from .models import Event, Venue, local_now
+
+
+def _booked():
+    return Event.status != "Cancelled"
+
+
+def overlapping_events(venue_id, start, end, exclude_id=None, limit=3):
+    """Events at the venue that overlap start-end (at most `limit` of them)."""
+    stmt = db.select(Event.id, Event.title, Event.date_time, Event.ends_at).where(
+        Event.venue_id == venue_id, Event.ends_at > start, Event.date_time < end, _booked()
+    )
+    if exclude_id is not None:
+        stmt = stmt.where(Event.id != exclude_id)
+    return db.session.execute(stmt.order_by(Event.ends_at).limit(limit)).all()
+
+
+def describe_overlap(row):
+    return f'"{row.title}" already has the venue from {row.date_time:%d %b %Y %H:%M} to {row.ends_at:%d %b %H:%M}'
+
+
+class VenueCalendar:
+    """Venue bookings in memory, so a whole import file is checked without a query per row -
+    against the database and against the rows before it. A venue's events are loaded the first
+    time it comes up, and only those still running after `since`."""
+
+    def __init__(self, since):
+        self.since = since
+        self._venues = {}  # venue id -> [starts, bookings, longest], bookings sorted by start
+
+    def _venue(self, venue_id):
+        if venue_id not in self._venues:
+            bookings = db.session.execute(
+                db.select(Event.date_time, Event.ends_at, Event.title)
+                .where(Event.venue_id == venue_id, Event.ends_at > self.since, _booked())
+                .order_by(Event.date_time)
+            ).all()
+            longest = max((b.ends_at - b.date_time for b in bookings), default=None)
+            self._venues[venue_id] = [[b.date_time for b in bookings], list(bookings), longest]
+        return self._venues[venue_id]
+
+    def find(self, venue_id, start, end):
+        """A booking that overlaps start-end, or None."""
+        starts, bookings, longest = self._venue(venue_id)
+        # Only bookings that start before `end` can overlap, and none lasts longer than
+        # `longest`, so we walk back from there until they can't reach `start` any more
+        i = bisect_left(starts, end) - 1
+        while i >= 0 and starts[i] + longest > start:
+            if bookings[i].ends_at > start:
+                return bookings[i]
+            i -= 1
+        return None
+
+    def add(self, venue_id, start, end, title):
+        venue = self._venue(venue_id)
+        row = _Booking(start, end, title)
+        i = bisect_left(venue[0], start)
+        venue[0].insert(i, start)
+        venue[1].insert(i, row)
+        venue[2] = max(venue[2], end - start) if venue[2] is not None else end - start
+
+
+class _Booking:
+    __slots__ = ("date_time", "ends_at", "title")
+
+    def __init__(self, date_time, ends_at, title):
+        self.date_time = date_time
+        self.ends_at = ends_at
+        self.title = title
+
+
+def find_conflicts(since=None):
+    """Yields (earlier, later) for every pair of events that overlap at the same venue.
+
+    One pass over the events in venue and start order (the order of ix_event_venue_date_time),
+    holding the events still running in a heap by end time - O(n log n) plus one step per pair.
+    """
+    stmt = (
+        db.select(Event.id, Event.title, Event.venue_id, Event.date_time, Event.ends_at)
+        .where(_booked())
+        .order_by(Event.venue_id, Event.date_time, Event.id)
+        .execution_options(yield_per=2000)
+    )
+    if since is not None:
+        stmt = stmt.where(Event.ends_at > since)
+
+    venue_id = None
+    running = []  # (ends_at, id, row) of the current venue's events that haven't ended yet
+    for row in db.session.execute(stmt):
+        if row.venue_id != venue_id:
+            venue_id = row.venue_id
+            running.clear()
+        while running and running[0][0] <= row.date_time:
+            heapq.heappop(running)
+        for _, _, earlier in sorted(running, key=lambda item: item[2].date_time):
+            yield earlier, row
+        heapq.heappush(running, (row.ends_at, row.id, row))
+
+
+# flask venues conflicts (added to the venues group in __init__.py)
+@click.command("conflicts")
+@click.option("--upcoming", is_flag=True, help="Only events that haven't finished yet.")
+def conflicts_command(upcoming):
+    """Lists events that overlap at the same venue."""
+    venues = {row.id: row.name for row in db.session.execute(db.select(Venue.id, Venue.name))}
+    count = 0
+    for earlier, later in find_conflicts(local_now() if upcoming else None):
+        count += 1
+        click.echo(
+            f"{venues.get(later.venue_id, later.venue_id)}: "
+            f"#{earlier.id} {earlier.title} ({earlier.date_time:%Y-%m-%d %H:%M} - {earlier.ends_at:%H:%M}) "
+            f"overlaps #{later.id} {later.title} ({later.date_time:%Y-%m-%d %H:%M} - {later.ends_at:%H:%M})"
+        )
+    click.echo(f"{count} overlapping pair{'s' if count != 1 else ''}.")
+    if count:
+        raise SystemExit(1)
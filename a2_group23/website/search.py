@@ -0,0 +1,180 @@
+# website/search.py
+# Full-text search for events. On SQLite this is an FTS5 table (event_fts) over the event title,
+# description, category and venue name, kept in sync by triggers so every insert/update/delete
+# (including bulk SQL) is indexed. On Postgres the same search_events() uses a tsvector GIN index.
+import re
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from . import db
+from .models import Event
+from .pagination import MAX_INT, Page
+
+# Title matches count the most, then venue, then category, then description.
+# The order follows the FTS5 columns: title, description, category, venue.
+BM25_WEIGHTS = "10.0, 1.0, 2.0, 4.0"
+
+_FTS_SELECT = (
+    "SELECT e.id, e.title, e.description, e.category, COALESCE(v.name, '')"
+    " FROM event e LEFT JOIN venue v ON v.id = e.venue_id"
+)
+
+_SQLITE_SCHEMA = [
+    # prefix='2 3' keeps extra indexes for short prefixes so "ja*" style queries stay fast
+    "CREATE VIRTUAL TABLE IF NOT EXISTS event_fts USING fts5("
+    " title, description, category, venue,"
+    " tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+
+    "CREATE TRIGGER IF NOT EXISTS event_fts_insert AFTER INSERT ON event BEGIN"
+    " INSERT INTO event_fts (rowid, title, description, category, venue)"
+    " VALUES (new.id, new.title, new.description, new.category,"
+    " COALESCE((SELECT name FROM venue WHERE id = new.venue_id), ''));"
+    " END",
+
+    # Only fires for the searchable columns, so seat counter updates never touch the index.
+    "CREATE TRIGGER IF NOT EXISTS event_fts_update"
+    " AFTER UPDATE OF title, description, category, venue_id ON event BEGIN"
+    " DELETE FROM event_fts WHERE rowid = old.id;"
+    " INSERT INTO event_fts (rowid, title, description, category, venue)"
+    " VALUES (new.id, new.title, new.description, new.category,"
+    " COALESCE((SELECT name FROM venue WHERE id = new.venue_id), ''));"
+    " END",
+
+    "CREATE TRIGGER IF NOT EXISTS event_fts_delete AFTER DELETE ON event BEGIN"
+    " DELETE FROM event_fts WHERE rowid = old.id;"
+    " END",
+
+    "CREATE TRIGGER IF NOT EXISTS venue_fts_rename AFTER UPDATE OF name ON venue BEGIN"
+    " UPDATE event_fts SET venue = new.name"
+    " WHERE rowid IN (SELECT id FROM event WHERE venue_id = new.id);"
+    " END",
+]
+
+# Postgres can't index across the venue join, so there the venue name isn't searchable.
+_PG_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||"
+    " setweight(to_tsvector('simple', coalesce(category, '')), 'B') ||"
+    " setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+
+def install(conn):
+    """Creates the search index for this database. Safe to run more than once.
+
+    Returns False if this database can't have one.
+    """
+    if conn.dialect.name == "sqlite":
+        try:
+            for statement in _SQLITE_SCHEMA:
+                conn.execute(text(statement))
+        except OperationalError:
+            # SQLite built without FTS5 - search_events() falls back to LIKE.
+            return False
+        return True
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_event_search ON event USING gin (({_PG_DOCUMENT}))"))
+        return True
+    return False
+
+
+def rebuild(conn):
+    """Re-indexes every event from scratch (SQLite only - the Postgres index maintains itself)."""
+    if conn.dialect.name != "sqlite":
+        return 0
+    conn.execute(text("DELETE FROM event_fts"))
+    conn.execute(text(f"INSERT INTO event_fts (rowid, title, description, category, venue) {_FTS_SELECT}"))
+    return conn.execute(text("SELECT COUNT(*) FROM event_fts")).scalar()
+
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())
+
+
+# engine URL -> whether event_fts exists, checked once per process
+_fts_tables = {}
+
+
+def _fts_available():
+    url = str(db.engine.url)
+    if url not in _fts_tables:
+        _fts_tables[url] = bool(db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_fts'")
+        ).first())
+    return _fts_tables[url]
+
+
+def _ranked_ids(terms, offset, limit):
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == "postgresql":
+        # every word has to match, the last one may be a prefix of a longer word
+        tsquery = " & ".join(terms[:-1] + [terms[-1] + ":*"])
+        sql = (
+            f"SELECT id FROM event WHERE ({_PG_DOCUMENT}) @@ to_tsquery('simple', :q)"
+            f" ORDER BY ts_rank(({_PG_DOCUMENT}), to_tsquery('simple', :q)) DESC, id"
+            " LIMIT :limit OFFSET :offset"
+        )
+        params = {"q": tsquery}
+
+    elif dialect == "sqlite" and _fts_available():
+        # "word"* matches any word starting with it; quoting keeps FTS syntax out of user input
+        match = " ".join(f'"{t}"*' for t in terms)
+        sql = (
+            "SELECT rowid FROM event_fts WHERE event_fts MATCH :q"
+            f" ORDER BY bm25(event_fts, {BM25_WEIGHTS}), rowid"
+            " LIMIT :limit OFFSET :offset"
+        )
+        params = {"q": match}
+
+    else:
+        # no full-text index available - plain substring match, soonest first
+        conditions = " AND ".join(f"(title LIKE :t{i} OR description LIKE :t{i})" for i in range(len(terms)))
+        sql = f"SELECT id FROM event WHERE {conditions} ORDER BY date_time, id LIMIT :limit OFFSET :offset"
+        params = {f"t{i}": f"%{t}%" for i, t in enumerate(terms)}
+
+    params.update(limit=limit, offset=offset)
+    return [row[0] for row in db.session.execute(text(sql), params)]
+
+
+def search_events(query, after=None, size=None):
+    """Best matches first, one page at a time.
+
+    Ranked results can't be paged by a column value, so here the ?after= token is simply the
+    number of results already shown.
+    """
+    size = size or current_app.config["PAGE_SIZE"]
+    terms = _terms(query or "")
+    if not terms:
+        return Page([], None)
+
+    # Only plain 0-9 digits (isdigit() also takes things like "²") and no more than a database int
+    offset = int(after) if after and after.isascii() and after.isdigit() else 0
+    if offset > MAX_INT:
+        offset = 0
+    ids = _ranked_ids(terms, offset, size + 1)
+
+    next_after = None
+    if len(ids) > size:
+        ids = ids[:size]
+        next_after = str(offset + size)
+
+    events = {e.id: e for e in db.session.scalars(db.select(Event).where(Event.id.in_(ids)))}
+    return Page([events[i] for i in ids if i in events], next_after)
+
+
+# flask search rebuild
+search_cli = AppGroup("search", help="Full-text search index.")
+
+
+@search_cli.command("rebuild")
+def rebuild_command():
+    """Rebuilds the event search index."""
+    with db.engine.begin() as conn:
+        if not install(conn):
+            raise click.ClickException("This database has no full-text search support.")
+        count = rebuild(conn)
+    click.echo(f"Indexed {count} events.")
@@ -0,0 +1,146 @@
+# website/storage.py
+# Where uploaded event images are kept. Files are named after a SHA-256 of their contents
+# (e.g. 3f2a...9c.jpg), so uploading the same picture twice stores it once and two events can
+# share a file. Because of that, edit and delete never remove files themselves - another event
+# may still use it. Instead `flask images gc` does a mark-and-sweep: it marks every image an
+# event still points at and sweeps away the uploads nobody uses any more.
+#
+# A storage backend is anything with these methods (LocalStorage below keeps files on disk; an
+# object store such as S3 only needs the same six):
+#   save(stream, ext) -> name   store an upload, returns its content-addressed name
+#   exists(name) / delete(name)
+#   names()                     every stored upload name
+#   age(name)                   seconds since the file was last written or re-used
+#   path(name)                  local path for tools that need a real file (Pillow)
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+from flask import current_app
+
+from . import db
+from .models import Event
+
+CHUNK_SIZE = 64 * 1024
+
+# Content-addressed names, plus the "<8 hex>_<original name>" ones uploads used to get.
+# Anything else in the folder (logo.png, profile.png ...) belongs to the site, not to an event.
+UPLOAD_NAME = re.compile(r"^([0-9a-f]{64}\.[a-z0-9]+|[0-9a-f]{8}_.+)$")
+
+
+class LocalStorage:
+    """Uploads in a folder on disk (the static images folder, so they are served directly)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def save(self, stream, ext):
+        # Hash while copying to a temp file, so a 5MB upload is never held in memory at once
+        digest = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".upload")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    out.write(chunk)
+            name = f"{digest.hexdigest()}.{ext}"
+            if self.exists(name):
+                # Already have it. Touch it so a gc running right now doesn't sweep it before
+                # the event that re-uses it is saved.
+                os.utime(self.path(name))
+                os.remove(tmp)
+            else:
+                os.replace(tmp, self.path(name))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return name
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def names(self):
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file() and UPLOAD_NAME.match(entry.name):
+                    yield entry.name
+
+    def age(self, name):
+        return time.time() - os.path.getmtime(self.path(name))
+
+
+def image_storage():
+    return current_app.extensions["image_storage"]
+
+
+def init_app(app):
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    app.extensions["image_storage"] = LocalStorage(app.config["UPLOAD_FOLDER"])
+
+
+def _extension(filename):
+    ext = filename.rsplit(".", 1)[-1].lower()
+    return "jpg" if ext == "jpeg" else ext
+
+
+def save_upload(file_storage):
+    """Stores an uploaded image and returns its name for Event.image."""
+    return image_storage().save(file_storage.stream, _extension(file_storage.filename))
+
+
+def referenced_images():
+    """Mark phase: every image an event points at."""
+    return set(db.session.scalars(
+        db.select(Event.image).where(Event.image.is_not(None)).distinct()
+    ))
+
+
+def collect_garbage(grace_seconds=3600, dry_run=False):
+    """Sweep phase: deletes uploads no event uses, and their resized copies.
+
+    Files newer than `grace_seconds` are kept - they may belong to an event that is being
+    created right now and isn't committed yet. Returns the names that were (or would be) removed.
+    """
+    from .images import remove_variants
+
+    store = image_storage()
+    used = referenced_images()
+    orphans = [
+        name for name in store.names()
+        if name not in used and store.age(name) >= grace_seconds
+    ]
+    if not dry_run:
+        for name in orphans:
+            store.delete(name)
+            remove_variants(current_app.config["UPLOAD_FOLDER"], name)
+    return orphans
+
+
+def rehash_legacy():
+    """Moves images uploaded under the old random-prefix names to content-addressed names,
+    so identical pictures end up as one file. The old files are left for gc to sweep."""
+    store = image_storage()
+    renamed = {}
+    for name in list(store.names()):
+        if "_" not in name:  # already content-addressed
+            continue
+        with open(store.path(name), "rb") as f:
+            renamed[name] = store.save(f, _extension(name))
+
+    for old, new in renamed.items():
+        db.session.execute(db.update(Event).where(Event.image == old).values(image=new))
+    db.session.commit()
+    return renamed
+
@@ -7,47 +7,50 @@ from datetime import datetime
 from datetime import datetime
 import os, uuid, json
 
-from website.forms import EventForm
+from website.forms import EventForm, CATEGORIES
 
 from . import db
-from .models import Event, Venue, Ticket, Booking, Comment, User
+from .models import Event, Venue, Ticket, Booking, Comment, User, local_now
+from .queries import event_cards, events_with_venue, bookings_with_event
+from .pagination import paginate
+from .search import search_events
+from .cache import page_cache
+from .counts import category_counts, venue_counts, COUNTS_TAG
 
 main_bp = Blueprint('main', __name__)
 
 # Listing out all the events list that is to be displayed in thee index page.
+# Only upcoming ones - past events are still on their own pages and in the feed (feed.py).
 @main_bp.route('/')
+@page_cache.cached(lambda: ["listing:all"])
 def index():
-    events = db.session.scalars(
-        db.select(Event).order_by(Event.date_time.asc())
-    ).all()
-    return render_template("index.html", events=events)
+    query = event_cards().where(Event.date_time >= local_now())
+    events = paginate(query, [Event.date_time, Event.id], request.args.get("after"))
+    return render_template("index.html", events=events, genres=category_counts())
 
 # Search Bar - Can search based on event name or description
 @main_bp.route('/search')
 def search():
-    if request.args['search'] and request.args['search'] != "":
-        print(request.args['search'])
-        query = "%" + request.args['search'] + "%"
-        events = db.session.scalars(db.select(Event).where((Event.title.like(query)) | (Event.description.like(query)))).all()
-        return render_template('index.html', events=events)
+    if request.args.get('search', "").strip():
+        # Ranked full-text search over title, description, category and venue (see search.py)
+        events = search_events(request.args['search'], request.args.get("after"))
+        return render_template('index.html', events=events, genres=category_counts())
     else:
         return redirect(url_for('main.index'))
 
 
 # Filter Events based on their genre
 @main_bp.route('/filter-event/<category>')
+# The genre buttons show every genre's count, so the page also goes when those change
+@page_cache.cached(lambda category: [f"listing:{category.lower()}", COUNTS_TAG])
 def filter_event(category):
-    if category == "All":
-        filtered = db.session.scalars(
-            db.select(Event).order_by(Event.date_time.asc())
-        ).all()
-    else:
-        filtered = db.session.scalars(
-            db.select(Event)
-            .where(Event.category.ilike(category))
-            .order_by(Event.date_time.asc())
-        ).all()
-    return render_template('index.html', events=filtered)
+    query = event_cards().where(Event.date_time >= local_now())
+    if category != "All":
+        # Look the genre up case-insensitively here, so the query is a plain indexed equality
+        genres = {c.lower(): c for c in CATEGORIES}
+        query = query.where(Event.category == genres.get(category.lower(), category))
+    filtered = paginate(query, [Event.date_time, Event.id], request.args.get("after"))
+    return render_template('index.html', events=filtered, genres=category_counts())
 
 
 # My Bookings 
@@ -55,17 +58,11 @@ def filter_event(category):
 @login_required
 def my_bookings():
     # Admin Users can see all the bookings made by every users
-    if current_user.role == "admin":
-        bookings = db.session.scalars(
-            db.select(Booking).order_by(Booking.id.desc())
-        ).all()
-    else:
+    query = bookings_with_event()
+    if current_user.role != "admin":
         # Normal users can see onlty their own bookings.
-        bookings = db.session.scalars(
-            db.select(Booking)
-            .where(Booking.user_id == current_user.id)
-            .order_by(Booking.id.desc())
-        ).all()
+        query = query.where(Booking.user_id == current_user.id)
+    bookings = paginate(query, [Booking.id], request.args.get("after"), descending=True)
 
     return render_template('bookings.html', bookings=bookings)
 
@@ -74,17 +71,11 @@ def my_bookings():
 @login_required
 def events():
     # Admin can see all the events. 
-    if current_user.role == "admin":
-        items = db.session.scalars(
-            db.select(Event).order_by(Event.date_time.desc())
-        ).all()
-    else:
+    query = events_with_venue()
+    if current_user.role != "admin":
         # Individual users can only see events created by them
-        items = db.session.scalars(
-            db.select(Event)
-            .where(Event.owner_id == current_user.id)
-            .order_by(Event.date_time.desc())
-        ).all()
+        query = query.where(Event.owner_id == current_user.id)
+    items = paginate(query, [Event.date_time, Event.id], request.args.get("after"), descending=True)
 
     return render_template("all_events.html", events=items)
 
@@ -126,10 +117,19 @@ def venues():
 
     # GET: show existing venues
     venues = db.session.scalars(db.select(Venue).order_by(Venue.name)).all()
-    return render_template("add-venue.html", venues=venues)
+    return render_template("add-venue.html", venues=venues, upcoming=venue_counts())
 
 
 
+# Page cache hit / miss counters for this worker
+@main_bp.route("/cache-stats")
+@login_required
+def cache_stats():
+    if current_user.role != "admin":
+        abort(403)
+    return page_cache.stats()
+
+
 #error handling
 @main_bp.app_errorhandler(404)
 def not_found_error(error):